@@ -0,0 +1,42 @@
+import functools
+import string
+from nltk.stem import PorterStemmer
+
+STOP_WORDS_PATH = "data/stopwords.txt"
+
+# Surface token -> stem entries kept by each analyzer
+STEM_CACHE_SIZE = 100_000
+
+
+# Text analysis pipeline: lowercase, strip punctuation, split on whitespace,
+# drop stop words and stem. Stop words are loaded once and stems are memoized,
+# so one Analyzer should be reused for a whole build or query session.
+class Analyzer:
+    def __init__(self, stop_words_path: str = STOP_WORDS_PATH, stem_cache_size: int = STEM_CACHE_SIZE) -> None:
+        # Kept so worker processes can build an identical analyzer
+        self.stop_words_path = stop_words_path
+        with open(stop_words_path, 'r') as s:
+            self.stop_words = frozenset(s.read().splitlines())
+
+        self.__trans_table = str.maketrans("", "", string.punctuation)
+        self.__stemmer = PorterStemmer()
+        self.stem = functools.lru_cache(
+            maxsize=stem_cache_size)(self.__stemmer.stem)
+
+    def analyze(self, text: str) -> list[str]:
+        tokens = text.lower().translate(self.__trans_table).split()
+
+        stop_words = self.stop_words
+        stem = self.stem
+        return [stem(token) for token in tokens if token not in stop_words]
+
+    # Analyze a batch of texts with the same stop words and stem cache
+    def analyze_many(self, texts) -> list[list[str]]:
+        return [self.analyze(text) for text in texts]
+
+
+# Analyzer shared by process_text and the index. Created on first use so
+# importing the module doesn't need data/stopwords.txt.
+@functools.cache
+def default_analyzer() -> Analyzer:
+    return Analyzer()
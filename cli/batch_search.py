@@ -0,0 +1,200 @@
+import itertools
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bm25_engine
+import inverted_index
+
+# Keyword batch modes: the BM25 top-k strategies, or boolean queries ranked by
+# BM25 like the search command
+BOOLEAN = "boolean"
+KEYWORD_MODES = bm25_engine.SEARCH_MODES + (BOOLEAN,)
+
+DEFAULT_LIMIT = 10
+
+# Queries handed to a BM25 worker at a time, amortizing the inter-process
+# round trip
+KEYWORD_BATCH_SIZE = 64
+
+# Queries encoded in one model call and scored together
+SEMANTIC_BATCH_SIZE = 256
+
+# Index of a BM25 worker process
+_worker_index = None
+
+
+def _init_keyword_worker():
+    global _worker_index
+    _worker_index = inverted_index.InvertedIndex()
+    _worker_index.load()
+
+
+# Query records of JSONL lines. A line is either a JSON string, the query, or
+# an object with a "query" and optionally an "id" and a "limit". The id
+# defaults to the line number. A line that can't be read becomes a record
+# with an "error", reported in the output rather than stopping the run.
+def read_queries(lines, limit: int = DEFAULT_LIMIT):
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield {"id": number, "error": "Invalid JSON."}
+            continue
+        if isinstance(record, str):
+            record = {"query": record}
+        if not isinstance(record, dict) or not isinstance(record.get("query"), str):
+            yield {"id": number, "error": "Expected a string or an object with a \"query\"."}
+            continue
+
+        record_limit = record.get("limit", limit)
+        # JSON true and false are ints to isinstance
+        if isinstance(record_limit, bool) or not isinstance(record_limit, int) or record_limit < 1:
+            yield {"id": record.get("id", number), "error": "The limit must be a positive integer."}
+            continue
+        if len(record["query"].strip()) == 0:
+            yield {"id": record.get("id", number), "error": "The query must not be empty."}
+            continue
+
+        yield {"id": record.get("id", number), "query": record["query"], "limit": record_limit}
+
+
+# Evaluate BM25 or boolean queries from `lines` against a loaded index and
+# write one JSON line of results per query to `out`. With more than one
+# worker the queries are spread over processes that each load the
+# memory-mapped index saved under cache/ once. Returns the run's counters,
+# see _run.
+def run_keyword_batch(inv_index, lines, out, limit: int = DEFAULT_LIMIT, mode: str = bm25_engine.EXHAUSTIVE,
+                      workers: int = 1) -> dict:
+    if mode not in KEYWORD_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+
+    global _worker_index
+    records = read_queries(lines, limit)
+    if workers <= 1:
+        _worker_index = inv_index
+        return _run(records, out, lambda block: _keyword_block(block, mode), KEYWORD_BATCH_SIZE)
+
+    with ProcessPoolExecutor(workers, initializer=_init_keyword_worker) as executor:
+        return _run(records, out, lambda block: executor.submit(_keyword_block, block, mode),
+                    KEYWORD_BATCH_SIZE, workers)
+
+
+# Evaluate semantic queries from `lines` with a loaded SemanticSearch and
+# write one JSON line of results per query to `out`. Each block of queries is
+# encoded in one call, cache misses only, and scored against the corpus with
+# matrix products. Blocks run on `workers` threads, numpy and torch release
+# the GIL.
+def run_semantic_batch(search_obj, lines, out, limit: int = DEFAULT_LIMIT, workers: int = 1) -> dict:
+    records = read_queries(lines, limit)
+    if workers <= 1:
+        return _run(records, out, lambda block: _semantic_block(search_obj, block), SEMANTIC_BATCH_SIZE)
+
+    with ThreadPoolExecutor(workers) as executor:
+        return _run(records, out, lambda block: executor.submit(_semantic_block, search_obj, block),
+                    SEMANTIC_BATCH_SIZE, workers)
+
+
+# Output lines of a block of query records, using this process's index
+def _keyword_block(block, mode: str) -> list[dict]:
+    output = []
+    for record in block:
+        if "error" in record:
+            output.append(record)
+            continue
+
+        start = time.perf_counter()
+        try:
+            if mode == BOOLEAN:
+                results = _worker_index.boolean_search(record["query"], record["limit"])
+            else:
+                results = _worker_index.bm25_search(record["query"], record["limit"], mode)
+        except ValueError as error:
+            output.append({"id": record["id"], "error": str(error)})
+            continue
+        output.append(_output(record, results, start))
+    return output
+
+
+def _semantic_block(search_obj, block) -> list[dict]:
+    queries = [record for record in block if "error" not in record]
+    results = iter(())
+    start = time.perf_counter()
+    if queries:
+        # One search for the block, each query cut to its own limit
+        results = iter(search_obj.search_many(
+            [record["query"] for record in queries],
+            max(record["limit"] for record in queries)))
+
+    output = []
+    for record in block:
+        if "error" in record:
+            output.append(record)
+        else:
+            output.append(_output(record, next(results)[:record["limit"]], start, len(queries)))
+    return output
+
+
+# The output line of a query, with the id, title and score of each result.
+# `took_ms` is the query's share of its block when a block is searched at once.
+def _output(record, results, start: float, block_size: int = 1) -> dict:
+    return {
+        "id": record["id"],
+        "query": record["query"],
+        "results": [{"id": result["id"], "title": result["title"], "score": result["score"]}
+                    for result in results],
+        "took_ms": (time.perf_counter() - start) * 1000 / block_size,
+    }
+
+
+# Split records into blocks, evaluate each with `evaluate` and write the
+# output lines in input order as they're ready. With a pool, `evaluate`
+# returns a future and at most two blocks per worker are in flight, so input
+# is read as the run goes rather than all up front. Returns the number of
+# queries, of errors, the elapsed seconds and the throughput.
+def _run(records, out, evaluate, batch_size: int, workers: int = 0) -> dict:
+    start = time.perf_counter()
+    queries = 0
+    errors = 0
+
+    def write(output):
+        nonlocal queries, errors
+        for line in output:
+            queries += 1
+            errors += "error" in line
+            out.write(json.dumps(line) + "\n")
+
+    pending = deque()
+    for block in itertools.batched(records, batch_size):
+        if workers == 0:
+            write(evaluate(block))
+            continue
+
+        pending.append(evaluate(block))
+        if len(pending) >= 2 * workers:
+            write(pending.popleft().result())
+    while pending:
+        write(pending.popleft().result())
+    out.flush()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "queries": queries,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": queries / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+# One line summary of a run's counters, for stderr so it stays out of the
+# JSONL on stdout
+def print_summary(summary: dict, workers: int):
+    print(f"Evaluated {summary["queries"]} queries ({summary["errors"]} errors) in "
+          f"{summary["seconds"]:.2f} s, {summary["throughput"]:.1f} queries/s with {max(workers, 1)} workers",
+          file=sys.stderr)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+# Tokens/sec of the text analysis pipeline before and after the cached Analyzer.
+# Run from the project root, both paths read data/stopwords.txt.
+
+import argparse
+import os
+import string
+import sys
+import time
+
+from nltk.stem import PorterStemmer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzer  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# process_text as it was before the Analyzer: re-reads the stop words file,
+# checks them with a list scan and builds a new stemmer on every call.
+def legacy_process_text(text: str):
+    tokens = text.lower().translate(
+        str.maketrans("", "", string.punctuation)).split()
+
+    with open(analyzer.STOP_WORDS_PATH, 'r') as s:
+        stop_words = s.read().splitlines()
+        stop_words_removed = list(
+            filter(lambda token: token not in stop_words, tokens))
+
+        stemmer = PorterStemmer()
+        return list(map(lambda token: stemmer.stem(token), stop_words_removed))
+
+
+def tokens_per_second(analyze, texts, token_count):
+    start = time.perf_counter()
+    analyze(texts)
+    return token_count / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Text analysis benchmark")
+    parser.add_argument("--size", type=int, default=5000,
+                        help="Number of synthetic movies")
+    args = parser.parse_args()
+
+    texts = [f"{movie["title"]} {movie["description"]}"
+             for movie in synthetic_corpus.generate_movies(args.size)]
+    token_count = sum(len(text.split()) for text in texts)
+
+    legacy = tokens_per_second(
+        lambda batch: [legacy_process_text(text) for text in batch], texts, token_count)
+
+    # A fresh analyzer per run so the cold run starts with an empty stem cache
+    cold = analyzer.Analyzer()
+    cold_rate = tokens_per_second(cold.analyze_many, texts, token_count)
+    warm_rate = tokens_per_second(cold.analyze_many, texts, token_count)
+
+    print(f"Corpus: {len(texts)} texts, {token_count} tokens")
+    print(f"{'legacy process_text':<28} {legacy:>14,.0f} tokens/s")
+    print(f"{'Analyzer (cold cache)':<28} {cold_rate:>14,.0f} tokens/s")
+    print(f"{'Analyzer (warm cache)':<28} {warm_rate:>14,.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Recall@k and QPS of the IVF index against exact search, for a range of
+# nprobe values, on clustered synthetic embeddings.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import ivf_index  # noqa: E402
+from lib import vector_engine  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def recall(approximate, exact):
+    hits = sum(len(set(found.tolist()) & set(truth.tolist()))
+               for found, truth in zip(approximate, exact))
+    return hits / sum(len(truth) for truth in exact)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IVF index benchmark")
+    parser.add_argument("--size", type=int, default=200_000,
+                        help="Number of corpus vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--lists", type=int, default=None,
+                        help="IVF list count, ~4 * sqrt(size) by default")
+    parser.add_argument("--nprobe", type=int, nargs="+",
+                        default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    matrix = vector_engine.normalize_rows(
+        synthetic_corpus.generate_embeddings(args.size, seed=1), copy=False)
+    queries = synthetic_corpus.generate_embeddings(args.queries, seed=2)
+
+    start = time.perf_counter()
+    index = ivf_index.IVFIndex.build(matrix, args.lists)
+    build_seconds = time.perf_counter() - start
+    print(f"Corpus: {args.size} vectors, {index.list_count} lists, built in {build_seconds:.1f}s")
+
+    # Exact search one query at a time, the same way the index is queried
+    start = time.perf_counter()
+    exact = [vector_engine.search(matrix, query, args.limit)[0][0]
+             for query in queries]
+    exact_qps = args.queries / (time.perf_counter() - start)
+
+    print(f"{'nprobe':>7} {f'recall@{args.limit}':>10} {'QPS':>8} {'speedup':>8}")
+    print(f"{'exact':>7} {1.0:>10.3f} {exact_qps:>8.0f} {1.0:>7.1f}x")
+    for nprobe in args.nprobe:
+        start = time.perf_counter()
+        found, _ = index.search(matrix, queries, args.limit, nprobe)
+        qps = args.queries / (time.perf_counter() - start)
+
+        print(f"{nprobe:>7} {recall(found, exact):>10.3f} {qps:>8.0f} {qps / exact_qps:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
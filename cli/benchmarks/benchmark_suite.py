@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+# Benchmark suite for the keyword and semantic retrieval paths. For each corpus
+# size it generates synthetic movies over a Zipfian vocabulary that grows with
+# the corpus, then measures text analysis, index build, save, load, BM25
+# search, embedding build, semantic search and both chunkers. Semantic search
+# uses the stub encoder, so the suite runs offline without the model.
+#
+# Every operation is timed call by call for latency percentiles and
+# throughput, then run again under tracemalloc for its peak Python and numpy
+# allocations. Memory-mapped files aren't counted. Results can be written as
+# JSON and compared against an earlier run:
+#
+#   python cli/benchmarks/benchmark_suite.py --sizes 1000 100000 --json new.json --compare old.json
+#
+# Run from the project root, the analyzer reads data/stopwords.txt. Indexes
+# and embeddings are written to a temporary directory, not cache/.
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzer  # noqa: E402
+import bm25_engine  # noqa: E402
+import inverted_index  # noqa: E402
+import keyword_search  # noqa: E402
+from lib import chunking  # noqa: E402
+from lib import result_cache  # noqa: E402
+from lib import semantic_search  # noqa: E402
+import stub_encoder  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+OPERATIONS = (
+    "process_text", "build", "save", "load", "bm25_search", "bm25_search_wand",
+    "build_embeddings", "semantic_search", "word_chunk", "semantic_chunk",
+)
+
+# Result fields compared by --compare, and whether higher is better
+COMPARED = (("p50_ms", False), ("p99_ms", False), ("throughput", True), ("peak_memory_mb", False))
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+# Time each of `make_calls()`, then run the first `memory_calls` of a fresh
+# list under tracemalloc. `items` is what throughput counts, e.g. the corpus
+# size for a build. Output of the calls is discarded.
+def measure(name: str, docs: int, make_calls, items: int, unit: str, memory_calls: int) -> dict:
+    calls = make_calls()
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for call in calls:
+            call_start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - call_start)
+        total = time.perf_counter() - start
+
+    peak = None
+    if memory_calls > 0:
+        calls = make_calls()[:memory_calls]
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for call in calls:
+                    call()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "operation": name,
+        "docs": docs,
+        "calls": len(latencies),
+        "total_s": total,
+        "throughput": items / total if total > 0 else 0.0,
+        "unit": unit,
+        "mean_ms": total / max(len(latencies), 1) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "peak_memory_mb": peak / 1e6 if peak is not None else None,
+    }
+
+
+def run_size(size: int, args) -> list[dict]:
+    # A fresh analyzer, so stems cached by a smaller size don't carry over
+    analyzer.default_analyzer.cache_clear()
+
+    vocabulary_size = synthetic_corpus.scaled_vocabulary_size(size)
+    movies = list(synthetic_corpus.generate_movies(size, vocabulary_size))
+    queries = synthetic_corpus.generate_queries(args.queries, vocabulary_size)
+    texts = [f"{movie["title"]} {movie["description"]}" for movie in movies]
+    descriptions = [movie["description"] for movie in movies]
+    sample = args.sample_calls
+    memory_calls = args.memory_calls if args.memory else 0
+    # One-shot operations are run again in full for their memory
+    one_shot_memory = 1 if args.memory else 0
+
+    # Every build hands its index to a save, so saves don't rebuild
+    built = []
+
+    def build():
+        inv_index = inverted_index.InvertedIndex()
+        inv_index.build_from_movies(movies, args.workers)
+        built.append(inv_index)
+
+    loaded = inverted_index.InvertedIndex()
+    semantic = semantic_search.SemanticSearch(stub_encoder.StubEncoder())
+    # Searches are timed uncached, repeated queries and the WAND run would
+    # otherwise be served from the result cache
+    loaded.result_cache = result_cache.ResultCache(0)
+    semantic.result_cache = result_cache.ResultCache(0)
+
+    operations = {
+        "process_text": lambda: measure(
+            "process_text", size, lambda: [lambda text=text: keyword_search.process_text(text) for text in texts[:sample]],
+            min(size, sample), "texts/s", memory_calls),
+        "build": lambda: measure(
+            "build", size, lambda: [build], size, "docs/s", one_shot_memory),
+        "save": lambda: measure(
+            "save", size, lambda: [built.pop().save] if built else [], size, "docs/s", one_shot_memory),
+        "load": lambda: measure(
+            "load", size, lambda: [lambda: inverted_index.InvertedIndex().load()] * args.repeat,
+            args.repeat, "loads/s", memory_calls),
+        "bm25_search": lambda: measure(
+            "bm25_search", size, lambda: [lambda query=query: loaded.bm25_search(query, args.limit) for query in queries],
+            len(queries), "queries/s", memory_calls),
+        "bm25_search_wand": lambda: measure(
+            "bm25_search_wand", size,
+            lambda: [lambda query=query: loaded.bm25_search(query, args.limit, bm25_engine.WAND) for query in queries],
+            len(queries), "queries/s", memory_calls),
+        "build_embeddings": lambda: measure(
+            "build_embeddings", size, lambda: [lambda: semantic.build_embeddings(movies)],
+            size, "docs/s", one_shot_memory),
+        "semantic_search": lambda: measure(
+            "semantic_search", size, lambda: [lambda query=query: semantic.search(query, args.limit) for query in queries],
+            len(queries), "queries/s", memory_calls),
+        "word_chunk": lambda: measure(
+            "word_chunk", size,
+            lambda: [lambda text=text: chunking.word_chunk(text, chunking.DEFAULT_CHUNK_SIZE, chunking.DEFAULT_OVERLAP)
+                     for text in descriptions[:sample]],
+            min(size, sample), "texts/s", memory_calls),
+        "semantic_chunk": lambda: measure(
+            "semantic_chunk", size,
+            lambda: [lambda text=text: chunking.semantic_chunk(text, chunking.DEFAULT_MAX_CHUNK_SIZE, chunking.DEFAULT_OVERLAP)
+                     for text in descriptions[:sample]],
+            min(size, sample), "texts/s", memory_calls),
+    }
+
+    results = []
+    for name in args.operations:
+        # Loads and searches need an index on disk, searches one loaded once
+        if name in ("load", "bm25_search", "bm25_search_wand") and not os.path.exists(inverted_index.INDEX_MANIFEST_PATH):
+            with contextlib.redirect_stdout(io.StringIO()):
+                build()
+                built.pop().save()
+        if name.startswith("bm25_search") and not loaded.segments:
+            loaded.load()
+        if name == "semantic_search" and semantic.embeddings is None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                semantic.build_embeddings(movies)
+        # A save needs an unsaved build
+        if name == "save" and "build" not in args.operations:
+            for _ in range(1 + one_shot_memory):
+                build()
+
+        result = operations[name]()
+        results.append(result)
+        memory = f"{result["peak_memory_mb"]:>9.1f} MB" if result["peak_memory_mb"] is not None else f"{'-':>12}"
+        print(f"{size:>8} {name:<17} {result["calls"]:>6} {result["throughput"]:>12,.1f} {result["unit"]:<10} "
+              f"{result["p50_ms"]:>9.3f} {result["p90_ms"]:>9.3f} {result["p99_ms"]:>9.3f} {memory}")
+
+    return results
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+# Ratios of this run to an earlier one for every operation and size in both
+def compare(results, baseline_path: str):
+    with open(baseline_path, 'r') as f:
+        baseline = {(result["operation"], result["docs"]): result
+                    for result in json.load(f)["results"]}
+
+    print(f"\nCompared to {baseline_path} (new / old, > 1 is better)")
+    print(f"{'docs':>8} {'operation':<17}" + "".join(f" {field:>15}" for field, _ in COMPARED))
+    for result in results:
+        old = baseline.get((result["operation"], result["docs"]))
+        if old is None:
+            continue
+
+        cells = []
+        for field, higher_is_better in COMPARED:
+            new_value, old_value = result[field], old.get(field)
+            if not new_value or not old_value:
+                cells.append(f" {'-':>15}")
+                continue
+            ratio = new_value / old_value if higher_is_better else old_value / new_value
+            cells.append(f" {ratio:>14.2f}x")
+        print(f"{result["docs"]:>8} {result["operation"]:<17}" + "".join(cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Retrieval benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Corpus sizes, up to 1000000")
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=list(OPERATIONS))
+    parser.add_argument("--queries", type=int, default=500,
+                        help="Zipfian queries per search operation")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--sample-calls", type=int, default=20000,
+                        help="Texts timed for process_text and the chunkers")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Index loads timed")
+    parser.add_argument("--workers", type=int, default=1, help="Index build workers")
+    parser.add_argument("--memory-calls", type=int, default=100,
+                        help="Calls run under tracemalloc for the peak memory")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Skip the peak memory runs")
+    parser.add_argument("--json", type=str, help="Write the results to this file")
+    parser.add_argument("--compare", type=str, help="Earlier --json results to compare with")
+    args = parser.parse_args()
+
+    stop_words_path = os.path.abspath(analyzer.STOP_WORDS_PATH)
+    json_path = os.path.abspath(args.json) if args.json is not None else None
+    baseline_path = os.path.abspath(args.compare) if args.compare is not None else None
+    report = {"environment": environment(), "arguments": vars(args), "results": []}
+
+    print(f"{'docs':>8} {'operation':<17} {'calls':>6} {'throughput':>12} {'':<10} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak memory':>12}")
+    working_directory = os.getcwd()
+    for size in args.sizes:
+        # Each size gets a clean directory for cache/, with the stop words
+        # where the analyzer looks for them
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "data"))
+            shutil.copy(stop_words_path, os.path.join(directory, analyzer.STOP_WORDS_PATH))
+            os.chdir(directory)
+            try:
+                report["results"] += run_size(size, args)
+            finally:
+                os.chdir(working_directory)
+
+    if json_path is not None:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline_path is not None:
+        compare(report["results"], baseline_path)
+
+
+if __name__ == "__main__":
+    main()
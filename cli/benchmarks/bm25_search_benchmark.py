@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Compare BM25 query latency of the precomputed impact postings against the
+# previous per-posting scoring path on synthetic corpora of growing size.
+# Run from the project root, the analyzer reads data/stopwords.txt.
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inverted_index  # noqa: E402
+import keyword_search  # noqa: E402
+from lib import result_cache  # noqa: E402
+import search_utils  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# The scoring loop bm25_search used before impact postings: every posting
+# re-tokenizes the term twice and recomputes avgdl from all doc lengths.
+# The re-tokenized term is discarded, re-stemming a stem is not idempotent.
+def legacy_bm25_search(inv_index, query, limit=5):
+    k1 = search_utils.BM25_K1
+    b = search_utils.BM25_B
+    scores_dict = {}
+    for token in keyword_search.process_text(query):
+        for doc_id in inv_index.get_documents(token):
+            keyword_search.process_text(token)
+            raw_tf = inv_index.get_tf(str(doc_id), token)
+            avg_doc_length = sum(inv_index.doc_lengths.values()) / \
+                len(inv_index.doc_lengths)
+            length_norm = 1 - b + b * \
+                (inv_index.doc_lengths[doc_id] / avg_doc_length)
+            tf = (raw_tf * (k1 + 1)) / (raw_tf + k1 * length_norm)
+
+            keyword_search.process_text(token)
+            df = len(inv_index.get_documents(token))
+            doc_count = len(inv_index.docmap)
+            idf = math.log((doc_count - df + 0.5) / (df + 0.5) + 1)
+
+            scores_dict[doc_id] = scores_dict.get(doc_id, 0) + tf * idf
+
+    return sorted(scores_dict.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+def time_queries(search, queries):
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="BM25 search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 4000, 16000], help="Corpus sizes")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Number of queries per size")
+    parser.add_argument("--legacy-max-size", type=int, default=4000,
+                        help="Largest corpus the legacy path is timed on")
+    args = parser.parse_args()
+
+    queries = synthetic_corpus.generate_queries(args.queries)
+
+    print(f"{'docs':>8} {'postings/query':>15} {'impact ms/query':>16} {'impact us/posting':>18} {'legacy ms/query':>16}")
+    for size in args.sizes:
+        inv_index = inverted_index.InvertedIndex()
+        inv_index.build_from_movies(synthetic_corpus.generate_movies(size))
+        # Time the scoring, not result cache hits of repeated queries
+        inv_index.result_cache = result_cache.ResultCache(0)
+
+        # Number of postings touched by the query set
+        postings = sum(
+            len(inv_index.get_documents(token))
+            for query in queries for token in keyword_search.process_text(query)
+        ) / len(queries)
+
+        impact_latency = time_queries(inv_index.bm25_search, queries)
+
+        legacy = "-"
+        if size <= args.legacy_max_size:
+            # The legacy path is O(postings × N), keep its query set small.
+            legacy_latency = time_queries(
+                lambda query: legacy_bm25_search(inv_index, query), queries[:20])
+            legacy = f"{legacy_latency * 1000:.2f}"
+
+        print(f"{size:>8} {postings:>15.0f} {impact_latency * 1000:>16.3f} {impact_latency * 1e6 / max(postings, 1):>18.3f} {legacy:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Compare a BM25Sweep over a (k1, b) grid against scoring every setting with
+# get_bm25_tf, which re-tokenizes the queries and re-walks the postings each
+# time. The per-setting path is timed on a few settings and extrapolated to
+# the grid. Also checks the sweep ranks like bm25_search at the default
+# setting. Relevance judgments are random. Run from the project root.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bm25_sweep  # noqa: E402
+import inverted_index  # noqa: E402
+import search_utils  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# Top `limit` doc ids of `query` at one setting, scored posting by posting
+def per_setting_search(inv_index, query, k1, b, limit):
+    scores = {}
+    for token in inv_index.analyzer.analyze(query):
+        if token not in inv_index.impact_postings:
+            continue
+        idf = inv_index.idf[token]
+        for doc_id in inv_index.get_documents(token):
+            scores[doc_id] = scores.get(doc_id, 0) + \
+                inv_index.get_bm25_tf(doc_id, token, k1, b) * idf
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="BM25 parameter sweep benchmark")
+    parser.add_argument("--size", type=int, default=5000,
+                        help="Number of synthetic movies")
+    parser.add_argument("--queries", type=int, default=100,
+                        help="Number of queries")
+    parser.add_argument("--relevant", type=int, default=20,
+                        help="Judged relevant movies per query")
+    parser.add_argument("--baseline-settings", type=int, default=3,
+                        help="Settings scored the per-setting way")
+    args = parser.parse_args()
+
+    vocabulary_size = synthetic_corpus.scaled_vocabulary_size(args.size)
+    inv_index = inverted_index.InvertedIndex()
+    inv_index.build_from_movies(
+        synthetic_corpus.generate_movies(args.size, vocabulary_size))
+    queries = synthetic_corpus.generate_queries(args.queries, vocabulary_size)
+
+    rng = random.Random(0)
+    qrels = {
+        str(query_id): {doc_id: rng.randint(1, 3) for doc_id in rng.sample(range(1, args.size + 1), args.relevant)}
+        for query_id in range(len(queries))
+    }
+    grid = [(k1, b) for b in bm25_sweep.DEFAULT_B_VALUES for k1 in bm25_sweep.DEFAULT_K1_VALUES]
+
+    start = time.perf_counter()
+    sweep = bm25_sweep.BM25Sweep(inv_index, list(enumerate(queries)), qrels)
+    gathered = time.perf_counter()
+    sweep.evaluate()
+    scored = time.perf_counter()
+
+    baseline_start = time.perf_counter()
+    for k1, b in grid[:args.baseline_settings]:
+        for query in queries:
+            per_setting_search(inv_index, query, k1, b, bm25_sweep.DEFAULT_DEPTH)
+    baseline = (time.perf_counter() - baseline_start) / args.baseline_settings
+
+    expected = [[(hit["id"], hit["score"]) for hit in inv_index.bm25_search(query, bm25_sweep.DEFAULT_DEPTH)]
+                for query in queries]
+    actual = sweep.top_k(search_utils.BM25_K1, search_utils.BM25_B)
+    identical = all(
+        [doc_id for doc_id, _ in want] == [doc_id for doc_id, _ in got]
+        and all(abs(want_score - got_score) < 1e-9 for (_, want_score), (_, got_score) in zip(want, got))
+        for want, got in zip(expected, actual))
+
+    print(f"Corpus: {args.size} docs, {len(queries)} queries, {len(grid)} settings")
+    print(f"Sweep gather: {gathered - start:.2f} s ({sweep.posting_count} postings)")
+    print(f"Sweep grid:   {scored - gathered:.2f} s")
+    print(f"Per setting:  {baseline:.2f} s/setting, ~{baseline * len(grid):.0f} s for the grid")
+    print(f"Identical to bm25_search: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Index build time with 1/2/4/8 worker processes on a synthetic corpus. Checks
+# every parallel build is identical to the serial one. Run from the project root.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inverted_index  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# Everything a build produces, in a comparable shape
+def snapshot(inv_index):
+    return (
+        {token: (posting_list.doc_ids.tolist(), posting_list.tfs.tolist())
+         for token, posting_list in inv_index.postings.items()},
+        list(inv_index.doc_lengths.items()),
+        list(inv_index.docmap),
+        {token: weights.tolist() for token, (_, weights)
+         in inv_index.impact_postings.items()},
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parallel build benchmark")
+    parser.add_argument("--size", type=int, default=50000,
+                        help="Number of synthetic movies")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[1, 2, 4, 8], help="Worker counts to time")
+    args = parser.parse_args()
+
+    movies = list(synthetic_corpus.generate_movies(args.size))
+    print(f"Corpus: {args.size} docs, {os.cpu_count()} CPUs")
+
+    baseline = None
+    serial_time = None
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'identical':>10}")
+    for workers in args.workers:
+        inv_index = inverted_index.InvertedIndex()
+
+        start = time.perf_counter()
+        inv_index.build_from_movies(movies, workers)
+        elapsed = time.perf_counter() - start
+
+        result = snapshot(inv_index)
+        if baseline is None:
+            baseline = result
+            serial_time = elapsed
+
+        print(f"{workers:>8} {elapsed:>9.2f} {serial_time / elapsed:>7.2f}x {str(result == baseline):>10}")
+
+
+if __name__ == "__main__":
+    main()
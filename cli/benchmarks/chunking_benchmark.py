@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# Chunking throughput in MB/s of the streaming chunkers versus the list based
+# ones they replaced, on a multi-megabyte text made of synthetic movie
+# descriptions. Also reports the peak memory of each and checks they return
+# the same chunks.
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import chunking  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# handle_chunk and semantic_chunk as they were: split everything, copy the
+# window at every boundary, return all joined chunks
+def legacy_chunk(units, chunk_size, overlap):
+    resulting_list = []
+    temp_list = []
+    for unit in units:
+        if len(temp_list) < chunk_size:
+            temp_list.append(unit)
+        else:
+            previous_list = temp_list.copy()
+            resulting_list.append(previous_list)
+            temp_list.clear()
+            if overlap > 0:
+                temp_list.extend(previous_list[-overlap:])
+            temp_list.append(unit)
+
+    if len(temp_list) > 0:
+        resulting_list.append(temp_list)
+
+    return [' '.join(string_list) for string_list in resulting_list]
+
+
+def legacy_word_chunk(text, chunk_size, overlap):
+    return legacy_chunk(text.split(), chunk_size, overlap)
+
+
+def legacy_semantic_chunk(text, chunk_size, overlap):
+    return legacy_chunk(re.split(r"(?<=[.!?])\s+", text), chunk_size, overlap)
+
+
+# Synthetic movies whose descriptions add up to `megabytes`
+def make_movies(megabytes):
+    movies = []
+    size = 0
+    for movie in synthetic_corpus.generate_movies(10 ** 9):
+        movies.append(movie)
+        size += len(movie["description"]) + 1
+        if size >= megabytes * 1_000_000:
+            return movies
+
+
+# Chunk count, seconds and peak traced bytes of running `chunk` to the end.
+# Memory is measured in a second run, tracing slows the first one down.
+def measure(chunk):
+    start = time.perf_counter()
+    count = sum(1 for _ in chunk())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in chunk():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chunking throughput benchmark")
+    parser.add_argument("--megabytes", type=float, default=8.0)
+    parser.add_argument("--chunk-size", type=int, default=chunking.DEFAULT_CHUNK_SIZE,
+                        help="Words per word chunk")
+    parser.add_argument("--max-chunk-size", type=int, default=chunking.DEFAULT_MAX_CHUNK_SIZE,
+                        help="Sentences per semantic chunk")
+    parser.add_argument("--word-overlap", type=int, default=1)
+    parser.add_argument("--sentence-overlap", type=int, default=1)
+    args = parser.parse_args()
+
+    movies = make_movies(args.megabytes)
+    text = "\n".join(movie["description"] for movie in movies)
+    megabytes = len(text.encode()) / 1_000_000
+    print(f"{megabytes:.1f} MB of text")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "text.txt")
+        with open(path, "w") as f:
+            f.write(text)
+
+        def from_file(iter_chunks, size, overlap):
+            def chunk():
+                with open(path, "r") as f:
+                    yield from iter_chunks(f, size, overlap)
+            return chunk
+
+        kinds = [
+            ("word", args.chunk_size, args.word_overlap, legacy_word_chunk,
+             chunking.word_chunk, chunking.iter_word_chunks),
+            ("semantic", args.max_chunk_size, args.sentence_overlap, legacy_semantic_chunk,
+             chunking.semantic_chunk, chunking.iter_semantic_chunks),
+        ]
+        for kind, size, overlap, legacy, as_list, iter_chunks in kinds:
+            if legacy(text, size, overlap) != as_list(text, size, overlap):
+                raise AssertionError(f"{kind} chunks differ from the legacy chunker")
+
+            runs = [
+                ("legacy list", lambda: legacy(text, size, overlap)),
+                ("streamed string", lambda: iter_chunks(text, size, overlap)),
+                ("streamed file", from_file(iter_chunks, size, overlap)),
+                # Each movie on its own, as the chunk index does
+                ("documents", lambda: chunking.iter_document_chunks(
+                    movies, size, overlap, iter_chunks)),
+            ]
+            for label, chunk in runs:
+                count, elapsed, peak = measure(chunk)
+                print(f"{kind:<9} {label:<16} {count:>8} chunks {megabytes / elapsed:>8.1f} MB/s "
+                      f"peak {peak / 1_000_000:>8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
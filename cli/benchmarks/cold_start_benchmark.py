@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Cold-start benchmark: time from a fresh process to the first answered tf
+# lookup and BM25 query, for the previous pickle files and for the
+# memory-mapped segment. Each measurement runs in its own interpreter.
+# Run from the project root.
+
+import argparse
+import os
+import pickle
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CLI_DIR)
+
+import inverted_index  # noqa: E402
+import segment  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+# Loads the pickle layout the way InvertedIndex.load() did before segments
+PICKLE_LOAD = """
+import pickle
+import postings
+with open("{dir}/index.pkl", 'rb') as i, open("{dir}/docmap.pkl", 'rb') as d, open("{dir}/term_frequencies.pkl", 'rb') as tf, open("{dir}/doc_lengths.pkl", 'rb') as dl, open("{dir}/bm25_postings.pkl", 'rb') as bm:
+    encoded_doc_ids = pickle.load(i)
+    docmap = pickle.load(d)
+    encoded_tfs = pickle.load(tf)
+    doc_lengths = pickle.load(dl)
+    bm25_statistics = pickle.load(bm)
+index = {{token: postings.PostingList.decode(encoded, encoded_tfs[token]) for token, encoded in encoded_doc_ids.items()}}
+impacts = {{token: (index[token].doc_ids, weights) for token, weights in bm25_statistics["impact_weights"].items()}}
+loaded = time.perf_counter()
+index[{term!r}].tf({doc_id})
+doc_ids, weights = impacts[{term!r}]
+docmap[doc_ids[0]]
+"""
+
+SEGMENT_LOAD = """
+import segment
+index_segment = segment.Segment("{dir}/index.seg")
+loaded = time.perf_counter()
+index_segment.postings[{term!r}].tf({doc_id})
+doc_ids, weights = index_segment.impact_postings[{term!r}]
+index_segment.documents[doc_ids[0]]
+"""
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {cli_dir!r})
+start = time.perf_counter()
+{body}
+answered = time.perf_counter()
+print(loaded - start, answered - start)
+"""
+
+
+def save_pickles(inv_index, directory):
+    encoded_doc_ids = {}
+    encoded_tfs = {}
+    for token, posting_list in inv_index.postings.items():
+        encoded_doc_ids[token], encoded_tfs[token] = posting_list.encode()
+
+    for name, data in [
+        ("index.pkl", encoded_doc_ids),
+        # The docmap was a dict of every movie
+        ("docmap.pkl", dict(inv_index.docmap)),
+        ("term_frequencies.pkl", encoded_tfs),
+        ("doc_lengths.pkl", inv_index.doc_lengths),
+        ("bm25_postings.pkl", {
+            "avg_doc_length": inv_index.avg_doc_length,
+            "idf": inv_index.idf,
+            "impact_weights": {token: weights for token, (_, weights) in inv_index.impact_postings.items()},
+            "max_impacts": inv_index.max_impacts,
+        }),
+    ]:
+        with open(os.path.join(directory, name), 'wb') as f:
+            pickle.dump(data, f)
+
+
+def run_child(body, runs):
+    load_times = []
+    answer_times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", CHILD.format(cli_dir=CLI_DIR, body=body)],
+                                capture_output=True, text=True, check=True).stdout
+        loaded, answered = map(float, output.split())
+        load_times.append(loaded)
+        answer_times.append(answered)
+
+    return statistics.median(load_times), statistics.median(answer_times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Index cold-start benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 30000], help="Corpus sizes")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Fresh processes per measurement")
+    args = parser.parse_args()
+
+    print(f"{'docs':>8} {'pickle load ms':>15} {'pickle first answer ms':>23} {'segment load ms':>16} {'segment first answer ms':>24}")
+    for size in args.sizes:
+        inv_index = inverted_index.InvertedIndex()
+        inv_index.build_from_movies(synthetic_corpus.generate_movies(size))
+
+        # Most frequent term, the worst case posting list to decode
+        term = max(inv_index.postings,
+                   key=lambda token: len(inv_index.postings[token]))
+        doc_id = inv_index.postings[term].doc_ids[-1]
+
+        with tempfile.TemporaryDirectory() as directory:
+            save_pickles(inv_index, directory)
+            segment.write_segment(os.path.join(directory, "index.seg"), inv_index.postings, inv_index.impact_postings,
+                                  inv_index.idf, inv_index.max_impacts, inv_index.doc_lengths, inv_index.docmap, inv_index.avg_doc_length)
+
+            pickle_load, pickle_answer = run_child(PICKLE_LOAD.format(
+                dir=directory, term=term, doc_id=doc_id), args.runs)
+            segment_load, segment_answer = run_child(SEGMENT_LOAD.format(
+                dir=directory, term=term, doc_id=doc_id), args.runs)
+
+        print(f"{size:>8} {pickle_load * 1000:>15.2f} {pickle_answer * 1000:>23.2f} {segment_load * 1000:>16.2f} {segment_answer * 1000:>24.2f}")
+
+
+if __name__ == "__main__":
+    main()
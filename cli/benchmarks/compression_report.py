@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Memory per vector, recall@k and QPS of int8 and product-quantized embeddings
+# against the float32 search, with and without re-ranking the candidates
+# against memory-mapped float32 vectors.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import quantization  # noqa: E402
+from lib import vector_engine  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def recall(approximate, exact):
+    hits = sum(len(set(found.tolist()) & set(truth.tolist()))
+               for found, truth in zip(approximate, exact))
+    return hits / sum(len(truth) for truth in exact)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compressed embeddings report")
+    parser.add_argument("--size", type=int, default=100_000,
+                        help="Number of corpus vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--rerank", type=int, default=quantization.DEFAULT_RERANK)
+    args = parser.parse_args()
+
+    embeddings = synthetic_corpus.generate_embeddings(args.size, seed=1)
+    queries = synthetic_corpus.generate_embeddings(args.queries, seed=2)
+
+    matrix = vector_engine.normalize_rows(embeddings)
+    start = time.perf_counter()
+    exact, _ = vector_engine.search(matrix, queries, args.limit)
+    exact_qps = args.queries / (time.perf_counter() - start)
+
+    print(f"Corpus: {args.size} vectors of {embeddings.shape[1]} dims")
+    print(f"{'storage':<18} {'bytes/vector':>12} {f'recall@{args.limit}':>10} {'QPS':>8} {'build s':>8}")
+    print(f"{'float32':<18} {matrix.itemsize * matrix.shape[1]:>12} {1.0:>10.3f} {exact_qps:>8.0f} {'':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Re-ranking reads the raw float32 vectors from disk like SemanticSearch
+        path = os.path.join(directory, "embeddings.npy")
+        np.save(path, embeddings)
+        mapped = np.load(path, mmap_mode='r')
+
+        for kind in quantization.COMPRESSION_KINDS:
+            start = time.perf_counter()
+            compressed = quantization.CompressedEmbeddings.build(kind, matrix)
+            build_seconds = time.perf_counter() - start
+
+            for label, rerank_embeddings in ((kind, None), (f"{kind} + rerank {args.rerank}", mapped)):
+                start = time.perf_counter()
+                found, _ = compressed.search(
+                    queries, args.limit, rerank_embeddings, args.rerank)
+                qps = args.queries / (time.perf_counter() - start)
+
+                print(f"{label:<18} {compressed.bytes_per_vector:>12} {recall(found, exact):>10.3f} {qps:>8.0f} {build_seconds:>8.1f}")
+
+        del mapped
+
+
+if __name__ == "__main__":
+    main()
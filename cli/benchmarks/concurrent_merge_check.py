@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# Regression check for overlapping segment merges. A background merge started
+# by save() is held while more updates are saved and a second merge is
+# requested, then released. Afterwards doc_count must match the live
+# documents, every update must be kept, and both the index and a reload of it
+# must rank like a fresh build of the same movies. Run from the project root,
+# the analyzer reads data/stopwords.txt. The index is written to a temporary
+# directory.
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analyzer  # noqa: E402
+import inverted_index  # noqa: E402
+from lib import result_cache  # noqa: E402
+import segment  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def ranking(inv_index, queries):
+    return [[(hit["id"], round(hit["score"], 9)) for hit in inv_index.bm25_search(query, 10)]
+            for query in queries]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent merge regression check")
+    parser.add_argument("--size", type=int, default=2900,
+                        help="Number of synthetic movies built before the updates")
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    text_analyzer = analyzer.Analyzer()
+    movies = {movie["id"]: movie for movie in synthetic_corpus.generate_movies(args.size + 100)}
+    extra_ids = iter(range(args.size + 1, args.size + 101))
+    queries = synthetic_corpus.generate_queries(args.queries)
+
+    # Merged segments are written by merge threads, which wait for `release`
+    release = threading.Event()
+    write = segment.MemorySegment.write
+
+    def held_write(memory_segment, path):
+        if threading.current_thread() is not threading.main_thread():
+            release.wait()
+        return write(memory_segment, path)
+
+    segment.MemorySegment.write = held_write
+
+    project_root = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        inv_index = inverted_index.InvertedIndex(text_analyzer)
+        inv_index.result_cache = result_cache.ResultCache(0)
+        inv_index.build_from_movies(movies[doc_id] for doc_id in range(1, args.size + 1))
+        inv_index.save()
+        expected = {doc_id: movies[doc_id] for doc_id in range(1, args.size + 1)}
+
+        def add():
+            movie = movies[next(extra_ids)]
+            inv_index.add_document(movie)
+            expected[movie["id"]] = movie
+
+        # Add and save until save() starts a background merge
+        threads = []
+        while not threads:
+            add()
+            thread = inv_index.save()
+            if thread is not None:
+                threads.append(thread)
+
+        # Updates while the merge is held, to segments it is merging and to new ones
+        add()
+        thread = inv_index.save()
+        if thread is not None:
+            threads.append(thread)
+        updated = {**movies[1], "title": "Updated"}
+        inv_index.update_document(updated)
+        expected[1] = updated
+        inv_index.delete_document(2)
+        del expected[2]
+        add()
+
+        # A second merge requested while the first is running
+        second = threading.Thread(target=inv_index.merge_segments)
+        second.start()
+        threads.append(second)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        add()
+        inv_index.save()
+
+        live = set(inv_index.docmap)
+        fresh = inverted_index.InvertedIndex(text_analyzer)
+        fresh.result_cache = result_cache.ResultCache(0)
+        fresh.build_from_movies(expected[doc_id] for doc_id in sorted(expected))
+        loaded = inverted_index.InvertedIndex(text_analyzer)
+        loaded.result_cache = result_cache.ResultCache(0)
+        loaded.load()
+
+        checks = {
+            "doc_count matches live documents": inv_index.doc_count == len(live),
+            "live documents match updates": live == set(expected),
+            "updated document kept": inv_index.docmap.get(1, {}).get("title") == "Updated",
+            "ranks like a fresh build": ranking(inv_index, queries) == ranking(fresh, queries),
+            "reload ranks like a fresh build": ranking(loaded, queries) == ranking(fresh, queries),
+        }
+        print(f"Merges: {len(threads)}, segments: {[index_segment.path for index_segment in inv_index.segments]}")
+        print(f"doc_count: {inv_index.doc_count}, live: {len(live)}, expected: {len(expected)}")
+        for name, passed in checks.items():
+            print(f"{name}: {passed}")
+        os.chdir(project_root)
+
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Corpus encoding throughput of the encoding pipeline against a stub model
+# whose cost grows with padded batch tokens, with length bucketing and the
+# tokenizer thread switched on and off, for several batch sizes. Every run
+# must produce the same rows as encoding each text on its own.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import encoding_pipeline  # noqa: E402
+import stub_encoder  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# Text stages with a tokenizer cost per word, so there's work to overlap
+class StubStages(encoding_pipeline.TextStages):
+    def __init__(self, model, seconds_per_token: float) -> None:
+        super().__init__(model)
+        self.seconds_per_token = seconds_per_token
+
+    def tokenize(self, texts):
+        items, lengths = super().tokenize(texts)
+        time.sleep(self.seconds_per_token * sum(lengths))
+        return items, lengths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Encoding pipeline benchmark")
+    parser.add_argument("--size", type=int, default=4096,
+                        help="Number of synthetic movies")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--model-us-per-token", type=float, default=5.0,
+                        help="Stub model cost per padded token")
+    parser.add_argument("--tokenizer-us-per-token", type=float, default=1.0,
+                        help="Stub tokenizer cost per token")
+    args = parser.parse_args()
+
+    # Same text as semantic_search.document_text
+    texts = [f"{movie['title']}: {movie['description']}"
+             for movie in synthetic_corpus.generate_movies(args.size)]
+    model = stub_encoder.StubEncoder(seconds_per_token=args.model_us_per_token / 1e6)
+    stages = StubStages(model, args.tokenizer_us_per_token / 1e6)
+    expected = stub_encoder.StubEncoder().encode(texts)
+
+    print(f"Corpus: {len(texts)} texts, {sum(len(text.split()) for text in texts)} tokens")
+    print(f"{'batch':>6} {'bucketed':>9} {'threaded':>9} {'texts/s':>9} {'same':>5}")
+    for batch_size in args.batch_sizes:
+        for bucket, threaded in ((False, False), (True, False), (True, True)):
+            start = time.perf_counter()
+            out = encoding_pipeline.encode_texts(
+                stages, texts, batch_size, bucket=bucket, threaded=threaded)
+            rate = len(texts) / (time.perf_counter() - start)
+
+            print(f"{batch_size:>6} {str(bucket):>9} {str(threaded):>9} {rate:>9.0f} {str(np.array_equal(out, expected)):>5}")
+
+
+if __name__ == "__main__":
+    main()
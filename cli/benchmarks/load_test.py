@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+# Load test for `semantic_search_cli.py serve`. Replays a Zipfian stream of
+# synthetic queries against each endpoint from `--concurrency` keep-alive
+# connections and reports QPS and latency percentiles. The client is a single
+# asyncio loop, check it isn't the bottleneck by comparing against a lower
+# concurrency.
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_corpus  # noqa: E402
+
+ENDPOINTS = ("bm25", "semantic", "hybrid")
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+async def open_connection(args):
+    if args.socket is not None:
+        return await asyncio.open_unix_connection(args.socket)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+# Send one GET and read the response. Returns the status code.
+async def request(reader, writer, host: str, path: str) -> int:
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    if status == 200:
+        json.loads(body)
+    return status
+
+
+async def run_endpoint(args, endpoint: str, queries):
+    latencies = []
+    errors = 0
+    pending = iter(queries)
+
+    async def client():
+        nonlocal errors
+        reader, writer = await open_connection(args)
+        try:
+            for query in pending:
+                path = f"/search/{endpoint}?q={quote(query)}&limit={args.limit}"
+                start = time.perf_counter()
+                status = await request(reader, writer, args.host, path)
+                latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    errors += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": len(latencies),
+        "errors": errors,
+        "qps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def run(args):
+    distinct = synthetic_corpus.generate_queries(args.distinct, seed=3)
+    cum_weights = synthetic_corpus.zipf_cum_weights(args.distinct)
+    queries = random.Random(5).choices(
+        distinct, cum_weights=cum_weights, k=args.requests)
+
+    reports = []
+    for endpoint in args.endpoints:
+        # Warm up connections and caches before measuring
+        await run_endpoint(args, endpoint, queries[:args.concurrency])
+        report = await run_endpoint(args, endpoint, queries)
+        reports.append(report)
+        print(f"{endpoint:<10} {report['requests']:>7} requests "
+              f"{report['errors']:>5} errors {report['qps']:>9.1f} QPS  "
+              f"p50 {report['p50_ms']:>8.2f} ms  p90 {report['p90_ms']:>8.2f} ms  "
+              f"p99 {report['p99_ms']:>8.2f} ms  max {report['max_ms']:>8.2f} ms")
+    return reports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search server load test")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", type=str,
+                        help="Connect to this Unix socket instead of TCP")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=["bm25"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=1000,
+                        help="Distinct queries the stream is drawn from")
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--json", type=str, help="Also write the reports to this file")
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Compare the memory used by the previous set/Counter index layout with the
+# array-backed PostingList layout, plus the delta + varint encoded size on disk.
+# Run from the project root.
+
+import argparse
+from array import array
+from collections import Counter
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inverted_index  # noqa: E402
+import keyword_search  # noqa: E402
+import postings  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+# Recursive size of containers and their contents. Shared objects
+# (interned tokens, small ints) are only counted once.
+def deep_sizeof(obj, seen=None) -> int:
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen)
+                    for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, postings.PostingList):
+        size += deep_sizeof(obj.doc_ids, seen) + deep_sizeof(obj.tfs, seen)
+    # array, int, str and float sizes are fully covered by getsizeof
+
+    return size
+
+
+# The layout InvertedIndex used before PostingList: token -> set of doc ids
+# and doc id -> Counter of token frequencies.
+def build_legacy_layout(movies):
+    index = {}
+    term_frequencies = {}
+    for movie in movies:
+        tokens = keyword_search.process_text(
+            f"{movie["title"]} {movie["description"]}")
+        for token in tokens:
+            index.setdefault(token, set()).add(movie["id"])
+        term_frequencies.setdefault(movie["id"], Counter()).update(tokens)
+
+    return index, term_frequencies
+
+
+def format_bytes(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Posting layout memory report")
+    parser.add_argument("--size", type=int, default=10000,
+                        help="Number of synthetic movies")
+    args = parser.parse_args()
+
+    movies = list(synthetic_corpus.generate_movies(args.size))
+
+    legacy_index, legacy_term_frequencies = build_legacy_layout(movies)
+    posting_count = sum(len(doc_ids) for doc_ids in legacy_index.values())
+
+    inv_index = inverted_index.InvertedIndex()
+    inv_index.build_from_movies(movies)
+
+    # Tokens appear in both layouts, share them so only the postings are compared
+    seen = set()
+    for token in legacy_index:
+        deep_sizeof(token, seen)
+    legacy_size = deep_sizeof(legacy_index, set(seen)) + \
+        deep_sizeof(legacy_term_frequencies, set(seen))
+    compact_size = deep_sizeof(inv_index.postings, set(seen))
+
+    encoded_size = 0
+    for posting_list in inv_index.postings.values():
+        encoded_doc_ids, encoded_tfs = posting_list.encode()
+        encoded_size += len(encoded_doc_ids) + len(encoded_tfs)
+
+    raw_array_size = posting_count * 2 * array('I').itemsize
+
+    print(
+        f"Corpus: {args.size} docs, {len(legacy_index)} terms, {posting_count} postings")
+    print(f"{'layout':<28} {'total':>12} {'bytes/posting':>14}")
+    for name, size in [
+        ("set + Counter", legacy_size),
+        ("PostingList arrays", compact_size),
+        ("raw array payload", raw_array_size),
+        ("delta + varint on disk", encoded_size),
+    ]:
+        print(f"{name:<28} {format_bytes(size):>12} {size / posting_count:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
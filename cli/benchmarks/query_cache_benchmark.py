@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Query embedding latency with and without the query cache, for a Zipfian
+# stream of repeated queries against a stub encoder with a fixed cost per
+# query. A second run against the same SQLite file shows the disk layer
+# serving a fresh process.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import query_cache  # noqa: E402
+import stub_encoder  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def run(label, embed, queries):
+    start = time.perf_counter()
+    for query in queries:
+        embed(query)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(queries) * 1000:>9.3f} ms/query")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query embedding cache benchmark")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=1000,
+                        help="Distinct queries the stream is drawn from")
+    parser.add_argument("--encode-ms", type=float, default=5.0,
+                        help="Stub encoder cost per query")
+    parser.add_argument("--memory-size", type=int, default=256)
+    args = parser.parse_args()
+
+    # Popular queries repeat, like a real query log
+    distinct = synthetic_corpus.generate_queries(args.distinct, seed=3)
+    cum_weights = synthetic_corpus.zipf_cum_weights(args.distinct)
+    queries = random.Random(5).choices(
+        distinct, cum_weights=cum_weights, k=args.queries)
+
+    encoder = stub_encoder.StubEncoder(seconds_per_text=args.encode_ms / 1000)
+    run("no cache", lambda query: encoder.encode([query])[0], queries)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "query_embeddings.sqlite3")
+        for label in ("cache, cold disk", "cache, warm disk"):
+            cache = query_cache.QueryEmbeddingCache(
+                "stub", encoder.encode, path, memory_size=args.memory_size)
+            run(label, cache.get, queries)
+            print(f"  {cache.stats}")
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# BM25 and semantic search latency with and without the result cache, for a
+# Zipfian stream of repeated queries over a synthetic corpus. Semantic search
+# uses the stub encoder and a memory only query embedding cache, so both runs
+# only differ in the scoring. Run from the project root, the analyzer reads
+# data/stopwords.txt. Embeddings are written to a temporary directory.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inverted_index  # noqa: E402
+from lib import query_cache  # noqa: E402
+from lib import result_cache  # noqa: E402
+from lib import semantic_search  # noqa: E402
+import stub_encoder  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def run(label, search, queries, limit):
+    start = time.perf_counter()
+    results = [search(query, limit) for query in queries]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(queries) * 1000:>9.3f} ms/query")
+    return [[(result["id"], result["score"]) for result in query_results] for query_results in results]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search result cache benchmark")
+    parser.add_argument("--size", type=int, default=20000,
+                        help="Number of synthetic movies")
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=1000,
+                        help="Distinct queries the stream is drawn from")
+    parser.add_argument("--cache-size", type=int, default=256)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    vocabulary_size = synthetic_corpus.scaled_vocabulary_size(args.size)
+    movies = list(synthetic_corpus.generate_movies(args.size, vocabulary_size))
+
+    # Popular queries repeat, like a real query log
+    distinct = synthetic_corpus.generate_queries(args.distinct, vocabulary_size, seed=3)
+    cum_weights = synthetic_corpus.zipf_cum_weights(args.distinct)
+    queries = random.Random(5).choices(
+        distinct, cum_weights=cum_weights, k=args.queries)
+
+    inv_index = inverted_index.InvertedIndex()
+    inv_index.build_from_movies(movies)
+
+    # The embedding store is written under cache/ of the working directory
+    project_root = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        semantic = semantic_search.SemanticSearch(stub_encoder.StubEncoder())
+        semantic.query_cache = query_cache.QueryEmbeddingCache(
+            "stub", semantic.model.encode, None, memory_size=args.distinct)
+        semantic.build_embeddings(movies)
+
+        for name, engine, search in (("BM25", inv_index, inv_index.bm25_search),
+                                     ("semantic", semantic, semantic.search)):
+            engine.result_cache = result_cache.ResultCache(0)
+            uncached = run(f"{name}, no cache", search, queries, args.limit)
+            engine.result_cache = result_cache.ResultCache(args.cache_size)
+            cached = run(f"{name}, cache", search, queries, args.limit)
+            print(f"  {engine.result_cache.stats}")
+            print(f"  Identical results: {uncached == cached}")
+        os.chdir(project_root)
+
+
+if __name__ == "__main__":
+    main()
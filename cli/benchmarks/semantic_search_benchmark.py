@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Query latency of the vectorized semantic search versus the per-row cosine
+# loop it replaced, on random embeddings of growing corpus sizes. Also reports
+# batch throughput and checks both paths return the same documents.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import vector_engine  # noqa: E402
+
+# all-MiniLM-L6-v2 embedding size
+DIMENSION = 384
+
+# Rows generated at a time, so no float64 copy of the corpus is ever made
+GENERATE_BLOCK_SIZE = 100_000
+
+
+def random_embeddings(count, dimension, seed):
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((count, dimension), dtype=np.float32)
+    for start in range(0, count, GENERATE_BLOCK_SIZE):
+        stop = min(start + GENERATE_BLOCK_SIZE, count)
+        matrix[start:stop] = rng.standard_normal(
+            (stop - start, dimension), dtype=np.float32)
+    return matrix
+
+
+def cosine_similarity(vec1, vec2):
+    dot_product = np.dot(vec1, vec2)
+    norm1 = np.linalg.norm(vec1)
+    norm2 = np.linalg.norm(vec2)
+
+    if norm1 == 0 or norm2 == 0:
+        return 0.0
+
+    return dot_product / (norm1 * norm2)
+
+
+# SemanticSearch.search as it was: a cosine per row, then a full sort
+def legacy_search(embeddings, query, limit):
+    similarity_tuples = []
+    for index, doc_embedding in enumerate(embeddings):
+        similarity_tuples.append(
+            (cosine_similarity(query, doc_embedding), index))
+
+    similarity_tuples.sort(key=lambda tuple: tuple[0], reverse=True)
+    return [index for _, index in similarity_tuples[:limit]]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Semantic search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10_000, 100_000, 1_000_000], help="Corpus sizes")
+    parser.add_argument("--queries", type=int, default=64,
+                        help="Queries per size")
+    parser.add_argument("--legacy-queries", type=int, default=3,
+                        help="Queries timed with the per-row loop")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    queries = random_embeddings(args.queries, DIMENSION, seed=1)
+
+    print(f"{'docs':>9} {'legacy ms':>10} {'single ms':>10} {'batch qps':>10} {'speedup':>9} {'same':>5}")
+    for size in args.sizes:
+        # Normalized in place, the benchmark only holds one copy of the corpus
+        matrix = vector_engine.normalize_rows(
+            random_embeddings(size, DIMENSION, seed=size), copy=False)
+
+        legacy_count = min(args.legacy_queries, args.queries)
+        start = time.perf_counter()
+        legacy_results = [legacy_search(matrix, query, args.limit)
+                          for query in queries[:legacy_count]]
+        legacy_ms = (time.perf_counter() - start) / max(legacy_count, 1) * 1000
+
+        start = time.perf_counter()
+        single_results = [vector_engine.search(matrix, query, args.limit)[0][0]
+                          for query in queries]
+        single_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        start = time.perf_counter()
+        batch_results, _ = vector_engine.search(matrix, queries, args.limit)
+        batch_qps = len(queries) / (time.perf_counter() - start)
+
+        same = all(legacy == single.tolist() == batch.tolist()
+                   for legacy, single, batch
+                   in zip(legacy_results, single_results, batch_results))
+
+        print(f"{size:>9} {legacy_ms:>10.1f} {single_ms:>10.2f} {batch_qps:>10.0f} {legacy_ms / single_ms:>8.0f}x {str(same):>5}")
+        del matrix
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Startup time of semantic_search_cli.py per subcommand, measured in fresh
+# interpreters with `python -X importtime`. Commands that never touch the model
+# must not import numpy, sentence_transformers or torch. Exits non-zero on a
+# regression, so it can guard CI. Run from the project root.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CLI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_PATH = os.path.join(CLI_DIR, "semantic_search_cli.py")
+
+HEAVY_MODULES = ("numpy", "sentence_transformers", "torch")
+
+# (label, argv, heavy imports allowed). The model commands are only timed up
+# to argument parsing, running them would load the model.
+COMMANDS = [
+    ("--help", ["--help"], False),
+    ("chunk", ["chunk", "one two three four five six", "--chunk-size", "2"], False),
+    ("semantic_chunk", ["semantic_chunk", "One. Two! Three? Four."], False),
+    ("search --help", ["search", "--help"], False),
+    ("import lib.semantic_search", None, True),
+]
+
+
+# Wall time in ms, total import time in ms and the top level modules imported
+def run_once(argv):
+    if argv is None:
+        command = [sys.executable, "-X", "importtime", "-c",
+                   "from lib import semantic_search"]
+    else:
+        command = [sys.executable, "-X", "importtime", CLI_PATH] + argv
+
+    start = time.perf_counter_ns()
+    result = subprocess.run(command, cwd=CLI_DIR, capture_output=True, text=True)
+    wall_ms = (time.perf_counter_ns() - start) / 1e6
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{result.stderr}")
+
+    import_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip().split(".")[0])
+        # Only top level imports, nested ones are in their parent's cumulative
+        if not name.startswith("  "):
+            import_us += int(cumulative)
+
+    return wall_ms, import_us / 1000, modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI startup benchmark")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Interpreter launches per command")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if a light command's median wall time exceeds this")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'command':<28} {'wall ms':>8} {'import ms':>10}  heavy imports")
+    for label, argv, heavy_allowed in COMMANDS:
+        runs = [run_once(argv) for _ in range(args.runs)]
+        wall_ms = statistics.median(run[0] for run in runs)
+        import_ms = statistics.median(run[1] for run in runs)
+        heavy = sorted(set(HEAVY_MODULES) & runs[0][2])
+
+        print(f"{label:<28} {wall_ms:>8.1f} {import_ms:>10.1f}  {', '.join(heavy) or '-'}")
+
+        if not heavy_allowed:
+            if heavy:
+                failures.append(f"{label} imports {', '.join(heavy)}")
+            if args.max_ms is not None and wall_ms > args.max_ms:
+                failures.append(f"{label} took {wall_ms:.1f} ms")
+        elif "torch" in heavy or "sentence_transformers" in heavy:
+            failures.append(f"{label} imports the model at import time")
+
+    for failure in failures:
+        print(f"Regression: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+# Peak memory of reading the corpus with json.load versus the streaming
+# document source, for growing corpus sizes. Only the reading is measured,
+# each movie is dropped as soon as it is seen.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import document_source  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def peak_memory(read):
+    tracemalloc.start()
+    count = read()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, peak
+
+
+def read_json_load(path):
+    with open(path, 'r') as f:
+        return sum(1 for _ in json.load(f)["movies"])
+
+
+def read_streaming(path):
+    return sum(1 for _ in document_source.iter_movies(path))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Streaming ingestion benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000], help="Corpus sizes")
+    args = parser.parse_args()
+
+    print(f"{'docs':>8} {'file MB':>8} {'json.load peak MB':>18} {'streaming peak MB':>18}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = os.path.join(directory, f"movies_{size}.json")
+            synthetic_corpus.write_movies_json(path, size)
+
+            _, json_peak = peak_memory(lambda: read_json_load(path))
+            _, streaming_peak = peak_memory(lambda: read_streaming(path))
+
+            print(f"{size:>8} {os.path.getsize(path) / 2**20:>8.1f} {json_peak / 2**20:>18.1f} {streaming_peak / 2**20:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import hashlib
+import time
+
+import numpy as np
+
+
+# Offline stand-in for SentenceTransformer. Each text gets a deterministic
+# random vector seeded by its hash, and encode() sleeps to stand in for the
+# model's cost: per text, and per token of the batch padded to its longest
+# text (words standing in for tokens).
+class StubEncoder:
+    def __init__(self, dimension: int = 384, seconds_per_text: float = 0.0, seconds_per_token: float = 0.0) -> None:
+        self.dimension = dimension
+        self.seconds_per_text = seconds_per_text
+        self.seconds_per_token = seconds_per_token
+        self.max_seq_length = 256
+        self.encoded_texts = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, **kwargs):
+        padded_tokens = len(texts) * max((len(text.split()) for text in texts), default=0)
+        cost = self.seconds_per_text * len(texts) + self.seconds_per_token * padded_tokens
+        if cost:
+            time.sleep(cost)
+        self.encoded_texts += len(texts)
+
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(
+                text.encode(), digest_size=8).digest())
+            embeddings[row] = np.random.default_rng(seed).standard_normal(
+                self.dimension, dtype=np.float32)
+        return embeddings
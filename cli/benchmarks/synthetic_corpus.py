@@ -0,0 +1,122 @@
+import itertools
+import json
+import random
+
+import numpy as np
+
+# Syllables used to make up pseudo words. Pseudo words keep the corpus free of
+# stop words and give the stemmer realistic-looking input.
+SYLLABLES = [
+    "ka", "lo", "mi", "ra", "ten", "vor", "shi", "dun", "bel", "qua",
+    "zor", "pe", "ix", "nal", "gri", "tho", "su", "mex", "fa", "run",
+]
+SUFFIXES = ["", "", "", "s", "ing", "ed", "er", "ly"]
+
+DEFAULT_VOCABULARY_SIZE = 20000
+
+
+# Build a deterministic vocabulary of unique pseudo words.
+def make_vocabulary(size: int, seed: int = 42) -> list[str]:
+    rng = random.Random(seed)
+    vocabulary = []
+    seen = set()
+    while len(vocabulary) < size:
+        syllable_count = rng.randint(2, 4)
+        word = "".join(rng.choice(SYLLABLES) for _ in range(syllable_count))
+        word += rng.choice(SUFFIXES)
+        if word not in seen:
+            seen.add(word)
+            vocabulary.append(word)
+
+    return vocabulary
+
+
+# Cumulative Zipf weights, so that word rank r is drawn with probability ~ 1 / r^s
+def zipf_cum_weights(size: int, exponent: float = 1.1) -> list[float]:
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, size + 1)))
+
+
+# Vocabulary size that grows with the corpus like a real one, following Heaps'
+# law V = K * n^beta over the ~60 words of a movie, and never below
+# DEFAULT_VOCABULARY_SIZE
+def scaled_vocabulary_size(count: int, k: float = 30.0, beta: float = 0.5) -> int:
+    return max(DEFAULT_VOCABULARY_SIZE, int(k * (count * 60) ** beta))
+
+
+# Generate synthetic movies shaped like the entries of data/movies.json
+def generate_movies(count: int, vocabulary_size: int = DEFAULT_VOCABULARY_SIZE, seed: int = 42):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    cum_weights = zipf_cum_weights(vocabulary_size)
+
+    for movie_id in range(1, count + 1):
+        title_words = rng.choices(
+            vocabulary, cum_weights=cum_weights, k=rng.randint(1, 4))
+
+        # Descriptions are a few sentences so that the sentence chunker has work to do.
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            words = rng.choices(vocabulary, cum_weights=cum_weights,
+                                k=rng.randint(5, 20))
+            sentences.append(" ".join(words).capitalize() + ".")
+
+        yield {
+            "id": movie_id,
+            "title": " ".join(title_words).title(),
+            "description": " ".join(sentences),
+        }
+
+
+# Sample queries from the same Zipfian vocabulary as the corpus
+def generate_queries(count: int, vocabulary_size: int = DEFAULT_VOCABULARY_SIZE, min_terms: int = 1, max_terms: int = 4, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size)
+    cum_weights = zipf_cum_weights(vocabulary_size)
+
+    return [
+        " ".join(rng.choices(vocabulary, cum_weights=cum_weights,
+                 k=rng.randint(min_terms, max_terms)))
+        for _ in range(count)
+    ]
+
+
+# Embedding-like float32 vectors grouped around `topics` random centers, so an
+# ANN index has structure to find. Vectors with the same topic_seed share the
+# centers, e.g. a corpus and its queries drawn with different seeds.
+def generate_embeddings(count: int, dimension: int = 384, topics: int = 1000, spread: float = 2.0,
+                        seed: int = 0, topic_seed: int = 0, block_size: int = 100_000):
+    centers = np.random.default_rng(topic_seed).standard_normal(
+        (topics, dimension), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    embeddings = np.empty((count, dimension), dtype=np.float32)
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+        block = embeddings[start:stop]
+        block[:] = rng.standard_normal((stop - start, dimension), dtype=np.float32)
+        block *= spread
+        block += centers[rng.integers(topics, size=stop - start)]
+    return embeddings
+
+
+# Write a synthetic corpus in the same {"movies": [...]} layout as data/movies.json
+def write_movies_json(path: str, count: int, vocabulary_size: int = DEFAULT_VOCABULARY_SIZE, seed: int = 42):
+    with open(path, 'w') as f:
+        json.dump(
+            {"movies": list(generate_movies(count, vocabulary_size, seed))}, f)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic movie corpus")
+    parser.add_argument("path", type=str, help="Output path")
+    parser.add_argument("--count", type=int, default=10000,
+                        help="Number of movies")
+    parser.add_argument("--vocabulary-size", type=int,
+                        default=DEFAULT_VOCABULARY_SIZE, help="Vocabulary size")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    args = parser.parse_args()
+
+    write_movies_json(args.path, args.count, args.vocabulary_size, args.seed)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# Compare exhaustive and WAND top-k BM25 retrieval on a synthetic corpus.
+# Reports latency, how many postings WAND skipped, and checks both modes
+# return identical results. Run from the project root.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bm25_engine  # noqa: E402
+import inverted_index  # noqa: E402
+import synthetic_corpus  # noqa: E402
+
+
+def run_mode(inv_index, queries, limit, mode):
+    results = []
+    postings = 0
+    skipped = 0
+
+    start = time.perf_counter()
+    for query in queries:
+        stats = {}
+        hits = inv_index.bm25_search(query, limit, mode=mode, stats=stats)
+        results.append([(hit["id"], hit["score"]) for hit in hits])
+        postings += stats["postings"]
+        skipped += stats["skipped"]
+    elapsed = time.perf_counter() - start
+
+    return results, elapsed / len(queries), postings, skipped
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="WAND top-k benchmark")
+    parser.add_argument("--size", type=int, default=20000,
+                        help="Number of synthetic movies")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="Number of queries")
+    parser.add_argument("--min-terms", type=int, default=4,
+                        help="Minimum number of terms per query")
+    parser.add_argument("--max-terms", type=int, default=10,
+                        help="Maximum number of terms per query")
+    parser.add_argument("--limit", type=int, default=10, help="Top-k size")
+    args = parser.parse_args()
+
+    inv_index = inverted_index.InvertedIndex()
+    inv_index.build_from_movies(synthetic_corpus.generate_movies(args.size))
+    queries = synthetic_corpus.generate_queries(
+        args.queries, min_terms=args.min_terms, max_terms=args.max_terms)
+
+    exhaustive_results, exhaustive_latency, postings, _ = run_mode(
+        inv_index, queries, args.limit, bm25_engine.EXHAUSTIVE)
+    wand_results, wand_latency, _, skipped = run_mode(
+        inv_index, queries, args.limit, bm25_engine.WAND)
+
+    print(f"Corpus: {args.size} docs, {len(queries)} queries, top {args.limit}")
+    print(f"Exhaustive: {exhaustive_latency * 1000:.3f} ms/query")
+    print(f"WAND:       {wand_latency * 1000:.3f} ms/query")
+    print(
+        f"Postings skipped by WAND: {skipped} of {postings} ({skipped / max(postings, 1):.1%})")
+    print(f"Identical results: {exhaustive_results == wand_results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import bisect
+import heapq
+import math
+
+import search_utils
+
+# Top-k strategies selectable from bm25_search
+EXHAUSTIVE = "exhaustive"
+WAND = "wand"
+SEARCH_MODES = (EXHAUSTIVE, WAND)
+
+# Slack for comparing an upper bound summed in one order against a score
+# summed in another. Keeps pruning safe against the last bit of rounding.
+UPPER_BOUND_EPSILON = 1e-12
+
+
+# BM25 saturated term frequency component. Shared by the index build and the
+# query helpers so precomputed weights match on-the-fly scores exactly.
+def bm25_tf(raw_tf: int, doc_length: int, avg_doc_length: float, k1: float = search_utils.BM25_K1, b: float = search_utils.BM25_B) -> float:
+    length_norm = 1 - b + b * (doc_length / avg_doc_length)
+
+    # (tf × (k1 + 1)) / (tf + k1 × length_norm)
+    return (raw_tf * (k1 + 1)) / (raw_tf + k1 * length_norm)
+
+
+# log((N - df + 0.5) / (df + 0.5) + 1)
+def bm25_idf(doc_count: int, term_doc_count: int) -> float:
+    return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+
+
+# Rank key used by every top-k path. Highest score first, ties broken by the
+# smaller doc id so results are deterministic.
+def rank_key(item: tuple[int, float]):
+    return (item[1], -item[0])
+
+
+# Sum the precomputed impacts of every posting and keep the best `limit` documents.
+# `postings_lists` holds one (doc_ids, weights) pair per query token.
+def exhaustive_top_k(postings_lists, limit: int, stats: dict | None = None) -> list[tuple[int, float]]:
+    if stats is not None:
+        total = sum(len(doc_ids) for doc_ids, _ in postings_lists)
+        stats.update(postings=total, scored=total, skipped=0)
+
+    scores = {}
+    for doc_ids, weights in postings_lists:
+        for doc_id, weight in zip(doc_ids, weights):
+            scores[doc_id] = scores.get(doc_id, 0) + weight
+
+    # Bounded heap instead of sorting every matching document.
+    return heapq.nlargest(limit, scores.items(), key=rank_key)
+
+
+# WAND top-k. Walks doc-id-sorted postings and only scores a document when the
+# upper bounds of the terms that can still match it beat the current k-th score.
+# `upper_bounds` holds the max weight of each postings list. Returns the same
+# documents and scores as exhaustive_top_k.
+def wand_top_k(postings_lists, upper_bounds, limit: int, stats: dict | None = None) -> list[tuple[int, float]]:
+    total = sum(len(doc_ids) for doc_ids, _ in postings_lists)
+    scored = 0
+
+    # Cursor: [position, doc_ids, weights, upper_bound, query_order]
+    cursors = [
+        [0, doc_ids, weights, upper_bound, order]
+        for order, ((doc_ids, weights), upper_bound) in enumerate(zip(postings_lists, upper_bounds))
+        if len(doc_ids) > 0
+    ]
+
+    # Min-heap of (score, -doc_id). heap[0] is the current k-th best.
+    heap = []
+    while cursors and limit > 0:
+        cursors.sort(key=lambda cursor: cursor[1][cursor[0]])
+
+        # Threshold a new document has to reach to enter the heap
+        threshold = heap[0][0] if len(heap) >= limit else -math.inf
+
+        # Find the pivot: first cursor where the accumulated upper bounds reach the threshold
+        pivot = None
+        accumulated = 0.0
+        for index, cursor in enumerate(cursors):
+            accumulated += cursor[3]
+            if accumulated * (1 + UPPER_BOUND_EPSILON) >= threshold:
+                pivot = index
+                break
+
+        # No remaining document can make it into the top-k
+        if pivot is None:
+            break
+
+        pivot_doc = cursors[pivot][1][cursors[pivot][0]]
+
+        if cursors[0][1][cursors[0][0]] == pivot_doc:
+            # Every cursor before the pivot sits on the pivot doc. Score it fully,
+            # summing in query order so floats match exhaustive scoring.
+            score = 0
+            for cursor in sorted(cursors, key=lambda cursor: cursor[4]):
+                position = cursor[0]
+                if cursor[1][position] == pivot_doc:
+                    score = score + cursor[2][position]
+                    cursor[0] += 1
+                    scored += 1
+
+            entry = (score, -pivot_doc)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        else:
+            # Documents before the pivot doc can't reach the threshold. Skip them.
+            for cursor in cursors[:pivot]:
+                cursor[0] = bisect.bisect_left(
+                    cursor[1], pivot_doc, lo=cursor[0])
+
+        cursors = [cursor for cursor in cursors if cursor[0] < len(cursor[1])]
+
+    if stats is not None:
+        stats.update(postings=total, scored=scored, skipped=total - scored)
+
+    return sorted(((-negative_doc_id, score) for score, negative_doc_id in heap), key=rank_key, reverse=True)
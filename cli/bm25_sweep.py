@@ -0,0 +1,195 @@
+import numpy as np
+
+import search_utils
+
+# Default grid of the sweep command, including search_utils' setting
+DEFAULT_K1_VALUES = tuple(0.25 * step for step in range(1, 13))
+DEFAULT_B_VALUES = tuple(round(0.05 * step, 2) for step in range(21))
+
+# Rank cutoff of MRR and nDCG
+DEFAULT_DEPTH = 10
+
+# Floats in the intermediate arrays of one scoring or ranking step. Bounds the
+# memory of a sweep independently of the query set and grid size.
+SWEEP_BLOCK_SIZE = 1 << 24
+
+
+# Relevance judgments of a TREC qrels file, "query_id iteration doc_id
+# relevance" per line, as {query id: {doc id: relevance}}
+def read_qrels(path: str) -> dict[str, dict[int, int]]:
+    qrels = {}
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, start=1):
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 4:
+                raise ValueError(f"Line {number} of {path}: expected 4 fields, found {len(fields)}")
+            query_id, _, doc_id, relevance = fields
+            qrels.setdefault(query_id, {})[int(doc_id)] = int(relevance)
+    return qrels
+
+
+# BM25 over a grid of (k1, b) values for a fixed query set, scored against
+# statistics gathered from the index once. Every posting of every query term
+# becomes one entry of flat tf, length ratio and idf arrays, so a setting is
+# a few array expressions and a bincount instead of a bm25_search per query.
+# Only queries with a relevant judgment in `qrels` are gathered. Scores and
+# tie breaks match bm25_search exactly.
+class BM25Sweep:
+    def __init__(self, inv_index, queries, qrels: dict[str, dict[int, int]], depth: int = DEFAULT_DEPTH) -> None:
+        self.depth = depth
+        self.query_ids = []
+
+        # Dense doc length ratios to the average, indexed by doc id
+        doc_ids = np.fromiter(inv_index.doc_lengths.keys(), dtype=np.int64)
+        lengths = np.fromiter(inv_index.doc_lengths.values(), dtype=np.float64, count=len(doc_ids))
+        length_ratios = np.zeros(doc_ids.max() + 1 if len(doc_ids) else 0)
+        length_ratios[doc_ids] = lengths / inv_index.avg_doc_length
+
+        # Candidate rows, every document matching a query term, grouped by
+        # query and in doc id order within a query
+        row_doc_ids = []
+        row_starts = [0]
+        posting_rows = []
+        posting_tfs = []
+        posting_idfs = []
+        # Judged relevant candidate rows and their gains
+        relevant_rows = []
+        relevant_gains = []
+        ideal_dcgs = []
+        for query_id, query in queries:
+            judgments = qrels.get(str(query_id), {})
+            gains = sorted((relevance for relevance in judgments.values() if relevance > 0), reverse=True)
+            if not gains:
+                continue
+            self.query_ids.append(query_id)
+            ideal_dcgs.append(sum(gain / np.log2(rank + 1)
+                                  for rank, gain in enumerate(gains[:depth], start=1)))
+
+            # The tokens bm25_search scores, repeated ones included
+            tokens = [token for token in inv_index.analyzer.analyze(query)
+                      if token in inv_index.impact_postings]
+            posting_lists = [inv_index.postings[token] for token in tokens]
+            token_doc_ids = [np.asarray(posting_list.doc_ids, dtype=np.int64) for posting_list in posting_lists]
+            candidates = np.unique(np.concatenate(token_doc_ids)) if tokens else np.empty(0, dtype=np.int64)
+
+            first_row = row_starts[-1]
+            for token, posting_list, posting_doc_ids in zip(tokens, posting_lists, token_doc_ids):
+                posting_rows.append(first_row + np.searchsorted(candidates, posting_doc_ids))
+                posting_tfs.append(np.asarray(posting_list.tfs, dtype=np.float64))
+                posting_idfs.append(np.full(len(posting_doc_ids), inv_index.idf[token]))
+            for offset, doc_id in enumerate(candidates.tolist()):
+                relevance = judgments.get(doc_id, 0)
+                if relevance > 0:
+                    relevant_rows.append(first_row + offset)
+                    relevant_gains.append(relevance)
+            row_doc_ids.append(candidates)
+            row_starts.append(first_row + len(candidates))
+
+        self.row_count = row_starts[-1]
+        self.row_doc_ids = np.concatenate(row_doc_ids) if row_doc_ids else np.empty(0, dtype=np.int64)
+        self.row_queries = np.repeat(np.arange(len(self.query_ids)), np.diff(row_starts))
+        self.row_starts = np.asarray(row_starts, dtype=np.int64)
+        self.posting_rows = np.concatenate(posting_rows) if posting_rows else np.empty(0, dtype=np.int64)
+        self.posting_tfs = np.concatenate(posting_tfs) if posting_tfs else np.empty(0)
+        self.posting_idfs = np.concatenate(posting_idfs) if posting_idfs else np.empty(0)
+        self.posting_length_ratios = length_ratios[self.row_doc_ids[self.posting_rows]]
+        self.relevant_rows = np.asarray(relevant_rows, dtype=np.int64)
+        self.relevant_gains = np.asarray(relevant_gains, dtype=np.float64)
+        self.relevant_queries = self.row_queries[self.relevant_rows]
+        self.ideal_dcgs = np.asarray(ideal_dcgs)
+
+    @property
+    def posting_count(self) -> int:
+        return len(self.posting_rows)
+
+    # Candidate scores for each of `k1_values` at `b`, a (len(k1_values),
+    # row_count) matrix. Summed in query token order like bm25_search.
+    def scores(self, k1_values, b: float):
+        k1 = np.asarray(k1_values, dtype=np.float64)[:, None]
+        tfs = self.posting_tfs
+        length_norms = 1 - b + b * self.posting_length_ratios
+        weights = tfs * (k1 + 1) / (tfs + k1 * length_norms) * self.posting_idfs
+
+        bins = self.posting_rows + self.row_count * np.arange(len(k1))[:, None]
+        return np.bincount(bins.ravel(), weights.ravel(),
+                           minlength=len(k1) * self.row_count).reshape(len(k1), self.row_count)
+
+    # Top `limit` (doc id, score) of every query at one setting, as
+    # bm25_search would rank them
+    def top_k(self, k1: float = search_utils.BM25_K1, b: float = search_utils.BM25_B, limit: int = DEFAULT_DEPTH):
+        scores = self.scores([k1], b)[0]
+        results = []
+        for start, end in zip(self.row_starts[:-1], self.row_starts[1:]):
+            # Stable, so equal scores stay in doc id order
+            order = start + np.argsort(-scores[start:end], kind="stable")[:limit]
+            results.append(list(zip(self.row_doc_ids[order].tolist(), scores[order].tolist())))
+        return results
+
+    # MRR and nDCG at `depth` of every (k1, b) setting, averaged over the
+    # judged queries, as a list of {"k1", "b", "mrr", "ndcg"}. Settings are
+    # scored a block of k1 values at a time by broadcasting.
+    def evaluate(self, k1_values=DEFAULT_K1_VALUES, b_values=DEFAULT_B_VALUES) -> list[dict]:
+        k1_values = np.asarray(k1_values, dtype=np.float64)
+        block = max(1, SWEEP_BLOCK_SIZE // max(self.posting_count, self.row_count, 1))
+
+        results = []
+        for b in b_values:
+            for start in range(0, len(k1_values), block):
+                k1_block = k1_values[start:start + block]
+                ranks = self.__relevant_ranks(self.scores(k1_block, b))
+                for k1, mrr, ndcg in zip(k1_block, *self.__metrics(ranks)):
+                    results.append({"k1": float(k1), "b": float(b), "mrr": mrr, "ndcg": ndcg})
+        return results
+
+    # Rank of every judged relevant candidate under each row of `scores`,
+    # counting the candidates of its query that outrank it. Compares each
+    # relevant row against its query's candidates, chunked by relevant rows.
+    def __relevant_ranks(self, scores):
+        ranks = np.ones((len(scores), len(self.relevant_rows)), dtype=np.int64)
+        starts = self.row_starts[self.relevant_queries]
+        counts = self.row_starts[self.relevant_queries + 1] - starts
+        pair_ends = np.cumsum(counts)
+        chunk_pairs = max(1, SWEEP_BLOCK_SIZE // len(scores))
+
+        first = 0
+        while first < len(self.relevant_rows):
+            # Relevant rows whose candidates fit the chunk, at least one
+            done = pair_ends[first - 1] if first > 0 else 0
+            last = max(first + 1, int(np.searchsorted(pair_ends, done + chunk_pairs, side="right")))
+            chunk_counts = counts[first:last]
+            pair_starts = np.cumsum(chunk_counts) - chunk_counts
+            owners = np.repeat(np.arange(first, last), chunk_counts)
+            others = (np.arange(chunk_counts.sum()) - np.repeat(pair_starts, chunk_counts)
+                      + np.repeat(starts[first:last], chunk_counts))
+            own_rows = self.relevant_rows[owners]
+
+            own_scores = scores[:, own_rows]
+            other_scores = scores[:, others]
+            # Rows are in doc id order within a query, so the smaller row wins a tie
+            outranks = (other_scores > own_scores) | ((other_scores == own_scores) & (others < own_rows))
+            ranks[:, first:last] += np.add.reduceat(outranks, pair_starts, axis=1, dtype=np.int64)
+            first = last
+
+        return ranks
+
+    # (MRR, nDCG) lists of `ranks`, one entry per row
+    def __metrics(self, ranks):
+        query_count = len(self.query_ids)
+        if query_count == 0:
+            return [0.0] * len(ranks), [0.0] * len(ranks)
+
+        in_depth = ranks <= self.depth
+        reciprocal_ranks = np.where(in_depth, 1.0 / ranks, 0.0)
+        gains = np.where(in_depth, self.relevant_gains / np.log2(ranks + 1), 0.0)
+
+        mrrs = []
+        ndcgs = []
+        for row_reciprocal_ranks, row_gains in zip(reciprocal_ranks, gains):
+            best = np.zeros(query_count)
+            np.maximum.at(best, self.relevant_queries, row_reciprocal_ranks)
+            dcgs = np.bincount(self.relevant_queries, row_gains, minlength=query_count)
+            mrrs.append(float(best.mean()))
+            ndcgs.append(float((dcgs / self.ideal_dcgs).mean()))
+        return mrrs, ndcgs
@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bm25_engine
+
+# Fusion methods selectable from HybridSearch.search
+RRF = "rrf"
+WEIGHTED = "weighted"
+FUSION_METHODS = (RRF, WEIGHTED)
+
+RRF_K = 60  # Reciprocal rank fusion damping constant
+
+# Weight of the BM25 scores in weighted fusion, the semantic scores get the rest
+DEFAULT_ALPHA = 0.5
+
+# Results fetched from each branch before fusing. Raised to the limit if smaller.
+DEFAULT_CANDIDATES = 50
+
+
+# Reciprocal rank fusion of ranked result lists. A document scores
+# sum(1 / (k + rank)) over the lists it appears in, ranks starting at 1. Ties
+# go to the document first seen, in list order. Each result is a copy of the
+# document with the fused score in "score".
+def reciprocal_rank_fusion(result_lists, limit: int, k: int = RRF_K) -> list[dict]:
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            doc_id = result["id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank)
+            documents.setdefault(doc_id, result)
+
+    return _ranked(scores, documents, limit)
+
+
+# Weighted sum of min-max normalized scores. Each list's scores are scaled to
+# [0, 1], all 1 if they're equal, so BM25 and cosine scores are comparable. A
+# document missing from a list gets 0 from it.
+def weighted_score_fusion(result_lists, weights, limit: int) -> list[dict]:
+    scores = {}
+    documents = {}
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+
+        low = min(result["score"] for result in results)
+        span = max(result["score"] for result in results) - low
+        for result in results:
+            doc_id = result["id"]
+            normalized = (result["score"] - low) / span if span > 0 else 1.0
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight * normalized
+            documents.setdefault(doc_id, result)
+
+    return _ranked(scores, documents, limit)
+
+
+# Fuse (BM25, semantic) result lists with `method`
+def fuse(result_lists, limit: int, method: str = RRF, alpha: float = DEFAULT_ALPHA, k: int = RRF_K) -> list[dict]:
+    match method:
+        case "rrf":
+            return reciprocal_rank_fusion(result_lists, limit, k)
+        case "weighted":
+            return weighted_score_fusion(result_lists, (alpha, 1 - alpha), limit)
+        case _:
+            raise ValueError(f"Unknown fusion method: {method}")
+
+
+def _ranked(scores, documents, limit):
+    # sorted is stable, so equal scores keep first seen order
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [{**documents[doc_id], "score": score} for doc_id, score in ranked[:limit]]
+
+
+# BM25 and semantic retrieval fused into one ranking. Both branches run
+# concurrently, each only fetching its best `candidates` documents.
+class HybridSearch:
+    def __init__(self, inv_index, semantic_search, candidates: int = DEFAULT_CANDIDATES) -> None:
+        self.inv_index = inv_index
+        self.semantic_search = semantic_search
+        self.candidates = candidates
+
+        # BM25 is pure Python, the semantic branch mostly numpy and torch,
+        # which release the GIL, so the branches overlap on threads
+        self.__pool = ThreadPoolExecutor(2)
+
+    # Fused top `limit` results. Pass a dict as `timings` to get the time of
+    # each branch, the fusion and the whole search back, in ms, and the number
+    # of candidates each branch returned.
+    def search(self, query: str, limit: int, method: str = RRF, alpha: float = DEFAULT_ALPHA,
+               mode: str = bm25_engine.EXHAUSTIVE, timings: dict | None = None) -> list[dict]:
+        if method not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method: {method}")
+
+        start = time.perf_counter()
+        candidates = max(limit, self.candidates)
+        bm25_branch = self.__pool.submit(
+            _timed, lambda: self.inv_index.bm25_search(query, candidates, mode))
+        semantic_branch = self.__pool.submit(
+            _timed, lambda: self.semantic_search.search(query, candidates))
+        bm25_results, bm25_ms = bm25_branch.result()
+        semantic_results, semantic_ms = semantic_branch.result()
+
+        results, fusion_ms = _timed(lambda: fuse(
+            [bm25_results, semantic_results], limit, method, alpha))
+
+        if timings is not None:
+            timings["bm25_ms"] = bm25_ms
+            timings["semantic_ms"] = semantic_ms
+            timings["fusion_ms"] = fusion_ms
+            timings["total_ms"] = (time.perf_counter() - start) * 1000
+            timings["bm25_candidates"] = len(bm25_results)
+            timings["semantic_candidates"] = len(semantic_results)
+
+        return results
+
+    def close(self):
+        self.__pool.shutdown()
+
+
+# (result, elapsed ms) of calling `function`
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
@@ -1,36 +1,117 @@
-from collections import Counter
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import itertools
 import json
-import math
 import os
-import pickle
-import keyword_search
+import tempfile
+import threading
+from lib import document_source
+from lib import document_store
+from lib import result_cache
+import analyzer
+import bm25_engine
+import postings
+import query_engine
 import search_utils
+import segment
+
+# The manifest lists the segment files, their tombstones and the live document stats
+INDEX_MANIFEST_PATH = "cache/index.json"
+INDEX_SEGMENT_PATH_PATTERN = "cache/index-{}.seg"
+
+# Delta segments allowed before save() starts a background merge
+MAX_DELTA_SEGMENTS = 4
+
+# Terms whose merged multi-segment postings are kept between queries
+MERGED_POSTINGS_CACHE_SIZE = 1024
+
+# Number of documents analyzed together during build. Also the shard size of
+# a parallel build.
+BUILD_BATCH_SIZE = 1000
+
+# Analyzer of a parallel build worker process
+_worker_analyzer = None
+
+
+def _init_build_worker(stop_words_path: str):
+    global _worker_analyzer
+    _worker_analyzer = analyzer.Analyzer(stop_words_path)
+
+
+# Index one shard of (doc_id, text) pairs in a worker process. Returns a partial
+# index, token -> PostingList with positions and doc id -> doc length, both in
+# shard order.
+def _index_shard(shard):
+    partial_postings = {}
+    partial_doc_lengths = {}
+
+    batch_tokens = _worker_analyzer.analyze_many(text for _, text in shard)
+    for (doc_id, _), tokens in zip(shard, batch_tokens):
+        partial_doc_lengths[doc_id] = len(tokens)
+
+        for token, positions in postings.token_positions(tokens).items():
+            posting_list = partial_postings.get(token)
+            if posting_list is None:
+                posting_list = partial_postings[token] = postings.PostingList()
+            posting_list.append(doc_id, len(positions), positions)
+
+    return partial_postings, partial_doc_lengths
 
 
 class InvertedIndex:
-    def __init__(self) -> None:
-        self.index = {}
+    def __init__(self, text_analyzer: analyzer.Analyzer | None = None) -> None:
+        # Shared by build and query paths so both tokenize the same way
+        self.analyzer = text_analyzer or analyzer.default_analyzer()
+
+        # token -> PostingList of doc ids, term frequencies and positions
+        self.postings = {}
+        # doc id -> movie, read from disk a document at a time once built or loaded
         self.docmap = {}
-        self.term_frequencies = {}
         self.doc_lengths = {}
 
-    # Save document ids for a given text separated into tokens.
-    def __add_document(self, doc_id: int, text: str):
-        # Tokenize the text
-        tokens = keyword_search.process_text(text)
-
+        # BM25 statistics. Fixed at build time so queries never recompute them.
+        self.avg_doc_length = 0.0
+        self.idf = {}
+        # token -> (doc_ids, weights), doc ids ascending, weights are precomputed BM25 scores
+        self.impact_postings = {}
+        # token -> largest weight in its impact postings. Upper bound for WAND.
+        self.max_impacts = {}
+
+        # Segments making up the index, oldest first. A built or merged index is
+        # a single segment, incremental updates add delta segments.
+        self.segments = []
+        # Live document stats, maintained incrementally by updates
+        self.doc_count = 0
+        self.total_doc_length = 0
+        # Bumped whenever the searchable contents may have changed, so results
+        # cached under an older generation are never served
+        self.generation = 0
+        # bm25_search top k by analyzed query tokens, limit and generation
+        self.result_cache = result_cache.ResultCache()
+
+        self.__next_segment = 0
+        # Segment files being written by a background merge
+        self.__pending_paths = set()
+        # Held from a merge's snapshot until its segment replaces the merged
+        # ones, so merges never overlap
+        self.__merging = threading.Lock()
+        self.__merged_postings = OrderedDict()
+        self.__lock = threading.RLock()
+
+    # Save document ids for a given document already separated into tokens.
+    def __add_document(self, doc_id: int, tokens: list[str]):
         # Save doc length
         self.doc_lengths[doc_id] = len(tokens)
 
-        # Add each token to the index with a set of document ids
-        for token in tokens:
-            doc_id_set = self.index.setdefault(token, set())
-            doc_id_set.add(doc_id)
-
-        # Add term frequency
-        counter_for_token = self.term_frequencies.setdefault(
-            doc_id, Counter())
-        counter_for_token.update(tokens)
+        # Add a (doc id, term frequency, positions) posting for each distinct
+        # token. Positions count analyzed tokens, so stop words take none.
+        for token, positions in postings.token_positions(tokens).items():
+            posting_list = self.postings.get(token)
+            if posting_list is None:
+                posting_list = self.postings[token] = postings.PostingList()
+            posting_list.append(doc_id, len(positions), positions)
 
     # Get the average doc length
     def __get_avg_doc_length(self) -> float:
@@ -47,38 +128,43 @@ class InvertedIndex:
 
     # Get documents for a given token sorted in ascending order
     def get_documents(self, term: str) -> list[int]:
-        doc_ids = self.index.get(term, set())
+        posting_list = self.postings.get(term)
+        if posting_list is None:
+            return []
 
-        doc_ids_list = list(doc_ids)
-        doc_ids_list.sort()
-
-        return doc_ids_list
+        # Posting lists are already sorted by doc id
+        return posting_list.doc_ids.tolist()
 
     # Get term frequencies
     def get_tf(self, doc_id: str, term: str) -> int:
-        counter = self.term_frequencies[int(doc_id)]
-        return counter[term]
+        doc_id = int(doc_id)
+        if doc_id not in self.doc_lengths:
+            raise KeyError(doc_id)
+
+        posting_list = self.postings.get(term)
+        if posting_list is None:
+            return 0
+        return posting_list.tf(doc_id)
 
     # Get BM 25 idf
     def get_bm25_idf(self, term: str) -> float:
-
-        # df
-        tokens = keyword_search.process_text(term)
+        tokens = self.analyzer.analyze(term)
         if len(tokens) > 1:
             raise Exception("There must be only one token")
-        term_docs = self.index.get(tokens[0])
-        term_doc_count = len(term_docs)  # This is df
 
-        # N
-        doc_count = len(self.docmap)
+        # Cached at build time
+        idf = self.idf.get(tokens[0])
+        if idf is not None:
+            return idf
 
-        # log((N - df + 0.5) / (df + 0.5) + 1)
-        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+        # df for tokens that are not in the index is 0
+        term_doc_count = len(self.postings.get(tokens[0], ()))
+        return bm25_engine.bm25_idf(len(self.docmap), term_doc_count)
 
     # Get BM 25 tf
     def get_bm25_tf(self, doc_id: int, term: str, k1: float = search_utils.BM25_K1, b: float = search_utils.BM25_B) -> float:
         # Tokenize the term and limit the count to 1
-        tokens = keyword_search.process_text(term)
+        tokens = self.analyzer.analyze(term)
         if len(tokens) > 1:
             raise Exception("There must be only one token")
 
@@ -89,10 +175,8 @@ class InvertedIndex:
         doc_length = self.doc_lengths.get(doc_id)
         if doc_length is None:
             raise Exception("Document not found.")
-        length_norm = 1 - b + b * (doc_length / self.__get_avg_doc_length())
 
-        # (tf × (k1 + 1)) / (tf + k1)
-        return (raw_tf * (k1 + 1)) / (raw_tf + k1 * length_norm)
+        return bm25_engine.bm25_tf(raw_tf, doc_length, self.avg_doc_length, k1, b)
 
     # Get bm25 score
     def bm25(self, doc_id: int, term: str) -> float:
@@ -101,111 +185,477 @@ class InvertedIndex:
 
         return bm25tf * bm25idf
 
-    # BM 25 search
-    def bm25_search(self, query: str, limit: int = 5) -> list[dict]:
-        # Initialize score dict
-        scores_dict = {}
-
-        # Calculate score and populate scores_dict
-        tokens = keyword_search.process_text(query)
-        for token in tokens:
-            doc_ids = self.get_documents(token)
-
-            for doc_id in doc_ids:
-                bm25_score = self.bm25(doc_id, token)
-
-                scores_dict[doc_id] = scores_dict.get(doc_id, 0) + bm25_score
-
-        # Map scores dict to a list of tuples
-        doc_score_tuples = []
-        for doc_id, score in scores_dict.items():
-            doc_score_tuples.append((doc_id, score))
-
-        # Sort the tuple
-        # Sort by score since tuple[1] is bm25 score
-        doc_score_tuples.sort(key=lambda tuple: tuple[1], reverse=True)
-
-        # Prepare the result. Will be a movie doc but with a score attached to it.
-        result = []
-        for doc_score_tuple in doc_score_tuples:
-            movie = self.docmap[doc_score_tuple[0]]
-            score = doc_score_tuple[1]
-            # Add the score attribute to each movie.
-            movie["score"] = score
-            result.append(movie)
-
-        return result[:limit]
-
-    # Build the index. Get all the movies and add them to index and docmap
+    # BM 25 search. `mode` picks exhaustive scoring or WAND pruning, both return
+    # the same results. Pass a dict as `stats` to get posting counters back,
+    # which bypasses the result cache.
+    def bm25_search(self, query: str, limit: int = 5, mode: str = bm25_engine.EXHAUSTIVE, stats: dict | None = None) -> list[dict]:
+        if mode not in bm25_engine.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        # Read before the views, see __refresh_views
+        generation = self.generation
+
+        # Only the impact postings of the query tokens are touched.
+        tokens = [token for token in self.analyzer.analyze(query)
+                  if token in self.impact_postings]
+
+        # Both modes return the same results, so they share cache entries
+        cache_key = (tuple(tokens), limit, generation)
+        doc_score_tuples = self.result_cache.get(cache_key) if stats is None else None
+        if doc_score_tuples is None:
+            postings_lists = [self.impact_postings[token] for token in tokens]
+            if mode == bm25_engine.WAND:
+                upper_bounds = [self.max_impacts[token] for token in tokens]
+                doc_score_tuples = bm25_engine.wand_top_k(
+                    postings_lists, upper_bounds, limit, stats)
+            else:
+                doc_score_tuples = bm25_engine.exhaustive_top_k(
+                    postings_lists, limit, stats)
+            self.result_cache.put(cache_key, doc_score_tuples)
+
+        # Prepare the result. Only the hits are read, each a new movie dict
+        # with the score attached, so the stored documents are never modified.
+        return [{**self.docmap[doc_id], "score": score} for doc_id, score in doc_score_tuples]
+
+    # Boolean search. Terms, "quoted phrases", AND, OR, NOT and parentheses,
+    # see query_engine.parse_query. The matches are ranked by the BM25 score of
+    # the query terms they contain, negated terms left out.
+    def boolean_search(self, query: str, limit: int = 5, default_operator: str = query_engine.OR) -> list[dict]:
+        node = query_engine.parse_query(query, default_operator)
+        evaluator = query_engine.QueryEvaluator(
+            self.analyzer.analyze, self.postings, lambda: sorted(self.doc_lengths))
+
+        matches = evaluator.evaluate(node)
+        if matches is None or len(matches) == 0:
+            return []
+
+        tokens = dict.fromkeys(token for token in evaluator.scored_tokens(node)
+                               if token in self.impact_postings)
+        doc_score_tuples = query_engine.top_k(
+            matches, [self.impact_postings[token] for token in tokens], limit)
+
+        # Same result shape as bm25_search
+        return [{**self.docmap[doc_id], "score": score} for doc_id, score in doc_score_tuples]
+
+    # Precompute avgdl, idf and the BM25 weight of every (token, doc) posting
+    def __compute_bm25_statistics(self):
+        self.avg_doc_length = self.__get_avg_doc_length()
+        doc_count = len(self.docmap)
 
-    def build(self):
-        movie_file_path = "data/movies.json"
+        self.idf = {}
+        self.impact_postings = {}
+        self.max_impacts = {}
+        for token, posting_list in self.postings.items():
+            idf = bm25_engine.bm25_idf(doc_count, len(posting_list))
+            self.idf[token] = idf
+
+            weights = array('d', (
+                bm25_engine.bm25_tf(
+                    tf, self.doc_lengths[doc_id], self.avg_doc_length) * idf
+                for doc_id, tf in zip(posting_list.doc_ids, posting_list.tfs)
+            ))
+            # Impacts share the doc id array of the posting list
+            self.impact_postings[token] = (posting_list.doc_ids, weights)
+            self.max_impacts[token] = max(weights)
+
+    # Build the index. Get all the movies and add them to index and docmap.
+    # With workers > 1 documents are analyzed in a process pool.
+    def build(self, workers: int = 1):
+        movie_file_path = document_source.MOVIES_PATH
 
         try:
-            with open(movie_file_path, 'r') as f:
-                data = json.load(f)
-
-                movie_list = data["movies"]
-
-                for movie in movie_list:
-                    # Add document to index
-                    self.__add_document(
-                        movie["id"], f"{movie["title"]} {movie["description"]}")
-                    # Add document to docmap
-                    self.docmap[movie["id"]] = movie
+            # Movies are streamed from disk, the file is never loaded as a whole
+            self.build_from_movies(
+                document_source.iter_movies(movie_file_path), workers)
 
         except FileNotFoundError:
             print(f"File not found. {movie_file_path}")
         except json.JSONDecodeError:
             print("Cannot decode json.")
 
-    # Save index and docmap to disk
-    def save(self):
-        # Create cache directory if not exists
+    # Build the index from an iterable of movie dicts. Movies are consumed in
+    # batches of BUILD_BATCH_SIZE and written to a document store in an
+    # anonymous temporary file as they go, the docmap reads them from there
+    # until save() copies them into the segment.
+    def build_from_movies(self, movie_list, workers: int = 1):
+        with tempfile.TemporaryFile() as f:
+            documents = document_store.DocumentWriter(f)
+            if workers > 1:
+                self.__build_in_parallel(movie_list, workers, documents)
+            else:
+                for batch in itertools.batched(movie_list, BUILD_BATCH_SIZE):
+                    # Tokenize the whole batch
+                    batch_tokens = self.analyzer.analyze_many(
+                        f"{movie["title"]} {movie["description"]}" for movie in batch)
+
+                    for movie, tokens in zip(batch, batch_tokens):
+                        # Add document to index
+                        self.__add_document(movie["id"], tokens)
+                        # Add document to the document store
+                        documents.add(movie)
+            documents.finish()
+            f.flush()
+            self.docmap = document_store.DocumentStore(file=f)
+
+        # Movies are not guaranteed to come in id order
+        for posting_list in self.postings.values():
+            posting_list.sort()
+
+        self.__compute_bm25_statistics()
+
+        # The built index is a single segment with valid impacts
+        self.segments = [segment.MemorySegment(self.postings, self.doc_lengths, self.docmap, self.impact_postings,
+                                               self.idf, self.max_impacts, self.avg_doc_length)]
+        self.doc_count = len(self.docmap)
+        self.total_doc_length = sum(self.doc_lengths.values())
+        self.generation += 1
+
+    # Shard the movies across a process pool and merge the partial indexes in
+    # shard order. Shards are contiguous runs of the movie list, so the merged
+    # postings, doc lengths and documents match a serial build exactly.
+    def __build_in_parallel(self, movie_list, workers: int, documents):
+        def shards():
+            for batch in itertools.batched(movie_list, BUILD_BATCH_SIZE):
+                for movie in batch:
+                    documents.add(movie)
+                # Only ids and text are sent to the workers
+                yield [(movie["id"], f"{movie["title"]} {movie["description"]}") for movie in batch]
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_build_worker, initargs=(self.analyzer.stop_words_path,)) as executor:
+            # Keep a bounded number of shards in flight and merge in submission order
+            pending = deque()
+            for shard in shards():
+                pending.append(executor.submit(_index_shard, shard))
+                if len(pending) >= 2 * workers:
+                    self.__merge_partial(*pending.popleft().result())
+
+            while pending:
+                self.__merge_partial(*pending.popleft().result())
+
+    def __merge_partial(self, partial_postings: dict, partial_doc_lengths: dict):
+        self.doc_lengths.update(partial_doc_lengths)
+
+        for token, partial in partial_postings.items():
+            posting_list = self.postings.get(token)
+            if posting_list is None:
+                self.postings[token] = partial
+            else:
+                posting_list.doc_ids.extend(partial.doc_ids)
+                posting_list.tfs.extend(partial.tfs)
+                posting_list.positions.extend(partial.positions)
+
+    # Add a new movie to the index without rebuilding it. The movie goes to an
+    # in-memory buffer that save() writes as a delta segment.
+    def add_document(self, movie: dict):
+        with self.__lock:
+            doc_id = movie["id"]
+            if self.__live_segment(doc_id) is not None:
+                raise ValueError(f"Document {doc_id} is already in the index")
+
+            tokens = self.analyzer.analyze(
+                f"{movie["title"]} {movie["description"]}")
+            self.__write_buffer().add(doc_id, tokens, movie)
+
+            self.doc_count += 1
+            self.total_doc_length += len(tokens)
+            self.__refresh_views()
+
+    # Replace a movie already in the index
+    def update_document(self, movie: dict):
+        with self.__lock:
+            self.delete_document(movie["id"])
+            self.add_document(movie)
+
+    # Remove a movie. Documents in written segments are tombstoned until the
+    # next merge, documents still in the update buffer are dropped outright.
+    def delete_document(self, doc_id: int):
+        with self.__lock:
+            live_segment = self.__live_segment(doc_id)
+            if live_segment is None:
+                raise KeyError(doc_id)
+
+            self.doc_count -= 1
+            self.total_doc_length -= live_segment.doc_lengths[doc_id]
+
+            if live_segment.writable:
+                live_segment.remove(doc_id)
+            else:
+                live_segment.deleted.add(doc_id)
+            self.__refresh_views()
+
+    # Newest segment holding a live copy of the document
+    def __live_segment(self, doc_id: int):
+        for index_segment in reversed(self.segments):
+            if doc_id in index_segment.doc_lengths and doc_id not in index_segment.deleted:
+                return index_segment
+        return None
+
+    def __write_buffer(self) -> segment.MemorySegment:
+        if not self.segments or not self.segments[-1].writable:
+            self.segments.append(segment.MemorySegment())
+        return self.segments[-1]
+
+    # Point postings, docmap, doc_lengths and the BM25 mappings at the segments.
+    # A single segment without tombstones is used as is, with the impacts fixed
+    # when it was built. Otherwise postings are merged across segments and BM25
+    # weights are computed from the live stats, exactly as a fresh build would.
+    def __refresh_views(self):
+        self.__merged_postings.clear()
+        self.avg_doc_length = self.total_doc_length / \
+            self.doc_count if self.doc_count > 0 else 0.0
+
+        if len(self.segments) == 1 and not self.segments[0].deleted and self.segments[0].has_impacts:
+            only_segment = self.segments[0]
+            self.postings = only_segment.postings
+            self.docmap = only_segment.documents
+            self.doc_lengths = only_segment.doc_lengths
+            self.idf = only_segment.idf
+            self.impact_postings = only_segment.impact_postings
+            self.max_impacts = only_segment.max_impacts
+            # Bumped once the views are swapped, so a result computed from the
+            # previous views is never cached under the new generation
+            self.generation += 1
+            return
+
+        def term_view(getter):
+            return segment.MappingView(getter, self.__has_term, self.__live_terms, lambda: sum(1 for _ in self.__live_terms()))
+
+        def doc_view(getter):
+            return segment.MappingView(getter, lambda doc_id: self.__live_segment(doc_id) is not None, self.__live_doc_ids, lambda: self.doc_count)
+
+        def live_segment(doc_id):
+            index_segment = self.__live_segment(doc_id)
+            if index_segment is None:
+                raise KeyError(doc_id)
+            return index_segment
+
+        self.postings = term_view(lambda term: self.__merged(term)[0])
+        self.impact_postings = term_view(
+            lambda term: (self.__merged(term)[0].doc_ids, self.__merged(term)[1]))
+        self.idf = term_view(lambda term: self.__merged(term)[2])
+        self.max_impacts = term_view(lambda term: self.__merged(term)[3])
+        self.doc_lengths = doc_view(
+            lambda doc_id: live_segment(doc_id).doc_lengths[doc_id])
+        self.docmap = doc_view(
+            lambda doc_id: live_segment(doc_id).documents[doc_id])
+        self.generation += 1
+
+    # Live postings of a term across all segments with their BM25 weights.
+    # Returns (PostingList, weights, idf, max weight), KeyError if no live doc has the term.
+    def __merged(self, term: str) -> tuple:
+        cached = self.__merged_postings.get(term)
+        if cached is not None:
+            self.__merged_postings.move_to_end(term)
+            return cached
+
+        entries = []
+        for index_segment in self.segments:
+            posting_list = index_segment.postings.get(term)
+            if posting_list is None:
+                continue
+            for index, (doc_id, tf) in enumerate(zip(posting_list.doc_ids, posting_list.tfs)):
+                if doc_id not in index_segment.deleted:
+                    entries.append(
+                        (doc_id, tf, index_segment.doc_lengths[doc_id], posting_list, index))
+
+        if not entries:
+            raise KeyError(term)
+
+        # A document is live in exactly one segment, so doc ids are unique
+        entries.sort(key=lambda entry: entry[0])
+
+        # Positions are only gathered from the segments when a phrase needs them
+        def merged_positions():
+            positions = array('I')
+            for _, _, _, posting_list, index in entries:
+                positions.extend(posting_list.positions_at(index))
+            return positions
+
+        merged = postings.PostingList(array('I', (entry[0] for entry in entries)),
+                                      array('I', (entry[1] for entry in entries)), merged_positions)
+        idf = bm25_engine.bm25_idf(self.doc_count, len(entries))
+        weights = array('d', (
+            bm25_engine.bm25_tf(tf, doc_length, self.avg_doc_length) * idf
+            for _, tf, doc_length, _, _ in entries
+        ))
+
+        result = (merged, weights, idf, max(weights))
+        self.__merged_postings[term] = result
+        if len(self.__merged_postings) > MERGED_POSTINGS_CACHE_SIZE:
+            self.__merged_postings.popitem(last=False)
+
+        return result
+
+    def __has_term(self, term: str) -> bool:
+        try:
+            self.__merged(term)
+            return True
+        except KeyError:
+            return False
+
+    def __live_terms(self):
+        terms = set()
+        for index_segment in self.segments:
+            terms.update(index_segment.postings)
+        return (term for term in sorted(terms) if self.__has_term(term))
+
+    def __live_doc_ids(self):
+        for index_segment in self.segments:
+            for doc_id in index_segment.doc_lengths:
+                if doc_id not in index_segment.deleted:
+                    yield doc_id
+
+    # Merge every segment into one segment with fresh BM25 impacts, dropping
+    # tombstoned documents, then persist. With background=True the merge runs on
+    # a thread that is returned; queries and updates keep working meanwhile and
+    # updates made during the merge are kept. Waits for a merge already running
+    # to finish first.
+    def merge_segments(self, background: bool = False):
+        self.__merging.acquire()
+        return self.__merge(background)
+
+    # Merge with self.__merging held, it's released once the merge is done
+    def __merge(self, background: bool):
+        try:
+            with self.__lock:
+                snapshot = list(self.segments)
+                snapshot_deleted = [set(index_segment.deleted)
+                                    for index_segment in snapshot]
+                # Updates made during the merge go to a new buffer
+                for index_segment in snapshot:
+                    index_segment.writable = False
+                merged_path = self.__new_segment_path()
+                self.__pending_paths.add(merged_path)
+        except BaseException:
+            self.__merging.release()
+            raise
+
+        def merge():
+            try:
+                merge_snapshot()
+            finally:
+                self.__merging.release()
+
+        def merge_snapshot():
+            merged = InvertedIndex(self.analyzer)
+            # Segment of each live document, its movie is only read when the
+            # merged segment is written
+            sources = {}
+            for index_segment, deleted in zip(snapshot, snapshot_deleted):
+                for doc_id in index_segment.doc_lengths:
+                    if doc_id not in deleted:
+                        sources[doc_id] = index_segment
+                        merged.doc_lengths[doc_id] = index_segment.doc_lengths[doc_id]
+
+                for term, posting_list in index_segment.postings.items():
+                    for index, (doc_id, tf) in enumerate(zip(posting_list.doc_ids, posting_list.tfs)):
+                        if doc_id not in deleted:
+                            merged_list = merged.postings.get(term)
+                            if merged_list is None:
+                                merged_list = merged.postings[term] = postings.PostingList()
+                            merged_list.append(doc_id, tf, posting_list.positions_at(index))
+            merged.docmap = segment.MappingView(
+                lambda doc_id: sources[doc_id].documents[doc_id], sources.__contains__,
+                lambda: iter(sources), lambda: len(sources))
+
+            for posting_list in merged.postings.values():
+                posting_list.sort()
+            merged.__compute_bm25_statistics()
+
+            segment.MemorySegment(merged.postings, merged.doc_lengths, merged.docmap, merged.impact_postings,
+                                  merged.idf, merged.max_impacts, merged.avg_doc_length).write(merged_path)
+            merged_segment = segment.Segment(merged_path)
+
+            with self.__lock:
+                # Carry over documents deleted while the merge was running
+                for index_segment, deleted in zip(snapshot, snapshot_deleted):
+                    merged_segment.deleted.update(
+                        index_segment.deleted - deleted)
+
+                # Keep the segments added since the snapshot, matched by
+                # identity rather than by position
+                merged_ids = {id(index_segment) for index_segment in snapshot}
+                self.segments = [merged_segment] + [
+                    index_segment for index_segment in self.segments if id(index_segment) not in merged_ids]
+                self.__pending_paths.discard(merged_path)
+                self.__refresh_views()
+                self.__persist()
+
+        if not background:
+            merge()
+            return None
+
+        thread = threading.Thread(target=merge)
+        thread.start()
+        return thread
+
+    def __new_segment_path(self) -> str:
+        path = INDEX_SEGMENT_PATH_PATTERN.format(self.__next_segment)
+        self.__next_segment += 1
+        return path
+
+    # Write unsaved segments and the manifest, then remove segment files the
+    # manifest no longer references
+    def __persist(self):
         os.makedirs('cache/', exist_ok=True)
 
-        # File paths for index and docmaps
-        index_file_path = "cache/index.pkl"
-        docmap_file_path = "cache/docmap.pkl"
-        term_frequencies_path = "cache/term_frequencies.pkl"
-        doc_length_path = "cache/doc_lengths.pkl"
-
-        # dump all the data
-        with open(index_file_path, 'wb') as i, open(docmap_file_path, 'wb') as d, open(term_frequencies_path, 'wb') as tf, open(doc_length_path, 'wb') as dl:
-            pickle.dump(self.index, i)
-            pickle.dump(self.docmap, d)
-            pickle.dump(self.term_frequencies, tf)
-            pickle.dump(self.doc_lengths, dl)
-
-        # This is for debugging. Delete after thorough testing
-        if os.path.exists(index_file_path):
-            print("Index successfully saved to disk")
-
-        if os.path.exists(docmap_file_path):
-            print("Docmap successfully saved")
+        for index_segment in self.segments:
+            if index_segment.path is None:
+                index_segment.write(self.__new_segment_path())
+
+        manifest = {
+            "doc_count": self.doc_count,
+            "total_doc_length": self.total_doc_length,
+            "next_segment": self.__next_segment,
+            "segments": [{
+                "path": index_segment.path,
+                "has_impacts": index_segment.has_impacts,
+                "deleted": sorted(index_segment.deleted),
+            } for index_segment in self.segments],
+        }
+        temp_path = f"{INDEX_MANIFEST_PATH}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, INDEX_MANIFEST_PATH)
+
+        live_paths = {index_segment.path for index_segment in self.segments}
+        for path in glob.glob(INDEX_SEGMENT_PATH_PATTERN.format("*")):
+            if path not in live_paths and path not in self.__pending_paths:
+                os.remove(path)
+
+    # Save the index to disk. A fresh build is written as one segment, updates
+    # since the last save as a delta segment. Once there are more than
+    # MAX_DELTA_SEGMENTS delta segments a background merge is started and its
+    # thread returned, unless a merge is already running.
+    def save(self):
+        with self.__lock:
+            self.__persist()
+            self.generation += 1
 
-        if os.path.exists(term_frequencies_path):
-            print("Term frequencies successfully saved")
+        if os.path.exists(INDEX_MANIFEST_PATH):
+            print("Index successfully saved to disk")
 
-        if os.path.exists(doc_length_path):
-            print("Doc lengths successfully saved")
+        # The running merge leaves the segments saved since for the next one
+        if len(self.segments) > MAX_DELTA_SEGMENTS + 1 and self.__merging.acquire(blocking=False):
+            return self.__merge(background=True)
+        return None
 
-    # Load the indices
+    # Load the index. Segments are memory-mapped, postings and documents are
+    # only read from disk when a query touches them.
     def load(self):
-        # File paths for index and docmaps
-        index_file_path = "cache/index.pkl"
-        docmap_file_path = "cache/docmap.pkl"
-        term_frequencies_path = "cache/term_frequencies.pkl"
-        doc_length_path = "cache/doc_lengths.pkl"
-
         try:
-            # open the files and load the data to memory.
-            with open(index_file_path, 'rb') as i, open(docmap_file_path, 'rb') as d, open(term_frequencies_path, 'rb') as tf, open(doc_length_path, 'rb') as dl:
-                self.index = pickle.load(i)
-                self.docmap = pickle.load(d)
-                self.term_frequencies = pickle.load(tf)
-                self.doc_lengths = pickle.load(dl)
-
+            with open(INDEX_MANIFEST_PATH, 'r') as f:
+                manifest = json.load(f)
+
+            self.segments = [
+                segment.Segment(entry["path"], set(
+                    entry["deleted"]), entry["has_impacts"])
+                for entry in manifest["segments"]
+            ]
         except FileNotFoundError:
             raise Exception(
                 "The index files not found. Please use build command to build the index.")
+
+        self.doc_count = manifest["doc_count"]
+        self.total_doc_length = manifest["total_doc_length"]
+        self.__next_segment = manifest["next_segment"]
+        self.__refresh_views()
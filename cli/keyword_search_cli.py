@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 
 import argparse
+import json
 import math
+import sys
+import time
+import batch_search
+import bm25_engine
 import inverted_index
+from lib import document_source
+import query_engine
 import search_utils
 import keyword_search
 
 
-def handle_search(inv_index, query):
+def handle_search(inv_index, query, limit, operator):
     # Load the inverted index from disk. If there are any errors, just exit
     try:
         inv_index.load()
@@ -18,16 +25,70 @@ def handle_search(inv_index, query):
     print(f"Searching for: {query}")
 
     # do the keyword search
-    keyword_search.keyword_search(query, inv_index)
+    try:
+        keyword_search.keyword_search(query, inv_index, limit, operator)
+    except ValueError as error:
+        print(f"Invalid query: {error}")
 
 
-def handle_build(inv_index):
+def handle_build(inv_index, workers):
     # Build the index
-    inv_index.build()
+    inv_index.build(workers)
     # Save to disk
     inv_index.save()
 
 
+def handle_upsert(inv_index, movies_path):
+    # Load the inverted index from disk. If there are any errors, just exit
+    try:
+        inv_index.load()
+    except Exception:
+        exit
+
+    # Add new movies and replace the ones already indexed
+    added = 0
+    updated = 0
+    for movie in document_source.iter_movies(movies_path):
+        if movie["id"] in inv_index.docmap:
+            inv_index.update_document(movie)
+            updated += 1
+        else:
+            inv_index.add_document(movie)
+            added += 1
+
+    print(f"Added {added} and updated {updated} movies")
+    # Writes a delta segment
+    inv_index.save()
+
+
+def handle_delete(inv_index, doc_ids):
+    # Load the inverted index from disk. If there are any errors, just exit
+    try:
+        inv_index.load()
+    except Exception:
+        exit
+
+    for doc_id in doc_ids:
+        try:
+            inv_index.delete_document(doc_id)
+            print(f"Deleted {doc_id}")
+        except KeyError:
+            print(f"Document {doc_id} not found")
+
+    inv_index.save()
+
+
+def handle_merge(inv_index):
+    # Load the inverted index from disk. If there are any errors, just exit
+    try:
+        inv_index.load()
+    except Exception:
+        exit
+
+    print(f"Merging {len(inv_index.segments)} segments")
+    inv_index.merge_segments()
+
+
 def handle_tf(inv_index, document_id, term):
     # Load the inverted index from disk. If there are any errors, just exit
     try:
@@ -60,17 +121,13 @@ def calculate_idf(inv_index, term):
     # Process the term (Tokenize)
     processed_terms = keyword_search.process_text(term)
 
-    # Get index and docmap from inv_index
-    index = inv_index.index
-    docmap = inv_index.docmap
-
     # Doc count
-    doc_count = len(docmap)
+    doc_count = len(inv_index.docmap)
 
     # Get docs for each processed term and add them to a set
     term_docs = set()
     for processed_term in processed_terms:
-        docs = index.get(processed_term)
+        docs = inv_index.get_documents(processed_term)
         term_docs.update(docs)
 
     # Term doc count
@@ -126,7 +183,7 @@ def handle_bm25tf(inv_index, doc_id, term, k1, b):
     print(f"BM25 TF score of '{term}' in document '{doc_id}': {bm25tf:.2f}")
 
 
-def handle_bm25search(inv_index, query):
+def handle_bm25search(inv_index, query, mode):
     # Load the inverted index from disk. If there are any errors, just exit
     try:
         inv_index.load()
@@ -134,12 +191,73 @@ def handle_bm25search(inv_index, query):
         exit
 
     # Fetch and print the results together with scores.
-    results = inv_index.bm25_search(query)
+    results = inv_index.bm25_search(query, mode=mode)
     for index, result in enumerate(results):
         print(
             f"{index + 1}. ({result["id"]}) {result["title"]} - Score: {result["score"]:.2f}")
 
 
+# Evaluate JSONL queries against the index loaded once and write JSONL results
+def handle_batch(inv_index, queries, output, limit, mode, workers):
+    # Load the inverted index from disk. If there are any errors, just exit
+    try:
+        inv_index.load()
+    except Exception as error:
+        print(error, file=sys.stderr)
+        return
+
+    summary = batch_search.run_keyword_batch(inv_index, queries, output, limit, mode, workers)
+    batch_search.print_summary(summary, workers)
+
+
+# Score a grid of BM25 (k1, b) settings over judged queries and print the best
+# settings by nDCG, then MRR
+def handle_sweep(inv_index, queries, qrels_path, k1_values, b_values, depth, top, json_path):
+    # numpy is only needed by the sweep
+    import bm25_sweep
+
+    # Load the inverted index from disk. If there are any errors, just exit
+    try:
+        inv_index.load()
+    except Exception as error:
+        print(error)
+        return
+
+    try:
+        qrels = bm25_sweep.read_qrels(qrels_path)
+    except (OSError, ValueError) as error:
+        print(error)
+        return
+    records = [record for record in batch_search.read_queries(queries) if "error" not in record]
+
+    if k1_values is None:
+        k1_values = bm25_sweep.DEFAULT_K1_VALUES
+    if b_values is None:
+        b_values = bm25_sweep.DEFAULT_B_VALUES
+
+    start = time.perf_counter()
+    sweep = bm25_sweep.BM25Sweep(
+        inv_index, [(record["id"], record["query"]) for record in records], qrels, depth)
+    gathered = time.perf_counter()
+    results = sweep.evaluate(k1_values, b_values)
+    scored = time.perf_counter()
+
+    print(f"Gathered {sweep.posting_count} postings of {len(sweep.query_ids)} judged queries in {gathered - start:.2f} s")
+    print(f"Scored {len(results)} settings in {scored - gathered:.2f} s")
+
+    current = sweep.evaluate([search_utils.BM25_K1], [search_utils.BM25_B])[0]
+    ranked = sorted(results, key=lambda result: (result["ndcg"], result["mrr"]), reverse=True)
+    print(f"{'k1':>6} {'b':>6} {f'MRR@{depth}':>9} {f'nDCG@{depth}':>9}")
+    for result in ranked[:top]:
+        print(f"{result["k1"]:>6.2f} {result["b"]:>6.2f} {result["mrr"]:>9.4f} {result["ndcg"]:>9.4f}")
+    print(f"Current setting: k1={current["k1"]:.2f} b={current["b"]:.2f} "
+          f"MRR@{depth} {current["mrr"]:.4f} nDCG@{depth} {current["ndcg"]:.4f}")
+
+    if json_path is not None:
+        with open(json_path, 'w') as f:
+            json.dump({"depth": depth, "queries": len(sweep.query_ids), "current": current, "results": results}, f, indent=2)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Keyword Search CLI")
     subparsers = parser.add_subparsers(
@@ -147,11 +265,32 @@ def main() -> None:
 
     # Search
     search_parser = subparsers.add_parser(
-        "search", help="Search movies using BM25")
+        "search", help="Search movies with a boolean query: terms, \"phrases\", AND, OR, NOT and parentheses")
     search_parser.add_argument("query", type=str, help="Search query")
+    search_parser.add_argument("--limit", type=int, default=5,
+                               help="Number of results, ranked by BM25")
+    search_parser.add_argument(
+        "--operator", type=str, choices=query_engine.DEFAULT_OPERATORS, default=query_engine.OR,
+        help="Operator joining terms written without one")
 
-    subparsers.add_parser(
+    build_parser = subparsers.add_parser(
         "build", help="Build the inverted index for movies")
+    build_parser.add_argument("--workers", type=int, default=1,
+                              help="Number of processes used to analyze documents")
+
+    # Incremental updates
+    upsert_parser = subparsers.add_parser(
+        "upsert", help="Add or update movies from a JSON or JSONL file without a full rebuild")
+    upsert_parser.add_argument(
+        "movies_path", type=str, help="Movies file, {\"movies\": [...]} JSON or JSONL")
+
+    delete_parser = subparsers.add_parser(
+        "delete", help="Delete movies from the index")
+    delete_parser.add_argument(
+        "doc_ids", type=int, nargs="+", help="IDs of the movies to delete")
+
+    subparsers.add_parser(
+        "merge", help="Merge delta segments into a single index segment")
 
     # TF
     tf_parser = subparsers.add_parser(
@@ -195,6 +334,37 @@ def main() -> None:
         "bm25search", help="Search movies using full BM25 scoring"
     )
     bm25search_parser.add_argument("query", type=str, help="Search query")
+    bm25search_parser.add_argument(
+        "--mode", type=str, choices=bm25_engine.SEARCH_MODES, default=bm25_engine.EXHAUSTIVE, help="Top-k strategy. wand skips postings that can't reach the top results")
+
+    # Batch
+    batch_parser = subparsers.add_parser(
+        "batch", help="Evaluate a JSONL file of queries against the index loaded once, writing JSONL results")
+    batch_parser.add_argument(
+        "queries", type=argparse.FileType('r'), nargs="?", default="-",
+        help="JSONL queries, strings or {\"id\", \"query\", \"limit\"} objects. Defaults to stdin")
+    batch_parser.add_argument("--output", type=argparse.FileType('w'), default="-", help="Write the results here instead of stdout")
+    batch_parser.add_argument("--limit", type=int, default=batch_search.DEFAULT_LIMIT,
+                              help="Results per query without its own limit")
+    batch_parser.add_argument(
+        "--mode", type=str, choices=batch_search.KEYWORD_MODES, default=bm25_engine.EXHAUSTIVE,
+        help="BM25 top-k strategy, or boolean for search command queries")
+    batch_parser.add_argument("--workers", type=int, default=1,
+                              help="Number of processes evaluating queries")
+
+    # BM25 parameter sweep
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="Score a grid of BM25 k1 and b values over judged queries and report MRR and nDCG")
+    sweep_parser.add_argument(
+        "queries", type=argparse.FileType('r'),
+        help="JSONL queries, strings or {\"id\", \"query\"} objects, as for batch")
+    sweep_parser.add_argument(
+        "qrels", type=str, help="TREC qrels file: query_id iteration doc_id relevance")
+    sweep_parser.add_argument("--k1", type=float, nargs="+", help="k1 values, 0.25 to 3.0 by 0.25 by default")
+    sweep_parser.add_argument("--b", type=float, nargs="+", help="b values, 0.0 to 1.0 by 0.05 by default")
+    sweep_parser.add_argument("--depth", type=int, default=10, help="Rank cutoff of MRR and nDCG")
+    sweep_parser.add_argument("--top", type=int, default=10, help="Number of best settings printed")
+    sweep_parser.add_argument("--json", type=str, help="Write the metrics of every setting to this file")
 
     args = parser.parse_args()
 
@@ -204,9 +374,15 @@ def main() -> None:
     # Handle Commands
     match args.command:
         case "search":
-            handle_search(inv_index, args.query)
+            handle_search(inv_index, args.query, args.limit, args.operator)
         case "build":
-            handle_build(inv_index)
+            handle_build(inv_index, args.workers)
+        case "upsert":
+            handle_upsert(inv_index, args.movies_path)
+        case "delete":
+            handle_delete(inv_index, args.doc_ids)
+        case "merge":
+            handle_merge(inv_index)
         case "tf":
             handle_tf(inv_index, args.document_id, args.term)
         case "idf":
@@ -218,7 +394,16 @@ def main() -> None:
         case "bm25tf":
             handle_bm25tf(inv_index, args.doc_id, args.term, args.k1, args.b)
         case "bm25search":
-            handle_bm25search(inv_index, args.query)
+            handle_bm25search(inv_index, args.query, args.mode)
+        case "sweep":
+            if args.depth < 1:
+                parser.error("--depth must be at least 1")
+            handle_sweep(inv_index, args.queries, args.qrels, args.k1, args.b,
+                         args.depth, args.top, args.json)
+        case "batch":
+            if args.limit < 1:
+                parser.error("--limit must be at least 1")
+            handle_batch(inv_index, args.queries, args.output, args.limit, args.mode, args.workers)
         case _:
             parser.print_help()
 
@@ -0,0 +1,203 @@
+import itertools
+import re
+
+# Defaults of the chunk commands. Sizes are in words for word_chunk and in
+# sentences for semantic_chunk.
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_MAX_CHUNK_SIZE = 4
+DEFAULT_OVERLAP = 0
+
+# Characters read from a file per block
+READ_SIZE = 1 << 16
+
+_WORD_SPLIT = re.compile(r"(\S+)")
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+_LEADING_WHITESPACE = re.compile(r"\s*")
+
+
+# Split text into chunks of `chunk_size` words, each starting with the last
+# `overlap` words of the previous one
+def word_chunk(text: str, chunk_size: int, overlap: int) -> list[str]:
+    return [chunk for chunk, _, _ in iter_word_chunks(text, chunk_size, overlap)]
+
+
+# Split text into chunks of `chunk_size` sentences, each starting with the
+# last `overlap` sentences of the previous one
+def semantic_chunk(text: str, chunk_size: int, overlap: int) -> list[str]:
+    return [chunk for chunk, _, _ in iter_semantic_chunks(text, chunk_size, overlap)]
+
+
+# Yield the word_chunk chunks of a string or a file opened in text mode as
+# (text, start, end), start and end being the character offsets of the chunk's
+# first and last word in the source. Words are joined by single spaces. The
+# source is read a block at a time in one pass, only about a block's words
+# and the current chunk are held in memory.
+def iter_word_chunks(source, chunk_size: int, overlap: int):
+    return _windows(_iter_words(_blocks(source)), chunk_size, overlap)
+
+
+# Yield the semantic_chunk chunks of a string or a text file as (text, start,
+# end), like iter_word_chunks. Sentences end at ".", "!" or "?" followed by
+# whitespace, and are joined by single spaces.
+def iter_semantic_chunks(source, chunk_size: int, overlap: int):
+    return _windows(_iter_sentences(_blocks(source)), chunk_size, overlap)
+
+
+# Yield (document, chunk number, text, start, end) for the chunks of the
+# `field` of each document, chunked by `chunker`, e.g. iter_semantic_chunks
+def iter_document_chunks(documents, chunk_size: int, overlap: int,
+                         chunker=iter_semantic_chunks, field: str = "description"):
+    for doc in documents:
+        for index, (text, start, end) in enumerate(chunker(doc[field], chunk_size, overlap)):
+            yield doc, index, text, start, end
+
+
+# The source as blocks of text, READ_SIZE characters at a time
+def _blocks(source):
+    if isinstance(source, str):
+        for start in range(0, len(source), READ_SIZE):
+            yield source[start:start + READ_SIZE]
+        return
+
+    while True:
+        block = source.read(READ_SIZE)
+        if not block:
+            return
+        yield block
+
+
+# Group units into chunks of `chunk_size` units, each starting with the last
+# `overlap` units of the previous chunk. Units come in batches of parallel
+# (texts, starts) lists, each text being the source from its start offset.
+# Only units a later chunk still needs are kept between batches, and each
+# chunk is one join of a slice.
+def _windows(batches, chunk_size: int, overlap: int):
+    if chunk_size < 1:
+        raise ValueError("The chunk size must be at least 1.")
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("The overlap must be at least 0 and less than the chunk size.")
+
+    step = chunk_size - overlap
+    texts = []
+    starts = []
+    first = 0
+    for batch_texts, batch_starts in batches:
+        texts += batch_texts
+        starts += batch_starts
+
+        # A full window is a chunk once the unit after it is seen
+        while first + chunk_size < len(texts):
+            last = first + chunk_size - 1
+            yield " ".join(texts[first:last + 1]), starts[first], starts[last] + len(texts[last])
+            first += step
+
+        del texts[:first], starts[:first]
+        first = 0
+
+    if len(texts) > 0:
+        yield " ".join(texts), starts[0], starts[-1] + len(texts[-1])
+
+
+# Words as batches of (texts, starts), one per block. A word running into the
+# end of a block is held, in pieces, until the block that ends it.
+def _iter_words(blocks):
+    offset = 0
+    partial = None
+    for block in blocks:
+        texts, starts = _word_spans(block, offset)
+        offset += len(block)
+        starts_in_word = not block[0].isspace()
+        ends_in_word = not block[-1].isspace()
+
+        if partial is not None:
+            pieces, partial_start = partial
+            if starts_in_word:
+                # The block starts inside the held word
+                pieces.append(texts[0])
+                if len(texts) == 1 and ends_in_word:
+                    continue
+                texts[0] = "".join(pieces)
+                starts[0] = partial_start
+            else:
+                texts.insert(0, "".join(pieces))
+                starts.insert(0, partial_start)
+            partial = None
+
+        if ends_in_word:
+            partial = [texts.pop()], starts.pop()
+
+        yield texts, starts
+
+    if partial is not None:
+        pieces, partial_start = partial
+        yield ["".join(pieces)], [partial_start]
+
+
+# (texts, starts) of the words of a non-empty block
+def _word_spans(block: str, offset: int):
+    texts = block.split()
+
+    # Usually words are separated by a single space, tab or newline. Then
+    # each word starts one character after the previous one ends, without a
+    # regex over the block. Everything between the words is whitespace, so
+    # separators are single iff there's one such character per gap.
+    if len(block.strip()) - len("".join(texts)) == len(texts) - 1:
+        first = offset + len(block) - len(block.lstrip())
+        starts = list(itertools.accumulate(
+            map((1).__add__, map(len, texts)), initial=first))
+        starts.pop()
+        return texts, starts
+
+    # Whitespace and words alternate, starting and ending with whitespace
+    parts = _WORD_SPLIT.split(block)
+    positions = list(itertools.accumulate(map(len, parts), initial=offset))
+    return parts[1::2], positions[1:-1:2]
+
+
+# Sentences as batches of (texts, starts), one per block, split like
+# re.split(_SENTENCE_BOUNDARY). That includes an empty last sentence after a
+# trailing boundary, or for empty text. A sentence ends as soon as its
+# punctuation is followed by whitespace, the whitespace is then skipped up to
+# the next sentence even across blocks.
+def _iter_sentences(blocks):
+    offset = 0
+    pieces = []
+    sentence_start = 0
+    # Last character of the previous block, for the boundary's lookbehind
+    previous = ""
+    skipping = False
+    for block in blocks:
+        position = 0
+        if skipping:
+            position = _LEADING_WHITESPACE.match(block).end()
+            if position == len(block):
+                offset += len(block)
+                previous = block[-1]
+                continue
+            skipping = False
+            sentence_start = offset + position
+
+        texts = []
+        starts = []
+        # Scan with the previous character in front, so a boundary right at
+        # the start of the block is seen
+        text = previous + block if position == 0 else block
+        shift = len(text) - len(block)
+        for match in _SENTENCE_BOUNDARY.finditer(text, position + shift):
+            pieces.append(block[position:match.start() - shift])
+            texts.append("".join(pieces))
+            starts.append(sentence_start)
+            pieces = []
+
+            position = match.end() - shift
+            sentence_start = offset + position
+            if position == len(block):
+                skipping = True
+
+        if position < len(block):
+            pieces.append(block[position:])
+        offset += len(block)
+        previous = block[-1]
+        yield texts, starts
+
+    yield ["".join(pieces)], [sentence_start if not skipping else offset]
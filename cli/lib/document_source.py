@@ -0,0 +1,118 @@
+import json
+
+MOVIES_PATH = "data/movies.json"
+
+# Characters read from the file per refill
+READ_SIZE = 1 << 16
+
+
+# Yield movies one at a time from either a {"movies": [...]} JSON file or a JSONL
+# file with one movie per line. Only a small read buffer and the current movie
+# are held in memory, never the whole file.
+def iter_movies(path: str = MOVIES_PATH, key: str = "movies"):
+    if path.endswith(".jsonl"):
+        yield from _iter_jsonl(path)
+    else:
+        yield from _iter_json_array(path, key)
+
+
+def _iter_jsonl(path: str):
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _iter_json_array(path: str, key: str):
+    with open(path, 'r') as f:
+        reader = _JsonStreamReader(f)
+
+        # Walk the top level object until the array under `key`
+        reader.expect("{")
+        while True:
+            if reader.peek() == "}":
+                raise json.JSONDecodeError(
+                    f"Key '{key}' not found", reader.buffer, reader.position)
+
+            name = reader.decode_value()
+            reader.expect(":")
+
+            if name == key:
+                break
+
+            # Skip any other top level value
+            reader.decode_value()
+            if reader.peek() == ",":
+                reader.expect(",")
+
+        # Stream the array items
+        reader.expect("[")
+        if reader.peek() == "]":
+            return
+
+        while True:
+            yield reader.decode_value()
+
+            if reader.peek() == "]":
+                return
+            reader.expect(",")
+
+
+# Incremental JSON tokenizer over a text file. Decodes one value at a time with
+# JSONDecoder.raw_decode, refilling a bounded buffer as needed.
+class _JsonStreamReader:
+    def __init__(self, f) -> None:
+        self.__file = f
+        self.__decoder = json.JSONDecoder()
+        self.__eof = False
+        self.buffer = ""
+        self.position = 0
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+
+        chunk = self.__file.read(READ_SIZE)
+        if not chunk:
+            self.__eof = True
+            return False
+
+        # Drop the consumed part of the buffer
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    # Next non-whitespace character without consuming it
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__fill():
+                raise json.JSONDecodeError(
+                    "Unexpected end of file", self.buffer, self.position)
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(
+                f"Expected '{char}'", self.buffer, self.position)
+        self.position += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.__decoder.raw_decode(
+                    self.buffer, self.position)
+                # A value touching the end of the buffer may be a truncated
+                # number or literal. Only trust it once more input is seen.
+                if end < len(self.buffer) or self.__eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.__eof:
+                    raise
+
+            self.__fill()
@@ -0,0 +1,215 @@
+from array import array
+from collections.abc import Mapping
+import bisect
+import contextlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+# Movies of the semantic engine. Keyword index segments embed their own block.
+DOCUMENT_STORE_PATH = "cache/documents.dat"
+
+# Document store block. Everything is little endian, every region starts on an
+# 8 byte boundary and offsets are relative to the start of the block, so a
+# block is either a file of its own or a region of an index segment.
+#
+#   header          magic, version, doc count, region offsets
+#   documents       json encoded documents, in the order they were added
+#   doc ids         uint32 per document, ascending
+#   doc spans       uint64 start and end per document, parallel to doc ids
+#
+# Readers memory-map the block and decode a document only when it's looked
+# up, so a search only reads the documents of its results. Every lookup
+# decodes a new dict, callers can't modify the stored documents.
+
+MAGIC = b"HDOC"
+VERSION = 1
+
+# magic, version, doc count, doc ids offset, doc spans offset, block size
+HEADER = struct.Struct("<4sII3Q")
+DOCUMENTS_OFFSET = HEADER.size + -HEADER.size % 8
+
+
+def _align(f):
+    padding = -f.tell() % 8
+    f.write(b"\0" * padding)
+    return f.tell()
+
+
+# Writes a document store block into an open binary file, starting at its
+# current, 8 byte aligned, position. Documents are written as they're added,
+# only their spans are kept until finish(). A document added twice keeps its
+# last version.
+class DocumentWriter:
+    def __init__(self, f) -> None:
+        self.__file = f
+        self.__start = f.tell()
+        self.__spans = {}
+        f.write(b"\0" * DOCUMENTS_OFFSET)
+
+    def add(self, document: dict):
+        self.add_encoded(document["id"], json.dumps(document).encode())
+
+    # Add a document already json encoded, e.g. copied from another store
+    def add_encoded(self, doc_id: int, encoded: bytes):
+        start = self.__file.tell() - self.__start
+        self.__file.write(encoded)
+        self.__spans[doc_id] = (start, self.__file.tell() - self.__start)
+
+    # Write the doc ids, spans and header. The file is left at the end of the block.
+    def finish(self):
+        f = self.__file
+        doc_ids = sorted(self.__spans)
+
+        doc_ids_offset = _align(f) - self.__start
+        f.write(array('I', doc_ids).tobytes())
+
+        doc_spans_offset = _align(f) - self.__start
+        f.write(array('Q', (offset for doc_id in doc_ids for offset in self.__spans[doc_id])).tobytes())
+
+        end = _align(f)
+        f.seek(self.__start)
+        f.write(HEADER.pack(MAGIC, VERSION, len(doc_ids), doc_ids_offset,
+                            doc_spans_offset, end - self.__start))
+        f.seek(end)
+
+
+# Write a document store file from the documents added inside the `with`.
+# Written to a temp file of its own first, so readers never see a partially
+# written store, concurrent writers don't write over each other and open
+# readers keep the file they mapped.
+@contextlib.contextmanager
+def writer(path: str = DOCUMENT_STORE_PATH):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            document_writer = DocumentWriter(f)
+            yield document_writer
+            document_writer.finish()
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+# Read-only doc id -> document mapping over a document store block. Maps the
+# file at `path` or an open binary `file`, e.g. an anonymous temporary file,
+# or reads the block at `offset` of an already mapped `buffer`, e.g. an index
+# segment, which it then doesn't close.
+class DocumentStore(Mapping):
+    def __init__(self, path: str = DOCUMENT_STORE_PATH, buffer=None, offset: int = 0, file=None) -> None:
+        self.__mmap = None
+        if buffer is None and file is not None:
+            # The map keeps the file's contents after `file` is closed
+            self.__mmap = buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        elif buffer is None:
+            with open(path, 'rb') as f:
+                self.__mmap = buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.doc_count, doc_ids_offset, doc_spans_offset, size = HEADER.unpack_from(
+            buffer, offset)
+        if magic != MAGIC or version != VERSION:
+            if self.__mmap is not None:
+                self.__mmap.close()
+            source = path if self.__mmap is not None else f"Offset {offset}"
+            raise ValueError(f"{source} is not a version {VERSION} document store")
+
+        self.__view = view = memoryview(buffer)[offset:offset + size]
+        self.__doc_ids = view[doc_ids_offset:doc_ids_offset +
+                              4 * self.doc_count].cast('I')
+        self.__doc_spans = view[doc_spans_offset:doc_spans_offset +
+                                16 * self.doc_count].cast('Q')
+
+    def close(self):
+        # Views into the mmap have to be released before it can be closed
+        for view in (self.__doc_ids, self.__doc_spans, self.__view):
+            view.release()
+        if self.__mmap is not None:
+            self.__mmap.close()
+
+    # Position of a document in the doc arrays, raises KeyError if missing
+    def __doc_position(self, doc_id: int) -> int:
+        position = bisect.bisect_left(self.__doc_ids, doc_id)
+        if position < self.doc_count and self.__doc_ids[position] == doc_id:
+            return position
+        raise KeyError(doc_id)
+
+    def __getitem__(self, doc_id: int) -> dict:
+        return json.loads(self.encoded(doc_id))
+
+    # The stored json encoding of a document, raises KeyError if missing
+    def encoded(self, doc_id: int) -> bytes:
+        position = self.__doc_position(doc_id)
+        start = self.__doc_spans[2 * position]
+        end = self.__doc_spans[2 * position + 1]
+        return self.__view[start:end].tobytes()
+
+    def __contains__(self, doc_id) -> bool:
+        try:
+            self.__doc_position(doc_id)
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return iter(self.__doc_ids)
+
+    def __len__(self) -> int:
+        return self.doc_count
+
+    # Documents of `doc_ids`, e.g. the hits of a search, in the same order
+    def get_many(self, doc_ids) -> list[dict]:
+        return [self[doc_id] for doc_id in doc_ids]
+
+
+# Yield `documents` as they're consumed and return a DocumentStore of them at
+# `path`. The file is only rewritten when the documents differ from the ones
+# it already stores: from the first added, changed or duplicate document on,
+# they're written to a new store along with the unchanged ones seen before
+# it, and a store missing documents is rewritten at the end. Otherwise the
+# existing file is opened read-only and left as it is, so loading an
+# unchanged corpus doesn't write anything.
+def sync(documents, path: str = DOCUMENT_STORE_PATH):
+    try:
+        current = DocumentStore(path)
+    except (OSError, ValueError, struct.error):
+        current = None
+
+    with contextlib.ExitStack() as stack:
+        document_writer = None
+        # Documents matching the current store, in order, until a write starts
+        unchanged = {}
+
+        def start_writing():
+            document_writer = stack.enter_context(writer(path))
+            for doc_id in unchanged:
+                document_writer.add_encoded(doc_id, current.encoded(doc_id))
+            return document_writer
+
+        for doc in documents:
+            encoded = json.dumps(doc).encode()
+            if document_writer is None:
+                doc_id = doc["id"]
+                if (current is not None and doc_id not in unchanged and doc_id in current
+                        and current.encoded(doc_id) == encoded):
+                    unchanged[doc_id] = None
+                else:
+                    document_writer = start_writing()
+            if document_writer is not None:
+                document_writer.add_encoded(doc["id"], encoded)
+            yield doc
+
+        if document_writer is None:
+            if current is not None and len(unchanged) == len(current):
+                return current
+            start_writing()
+
+    if current is not None:
+        current.close()
+    return DocumentStore(path)
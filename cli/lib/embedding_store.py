@@ -0,0 +1,228 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+from lib import vector_engine
+
+MOVIE_EMBEDDINGS_PATH = "cache/movie_embeddings.npy"
+MOVIE_EMBEDDINGS_MANIFEST_PATH = "cache/movie_embeddings.json"
+CHUNK_EMBEDDINGS_PATH = "cache/chunk_embeddings.npy"
+CHUNK_EMBEDDINGS_MANIFEST_PATH = "cache/chunk_embeddings.json"
+
+# Rows copied or normalized at a time
+COPY_BLOCK_SIZE = 65536
+
+
+# Hash of the text a document is embedded from
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+# Row-normalized document embeddings in an .npy file, memory-mapped read-only,
+# plus a JSON manifest with the model name, dimension and, for each row, the
+# movie id and content hash it was encoded from. sync() compares a corpus
+# against the manifest and only encodes new or changed documents: changed rows
+# are overwritten in place, new rows appended, removed rows compacted away.
+class EmbeddingStore:
+    # `dimension` can be a function returning it, called only when rows have
+    # to be encoded, so a lazily loaded model isn't loaded to open the store
+    def __init__(self, model_name: str, dimension,
+                 path: str = MOVIE_EMBEDDINGS_PATH, manifest_path: str = MOVIE_EMBEDDINGS_MANIFEST_PATH) -> None:
+        self.model_name = model_name
+        self.__dimension = dimension
+        self.path = path
+        self.manifest_path = manifest_path
+
+        # Row order movie (or chunk) ids, their content hashes and the mapped rows
+        self.ids = []
+        self.hashes = []
+        self.embeddings = None
+
+    @property
+    def dimension(self) -> int:
+        if callable(self.__dimension):
+            self.__dimension = self.__dimension()
+        return self.__dimension
+
+    # Open the store. False if it's missing or was built by another model.
+    def load(self) -> bool:
+        self.ids = []
+        self.hashes = []
+        self.embeddings = None
+        if not os.path.exists(self.path) or not os.path.exists(self.manifest_path):
+            return False
+
+        with open(self.manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest["model"] != self.model_name:
+            return False
+        # The same model always has the same dimension
+        if callable(self.__dimension):
+            self.__dimension = manifest["dimension"]
+        if manifest["dimension"] != self.dimension:
+            return False
+
+        embeddings = np.load(self.path, mmap_mode='r')
+        # Rows appended after the manifest was last written can't be trusted
+        if embeddings.shape != (len(manifest["documents"]), self.dimension):
+            return False
+
+        self.ids = [doc_id for doc_id, _ in manifest["documents"]]
+        self.hashes = [digest for _, digest in manifest["documents"]]
+        self.embeddings = embeddings
+        return True
+
+    # Replace the store with `ids` and `hashes` in row order. fill(out) writes
+    # their embeddings into the preallocated, memory-mapped rows, which are
+    # normalized once it returns.
+    def write(self, ids, hashes, fill):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.close()
+
+        temp_path = f"{self.path}.tmp"
+        out = np.lib.format.open_memmap(
+            temp_path, mode='w+', dtype=np.float32, shape=(len(ids), self.dimension))
+        fill(out)
+        _normalize_in_place(out)
+        out.flush()
+        del out
+        os.replace(temp_path, self.path)
+
+        self.ids = list(ids)
+        self.hashes = list(hashes)
+        self.__write_manifest()
+        self.embeddings = np.load(self.path, mmap_mode='r')
+
+    # Bring the store up to date with `documents`, a list of (id, hash)
+    # pairs. `encode(positions, out)` writes the embeddings of the documents at
+    # those positions into `out`. Returns the number of (added, changed,
+    # removed) rows.
+    def sync(self, documents, encode):
+        if not self.load():
+            self.write([doc_id for doc_id, _ in documents], [digest for _, digest in documents],
+                       lambda out: encode(range(len(documents)), out))
+            return len(documents), 0, 0
+
+        rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        wanted = {doc_id for doc_id, _ in documents}
+
+        changed = []
+        added = []
+        for position, (doc_id, digest) in enumerate(documents):
+            row = rows.get(doc_id)
+            if row is None:
+                added.append(position)
+            elif self.hashes[row] != digest:
+                changed.append(position)
+        removed = [row for row, doc_id in enumerate(self.ids)
+                   if doc_id not in wanted]
+
+        if not (changed or added or removed):
+            return 0, 0, 0
+
+        self.close()
+        if removed:
+            self.__compact(removed)
+            rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+
+        if changed:
+            embeddings = np.empty((len(changed), self.dimension), dtype=np.float32)
+            encode(changed, embeddings)
+            _normalize_in_place(embeddings)
+
+            patched = np.load(self.path, mmap_mode='r+')
+            patched[[rows[documents[position][0]] for position in changed]] = embeddings
+            patched.flush()
+            del patched
+            for position in changed:
+                self.hashes[rows[documents[position][0]]] = documents[position][1]
+
+        if added:
+            # Encode straight into the new rows at the end of the file
+            _grow_rows(self.path, len(added))
+            grown = np.load(self.path, mmap_mode='r+')
+            encode(added, grown[len(self.ids):])
+            _normalize_in_place(grown[len(self.ids):])
+            grown.flush()
+            del grown
+            self.ids.extend(documents[position][0] for position in added)
+            self.hashes.extend(documents[position][1] for position in added)
+
+        self.__write_manifest()
+        self.embeddings = np.load(self.path, mmap_mode='r')
+        return len(added), len(changed), len(removed)
+
+    # Release the mapped rows so the file can be replaced
+    def close(self):
+        self.embeddings = None
+
+    # Drop the given rows by copying the others to a new file, no re-encoding
+    def __compact(self, removed):
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[removed] = False
+        kept_rows = np.flatnonzero(keep)
+
+        source = np.load(self.path, mmap_mode='r')
+        temp_path = f"{self.path}.tmp"
+        target = np.lib.format.open_memmap(
+            temp_path, mode='w+', dtype=np.float32, shape=(len(kept_rows), self.dimension))
+        for start in range(0, len(kept_rows), COPY_BLOCK_SIZE):
+            block = kept_rows[start:start + COPY_BLOCK_SIZE]
+            target[start:start + len(block)] = source[block]
+        target.flush()
+        del source, target
+        os.replace(temp_path, self.path)
+
+        self.ids = [self.ids[row] for row in kept_rows]
+        self.hashes = [self.hashes[row] for row in kept_rows]
+
+    def __write_manifest(self):
+        manifest = {
+            "model": self.model_name,
+            "dimension": self.dimension,
+            "documents": [[doc_id, digest] for doc_id, digest in zip(self.ids, self.hashes)],
+        }
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+
+def _normalize_in_place(matrix):
+    for start in range(0, len(matrix), COPY_BLOCK_SIZE):
+        block = matrix[start:start + COPY_BLOCK_SIZE]
+        block[:] = vector_engine.normalize_rows(block)
+
+
+# Add `count` zeroed rows to a 2-d .npy file in place. np.save leaves room in
+# the header for the row count to grow, so only the shape in the header is
+# rewritten. A crash before the manifest is written leaves more rows than the
+# manifest lists, which load() treats as a missing store.
+def _grow_rows(path: str, count: int):
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_length = f.tell()
+
+        header = io.BytesIO()
+        header_data = {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": fortran_order,
+            "shape": (shape[0] + count, shape[1]),
+        }
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, header_data)
+        else:
+            np.lib.format.write_array_header_2_0(header, header_data)
+        if header.tell() != header_length:
+            raise ValueError(f"Can't grow the header of {path} in place.")
+
+        f.truncate(header_length + (shape[0] + count) * shape[1] * dtype.itemsize)
+        f.seek(0)
+        f.write(header.getvalue())
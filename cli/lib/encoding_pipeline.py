@@ -0,0 +1,149 @@
+import queue
+import threading
+
+import numpy as np
+
+# Texts per model call
+ENCODE_BATCH_SIZE = 64
+
+# Batches tokenized and sorted by length together. Bigger windows pad less but
+# delay the first batch.
+SORT_WINDOW_BATCHES = 32
+
+# Tokenized batches queued ahead of the model
+PIPELINE_DEPTH = 4
+
+_DONE = object()
+
+
+# Tokenize and embed stages for a SentenceTransformer. Texts are tokenized
+# without padding, each batch is only padded to its own longest text.
+class TransformerStages:
+    def __init__(self, model) -> None:
+        self.model = model
+        self.dimension = model.get_sentence_embedding_dimension()
+
+    # Token ids of each text and their lengths
+    def tokenize(self, texts):
+        token_ids = self.model.tokenizer(
+            [text.strip() for text in texts], truncation=True,
+            max_length=self.model.max_seq_length)["input_ids"]
+        return token_ids, [len(ids) for ids in token_ids]
+
+    def embed(self, token_ids):
+        # torch is a dependency of sentence_transformers
+        import torch
+
+        features = self.model.tokenizer.pad(
+            {"input_ids": token_ids}, return_tensors="pt")
+        features = {name: tensor.to(self.model.device)
+                    for name, tensor in features.items()}
+        with torch.inference_mode():
+            embeddings = self.model(features)["sentence_embedding"]
+        return embeddings.float().cpu().numpy()
+
+
+# Stages for any model with only an encode(texts). Lengths are word counts
+# and the model tokenizes inside encode.
+class TextStages:
+    def __init__(self, model) -> None:
+        self.model = model
+        self.dimension = model.get_sentence_embedding_dimension()
+
+    def tokenize(self, texts):
+        return list(texts), [len(text.split()) for text in texts]
+
+    def embed(self, texts):
+        return self.model.encode(texts, batch_size=len(texts))
+
+
+def stages_for(model):
+    if hasattr(model, "tokenizer") and callable(model):
+        return TransformerStages(model)
+    return TextStages(model)
+
+
+# Embed `texts` into `out`, row i holding the embedding of texts[i]. Texts are
+# tokenized a window at a time on a worker thread, sorted by length so each
+# batch pads to similar lengths, and queued for the model while the next window
+# is tokenized. `texts` can be any sequence, only a window of it is sliced at a
+# time. `out` can be a memory-mapped array, it's filled a batch at a time. With
+# `out_path` a new .npy file is memory-mapped as the output.
+def encode_texts(stages, texts, batch_size: int = ENCODE_BATCH_SIZE, out=None, out_path: str | None = None,
+                 bucket: bool = True, threaded: bool = True, progress=None):
+    if out is None:
+        shape = (len(texts), stages.dimension)
+        if out_path is not None:
+            out = np.lib.format.open_memmap(
+                out_path, mode='w+', dtype=np.float32, shape=shape)
+        else:
+            out = np.empty(shape, dtype=np.float32)
+
+    batches = _tokenized_batches(stages, texts, batch_size, bucket)
+    if threaded:
+        batches = _prefetch(batches)
+
+    encoded = 0
+    for indices, items in batches:
+        out[indices] = stages.embed(items)
+        encoded += len(indices)
+        if progress is not None:
+            progress(encoded)
+
+    return out
+
+
+# (indices, tokenized items) batches, sorted by length within each window
+def _tokenized_batches(stages, texts, batch_size, bucket):
+    window_size = batch_size * SORT_WINDOW_BATCHES
+    for window_start in range(0, len(texts), window_size):
+        items, lengths = stages.tokenize(
+            texts[window_start:window_start + window_size])
+
+        if bucket:
+            order = np.argsort(lengths, kind="stable")
+        else:
+            order = np.arange(len(items))
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            yield window_start + batch, [items[i] for i in batch]
+
+
+# Run a generator on a worker thread, PIPELINE_DEPTH items ahead of the consumer
+def _prefetch(generator):
+    results = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stopped = threading.Event()
+
+    # False once the consumer has gone away
+    def put(entry) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in generator:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as error:
+            put((_DONE, error))
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item, error = results.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stopped.set()
+        worker.join()
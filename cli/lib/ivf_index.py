@@ -0,0 +1,98 @@
+import numpy as np
+
+from lib import vector_engine
+
+MOVIE_IVF_INDEX_PATH = "cache/movie_ivf_index.npz"
+
+# Lists probed per query. More lists is higher recall and slower queries.
+DEFAULT_NPROBE = 8
+
+# k-means rounds when training the coarse quantizer
+KMEANS_ITERATIONS = 10
+
+# Training vectors sampled per list, the rest are only assigned
+TRAIN_SAMPLE_PER_LIST = 64
+
+
+# Number of lists for a corpus of `count` vectors, ~4 * sqrt(N)
+def default_list_count(count: int) -> int:
+    return max(1, min(count, int(4 * np.sqrt(count))))
+
+
+# Inverted file index over row-normalized embeddings. A spherical k-means
+# quantizer splits the corpus into lists, a query only scores the vectors in
+# its `nprobe` nearest lists. Lists are stored CSR style: the vector ids of
+# list i are ids[offsets[i]:offsets[i + 1]], sorted, so ties in a probed list
+# break by document order like the exact search.
+class IVFIndex:
+    def __init__(self, centroids, offsets, ids) -> None:
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+
+    @property
+    def list_count(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def vector_count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, normalized_matrix, list_count: int | None = None,
+              iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> "IVFIndex":
+        count = len(normalized_matrix)
+        if count == 0:
+            raise ValueError("Cannot build an index over no vectors.")
+        if list_count is None:
+            list_count = default_list_count(count)
+        list_count = min(list_count, count)
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, list_count * TRAIN_SAMPLE_PER_LIST)
+        sample = normalized_matrix[np.sort(
+            rng.choice(count, sample_size, replace=False))]
+
+        centroids = vector_engine.kmeans(
+            sample, list_count, iterations, rng, spherical=True)
+        assignments = vector_engine.nearest_centroids(
+            normalized_matrix, centroids)
+
+        # Stable sort keeps vector ids ascending within each list
+        ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.zeros(list_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=list_count),
+                  out=offsets[1:])
+
+        return cls(centroids, offsets, ids)
+
+    # Approximate cosine top-k, same shape of result as vector_engine.search
+    def search(self, normalized_matrix, queries, limit: int, nprobe: int = DEFAULT_NPROBE):
+        queries = vector_engine.normalize_rows(queries)
+        nprobe = max(1, min(nprobe, self.list_count))
+
+        indices = []
+        scores = []
+        centroid_scores = queries @ self.centroids.T
+        for query, row in zip(queries, centroid_scores):
+            probed = vector_engine.top_k(row, nprobe)
+            candidates = np.sort(np.concatenate(
+                [self.ids[self.offsets[i]:self.offsets[i + 1]] for i in probed]))
+
+            candidate_scores = normalized_matrix[candidates] @ query
+            best = vector_engine.top_k(candidate_scores, limit)
+            indices.append(candidates[best])
+            scores.append(candidate_scores[best])
+
+        return indices, scores
+
+    def save(self, path: str = MOVIE_IVF_INDEX_PATH):
+        with open(path, 'wb') as f:
+            np.savez(f, centroids=self.centroids,
+                     offsets=self.offsets, ids=self.ids)
+
+    @classmethod
+    def load(cls, path: str = MOVIE_IVF_INDEX_PATH) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["ids"])
+
@@ -0,0 +1,198 @@
+import numpy as np
+
+from lib import vector_engine
+
+INT8 = "int8"
+PQ = "pq"
+COMPRESSION_KINDS = (INT8, PQ)
+
+COMPRESSED_EMBEDDINGS_PATH_PATTERN = "cache/movie_embeddings_{}.npz"
+
+# Candidates rescored against the float32 vectors when re-ranking
+DEFAULT_RERANK = 100
+
+# Product quantizer shape: 48 subspaces of 8 dims for MiniLM's 384, each coded
+# with one byte
+PQ_SUBSPACES = 48
+PQ_CENTROIDS = 256
+PQ_KMEANS_ITERATIONS = 10
+PQ_TRAIN_SAMPLE_SIZE = 65536
+
+# Corpus rows decoded or scored at a time
+SCORE_BLOCK_SIZE = 65536
+
+
+def compressed_embeddings_path(kind: str) -> str:
+    return COMPRESSED_EMBEDDINGS_PATH_PATTERN.format(kind)
+
+
+# Scalar int8 quantization with one symmetric scale per dimension. A vector is
+# stored as round(x / scale), one byte per dimension.
+class Int8Quantizer:
+    kind = INT8
+
+    def __init__(self, scales) -> None:
+        self.scales = scales
+
+    @classmethod
+    def train(cls, normalized_matrix) -> "Int8Quantizer":
+        scales = np.zeros(normalized_matrix.shape[1], dtype=np.float32)
+        for start in range(0, len(normalized_matrix), SCORE_BLOCK_SIZE):
+            block = normalized_matrix[start:start + SCORE_BLOCK_SIZE]
+            np.maximum(scales, np.abs(block).max(axis=0), out=scales)
+
+        scales /= 127
+        scales[scales == 0] = 1.0
+        return cls(scales)
+
+    def encode(self, normalized_matrix):
+        codes = np.empty(normalized_matrix.shape, dtype=np.int8)
+        for start in range(0, len(normalized_matrix), SCORE_BLOCK_SIZE):
+            block = normalized_matrix[start:start + SCORE_BLOCK_SIZE]
+            codes[start:start + len(block)] = np.clip(
+                np.rint(block / self.scales), -127, 127)
+        return codes
+
+    # Asymmetric scores: the queries stay float32, only the corpus is
+    # quantized. Folding the scales into the queries leaves one matrix product.
+    def score(self, codes, queries):
+        scaled_queries = (queries * self.scales).T
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE].astype(np.float32)
+            scores[:, start:start + len(block)] = (block @ scaled_queries).T
+        return scores
+
+    def arrays(self) -> dict:
+        return {"scales": self.scales}
+
+
+# Product quantization: each vector is split into `subspaces` equal parts and
+# each part is replaced by the id of its nearest centroid in a per-subspace
+# codebook of PQ_CENTROIDS entries.
+class ProductQuantizer:
+    kind = PQ
+
+    def __init__(self, codebooks) -> None:
+        # (subspaces, centroids, subspace dimension)
+        self.codebooks = codebooks
+
+    @property
+    def subspaces(self) -> int:
+        return len(self.codebooks)
+
+    @classmethod
+    def train(cls, normalized_matrix, subspaces: int = PQ_SUBSPACES,
+              iterations: int = PQ_KMEANS_ITERATIONS, seed: int = 0) -> "ProductQuantizer":
+        count, dimension = normalized_matrix.shape
+        if dimension % subspaces != 0:
+            raise ValueError(
+                f"{dimension} dimensions can't be split into {subspaces} subspaces.")
+
+        rng = np.random.default_rng(seed)
+        sample = normalized_matrix[np.sort(rng.choice(
+            count, min(count, PQ_TRAIN_SAMPLE_SIZE), replace=False))]
+        centroid_count = min(PQ_CENTROIDS, len(sample))
+
+        codebooks = np.stack([
+            vector_engine.kmeans(
+                np.ascontiguousarray(part), centroid_count, iterations, rng)
+            for part in np.split(sample, subspaces, axis=1)])
+        return cls(codebooks)
+
+    def encode(self, normalized_matrix):
+        codes = np.empty((len(normalized_matrix), self.subspaces), dtype=np.uint8)
+        for subspace, part in enumerate(np.split(normalized_matrix, self.subspaces, axis=1)):
+            codes[:, subspace] = vector_engine.nearest_centroids(
+                part, self.codebooks[subspace])
+        return codes
+
+    # Asymmetric scores: a query is compared to every codebook entry once,
+    # then a vector's score is the sum of its entries in that lookup table.
+    def score(self, codes, queries):
+        # (queries, subspaces, centroids) partial dot products
+        tables = np.einsum("scd,qsd->qsc", self.codebooks,
+                           queries.reshape(len(queries), self.subspaces, -1))
+
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_SIZE):
+            # Subspace-major copy of the block, shared by all the queries
+            block = np.ascontiguousarray(codes[start:start + SCORE_BLOCK_SIZE].T)
+            for table, row in zip(tables, scores):
+                row_block = row[start:start + block.shape[1]]
+                for subspace in range(self.subspaces):
+                    row_block += table[subspace].take(block[subspace])
+        return scores
+
+    def arrays(self) -> dict:
+        return {"codebooks": self.codebooks}
+
+
+QUANTIZERS = {INT8: Int8Quantizer, PQ: ProductQuantizer}
+
+
+# Quantized codes of a corpus of embeddings plus their quantizer. Searching
+# ranks by approximate scores, then optionally rescoring the best candidates
+# against the float32 embeddings, which can be a memory-mapped array.
+class CompressedEmbeddings:
+    def __init__(self, quantizer, codes) -> None:
+        self.quantizer = quantizer
+        self.codes = codes
+
+    @property
+    def kind(self) -> str:
+        return self.quantizer.kind
+
+    @property
+    def vector_count(self) -> int:
+        return len(self.codes)
+
+    # Bytes stored per vector, codes only
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.codes.itemsize * self.codes.shape[1]
+
+    @classmethod
+    def build(cls, kind: str, normalized_matrix) -> "CompressedEmbeddings":
+        quantizer = QUANTIZERS[kind].train(normalized_matrix)
+        return cls(quantizer, quantizer.encode(normalized_matrix))
+
+    # Same shape of result as vector_engine.search. With `embeddings` the top
+    # `rerank` approximate candidates are rescored with exact cosine similarity.
+    def search(self, queries, limit: int, embeddings=None, rerank: int = DEFAULT_RERANK):
+        queries = vector_engine.normalize_rows(queries)
+
+        indices = []
+        scores = []
+        for start in range(0, len(queries), vector_engine.QUERY_BLOCK_SIZE):
+            block = queries[start:start + vector_engine.QUERY_BLOCK_SIZE]
+            for query, row in zip(block, self.quantizer.score(self.codes, block)):
+                if embeddings is None:
+                    best = vector_engine.top_k(row, limit)
+                    indices.append(best)
+                    scores.append(row[best])
+                    continue
+
+                # Sorted ids so the exact re-rank breaks ties by document order
+                candidates = np.sort(
+                    vector_engine.top_k(row, max(limit, rerank)))
+                exact = vector_engine.normalize_rows(
+                    embeddings[candidates]) @ query
+                best = vector_engine.top_k(exact, limit)
+                indices.append(candidates[best])
+                scores.append(exact[best])
+
+        return indices, scores
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, kind=self.kind, codes=self.codes,
+                     **self.quantizer.arrays())
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedEmbeddings":
+        with np.load(path) as data:
+            # The remaining arrays are the quantizer's constructor arguments
+            quantizer = QUANTIZERS[str(data["kind"])](**{
+                name: data[name] for name in data.files if name not in ("kind", "codes")})
+            return cls(quantizer, data["codes"])
@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+QUERY_CACHE_PATH = "cache/query_embeddings.sqlite3"
+
+# Query embeddings kept in process, and on disk
+MEMORY_CACHE_SIZE = 1024
+DISK_CACHE_SIZE = 100_000
+
+
+# Unicode and whitespace normalized query text. Case is kept, it's up to the
+# model whether it matters.
+def normalize_query(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+# Query embedding cache in front of a model's encode(). Embeddings are looked
+# up in an in-process LRU, then in a SQLite table under cache/, and only
+# encoded on a miss in both. Entries are keyed on the model name plus the
+# normalized query text and both layers evict the least recently used entries
+# past their size.
+class QueryEmbeddingCache:
+    def __init__(self, model_name: str, encode, path: str | None = QUERY_CACHE_PATH,
+                 memory_size: int = MEMORY_CACHE_SIZE, disk_size: int = DISK_CACHE_SIZE) -> None:
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.__encode = encode
+        self.__memory = OrderedDict()
+        self.__clock = 0
+        # Shared by search worker threads
+        self.__lock = threading.Lock()
+
+        # No path is a memory only cache
+        self.__connection = None
+        if path is not None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.__connection = sqlite3.connect(path, check_same_thread=False)
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "last_used INTEGER NOT NULL, PRIMARY KEY (model, query))")
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS query_embeddings_last_used "
+                "ON query_embeddings (last_used)")
+            self.__clock = self.__connection.execute(
+                "SELECT COALESCE(MAX(last_used), 0) FROM query_embeddings").fetchone()[0]
+
+    def get(self, text: str):
+        return self.get_many([text])[0]
+
+    # Embeddings of the given queries. All misses are encoded in one call,
+    # made without the lock so other threads' lookups and encodes go on
+    # meanwhile. A query missed by two threads at once is encoded by both.
+    def get_many(self, texts):
+        queries = [normalize_query(text) for text in texts]
+
+        with self.__lock:
+            found = {}
+            for query in queries:
+                if query in found:
+                    continue
+                embedding = self.__memory.get(query)
+                if embedding is not None:
+                    self.__memory.move_to_end(query)
+                    self.memory_hits += 1
+                    found[query] = embedding
+
+            missing = [query for query in dict.fromkeys(queries) if query not in found]
+            for query, embedding in self.__read(missing).items():
+                self.disk_hits += 1
+                found[query] = embedding
+                self.__remember(query, embedding)
+
+            missing = [query for query in missing if query not in found]
+            self.misses += len(missing)
+
+        if missing:
+            new_entries = {query: np.asarray(embedding, dtype=np.float32)
+                           for query, embedding in zip(missing, self.__encode(missing))}
+            found.update(new_entries)
+
+            with self.__lock:
+                for query, embedding in new_entries.items():
+                    self.__remember(query, embedding)
+                self.__write(new_entries)
+
+        return [found[query] for query in queries]
+
+    # Hit and miss counters, a miss being an encode() of the query
+    @property
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.__memory),
+            "disk_entries": self.disk_entries(),
+        }
+
+    def disk_entries(self) -> int:
+        if self.__connection is None:
+            return 0
+        with self.__lock:
+            return self.__connection.execute(
+                "SELECT COUNT(*) FROM query_embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+
+    def close(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def __remember(self, query, embedding):
+        self.__memory[query] = embedding
+        self.__memory.move_to_end(query)
+        while len(self.__memory) > self.memory_size:
+            self.__memory.popitem(last=False)
+
+    def __read(self, queries):
+        if self.__connection is None or not queries:
+            return {}
+
+        found = {}
+        self.__clock += 1
+        with self.__connection:
+            for query in queries:
+                row = self.__connection.execute(
+                    "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?",
+                    (self.model_name, query)).fetchone()
+                if row is not None:
+                    found[query] = np.frombuffer(row[0], dtype=np.float32)
+                    self.__connection.execute(
+                        "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+                        (self.__clock, self.model_name, query))
+        return found
+
+    def __write(self, entries):
+        if self.__connection is None or not entries:
+            return
+
+        self.__clock += 1
+        with self.__connection:
+            self.__connection.executemany(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+                [(self.model_name, query, embedding.tobytes(), self.__clock)
+                 for query, embedding in entries.items()])
+
+            # Evict the least recently used entries past the size limit
+            count = self.__connection.execute(
+                "SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+            if count > self.disk_size:
+                self.__connection.execute(
+                    "DELETE FROM query_embeddings WHERE rowid IN ("
+                    "SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.disk_size,))
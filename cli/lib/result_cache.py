@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Result lists kept per engine, and for how many seconds (None keeps them
+# until evicted)
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL = None
+
+
+# Cache key part of a query embedding, a digest of its bytes
+def embedding_key(embedding) -> bytes:
+    return hashlib.blake2b(embedding.tobytes(), digest_size=16).digest()
+
+
+# Search results cache shared by the keyword and semantic engines. Entries
+# are keyed by the engine on what determines a result list, e.g. the analyzed
+# query tokens, the limit and the index generation, so an index change makes
+# every older entry unreachable and it ages out of the LRU. Values should be
+# the engine's (doc id, score) top k rather than result dicts, which callers
+# may modify. Past `size` entries the least recently used is evicted, and an
+# entry older than `ttl` seconds is dropped when it's looked up.
+class ResultCache:
+    def __init__(self, size: int = RESULT_CACHE_SIZE, ttl: float | None = RESULT_CACHE_TTL) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.__entries = OrderedDict()
+        # Shared by search worker threads
+        self.__lock = threading.Lock()
+
+    # The cached value of `key`, None on a miss
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self.__entries[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    # Values of `keys`, the misses computed together by `compute`, a function
+    # of their positions in `keys` returning their values in order
+    def get_many(self, keys, compute):
+        values = [self.get(key) for key in keys]
+
+        missing = {}
+        for position, (key, value) in enumerate(zip(keys, values)):
+            if value is None:
+                missing.setdefault(key, position)
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            for key, value in computed.items():
+                self.put(key, value)
+            values = [computed[key] if value is None else value
+                      for key, value in zip(keys, values)]
+
+        return values
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries[key] = (time.monotonic(), value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    # Hit and miss counters, an expired entry counting as a miss
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self.__entries),
+        }
@@ -1,119 +1,438 @@
-import json
+from collections.abc import Sequence
+import itertools
 import os
-from sentence_transformers import SentenceTransformer
 import numpy as np
 
+from lib import chunking
+from lib import document_source
+from lib import document_store
+from lib import embedding_store
+from lib import encoding_pipeline
+from lib import ivf_index
+from lib import quantization
+from lib import query_cache
+from lib import result_cache
+from lib import vector_engine
 
-MOVIE_EMBEDDINGS_PATH = "cache/movie_embeddings.npy"
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Ways a movie's chunk scores are combined into its score
+AGGREGATE_MAX = "max"
+AGGREGATE_MEAN = "mean"
+AGGREGATIONS = (AGGREGATE_MAX, AGGREGATE_MEAN)
+
+# Best chunk scores averaged by AGGREGATE_MEAN
+DEFAULT_TOP_N = 3
+
+# Queries scored against every chunk at a time. Chunks outnumber movies, so
+# blocks are smaller than vector_engine's.
+CHUNK_QUERY_BLOCK_SIZE = 8
+
+
+# The text a document is embedded from
+def document_text(doc) -> str:
+    return f"{doc['title']}: {doc['description']}"
+
+
+# Texts of the movies of `doc_ids`, read from a document store a slice at a
+# time. The encoding pipeline slices a window at a time, so only the texts of
+# the window being encoded are in memory.
+class _DocumentTexts(Sequence):
+    def __init__(self, documents, doc_ids) -> None:
+        self.__documents = documents
+        self.__doc_ids = doc_ids
+
+    def __len__(self) -> int:
+        return len(self.__doc_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [document_text(doc) for doc in self.__documents.get_many(self.__doc_ids[index])]
+        return document_text(self.__documents[self.__doc_ids[index]])
 
 
 class SemanticSearch:
-    def __init__(self) -> None:
-        # Load the model (downloads automatically the first time)
-        self.model: SentenceTransformer = SentenceTransformer(
-            'all-MiniLM-L6-v2')
+    # `model` replaces the SentenceTransformer, e.g. with an offline stub
+    # encoder for benchmarks
+    def __init__(self, model=None) -> None:
+        # The model is loaded on first use, see `model`
+        self.__model = model
+        # Query embeddings are only encoded on a cache miss
+        self.query_cache = query_cache.QueryEmbeddingCache(
+            MODEL_NAME, lambda texts: self.model.encode(texts))
+        # Row-normalized embeddings, memory-mapped from the embedding store.
+        # The dimension is only asked of the model when rows are encoded.
+        self.store = embedding_store.EmbeddingStore(
+            MODEL_NAME, lambda: self.model.get_sentence_embedding_dimension())
+        # Corpus encoding stages, created with the model, and texts per call
+        self.__encode_stages = None
+        self.encode_batch_size = encoding_pipeline.ENCODE_BATCH_SIZE
         self.embeddings = None
+        # Approximate index used by search when loaded, and its lists probed
+        self.ann_index = None
+        self.nprobe = ivf_index.DEFAULT_NPROBE
+        # Quantized embeddings used by search when loaded, and how many of
+        # their best candidates are rescored against the float32 vectors
+        self.compressed_embeddings = None
+        self.rerank = quantization.DEFAULT_RERANK
+        # Movies by id, a DocumentStore. Rows are mapped to movie ids by the
+        # embedding store, and only the movies of search results are read.
         self.documents = None
-        self.document_map = {}
+        self.documents_path = document_store.DOCUMENT_STORE_PATH
+        # Bumped whenever the embeddings, documents or search structures
+        # change, so results cached under an older generation are never served
+        self.generation = 0
+        # Top k embedding rows and scores by query embedding, limit, search
+        # settings and generation
+        self.result_cache = result_cache.ResultCache()
+
+    # The SentenceTransformer, loaded on first use (downloads automatically the
+    # first time). sentence_transformers and torch take seconds to import, so
+    # they're only imported here.
+    @property
+    def model(self):
+        if self.__model is None:
+            from sentence_transformers import SentenceTransformer
+            self.__model = SentenceTransformer(MODEL_NAME)
+        return self.__model
+
+    @property
+    def encode_stages(self):
+        if self.__encode_stages is None:
+            self.__encode_stages = encoding_pipeline.stages_for(self.model)
+        return self.__encode_stages
 
     def generate_embedding(self, text: str):
         if len(text.strip()) == 0:
             raise ValueError("The text must not be empty.")
 
-        # We'll only embed the first input for now.
-        embeddings = self.model.encode([text])
-        result = embeddings[0]
+        return self.query_cache.get(text)
 
-        return result
+    # Yield `documents` as they're consumed, then open the document store as
+    # self.documents. The store is only rewritten when the documents changed
+    # since it was written. Callers only keep what they need of each document.
+    def store_documents(self, documents):
+        self.documents = yield from document_store.sync(documents, self.documents_path)
 
+    # Encode all documents and replace the embedding store. `documents` can be
+    # any iterable, e.g. a streaming document_source.iter_movies().
     def build_embeddings(self, documents):
-        # Set documents
-        self.documents = documents
-
-        # Set document map and save string representations
-        string_reps = []
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
-
-            # Save string representations
-            string_rep = f"{doc['title']}: {doc['description']}"
-            string_reps.append(string_rep)
-
-        # Encode the string representations
-        self.embeddings = self.model.encode(
-            string_reps, show_progress_bar=True)
-
-        # Save the embeddings
-        try:
-            with open(MOVIE_EMBEDDINGS_PATH, 'wb') as f:
-                np.save(f, self.embeddings)
-        except FileNotFoundError:
-            print(f"File not found for {MOVIE_EMBEDDINGS_PATH}")
+        doc_ids = []
+        hashes = []
+        for doc in self.store_documents(documents):
+            doc_ids.append(doc["id"])
+            hashes.append(embedding_store.content_hash(document_text(doc)))
+
+        # Encode the string representations straight into the store's rows
+        self.store.write(doc_ids, hashes,
+                         lambda out: self.encode_texts(self.__texts(doc_ids), out))
+        self.embeddings = self.store.embeddings
+        self.__remove_stale_indexes()
+        self.generation += 1
 
         # Return the embeddings
         return self.embeddings
 
+    # Open the embedding store and bring it up to date with `documents`. Only
+    # new or changed documents, by content hash, are encoded: changed rows are
+    # patched in place, new ones appended and removed ones dropped.
     def load_or_create_embeddings(self, documents):
-        # Populate documents and documents map
-        self.documents = documents
-        for doc in documents:
-            self.document_map[doc["id"]] = doc
-
-        # Check if file exists
-        if os.path.exists(MOVIE_EMBEDDINGS_PATH):
-            # If it is, load the file and save to embeddings
-            with open(MOVIE_EMBEDDINGS_PATH, 'rb') as f:
-                self.embeddings = np.load(f)
-
-                # TODO: - Do something else if the lengths are not equal
-                if len(self.embeddings) == len(documents):
-                    return self.embeddings
-        else:
-            # If it isn't, rebuild the embeddings and return the result
-            return self.build_embeddings(documents)
+        # Only ids and hashes are kept, the texts to encode are read back from
+        # the document store
+        entries = [(doc["id"], embedding_store.content_hash(document_text(doc)))
+                   for doc in self.store_documents(documents)]
+        added, changed, removed = self.store.sync(
+            entries,
+            lambda positions, out: self.encode_texts(
+                self.__texts([entries[position][0] for position in positions]), out))
+        if added or changed or removed:
+            print(f"Embeddings updated: {added} added, {changed} changed, {removed} removed")
+            self.__remove_stale_indexes()
+
+        self.embeddings = self.store.embeddings
+        self.generation += 1
+        return self.embeddings
 
-    # Semantic search
-    def search(self, query, limit):
-        if len(self.embeddings) == 0:
+    # Texts the movies of `doc_ids` are embedded from, read when encoded
+    def __texts(self, doc_ids) -> Sequence[str]:
+        return _DocumentTexts(self.documents, doc_ids)
+
+    # Run texts through the length-bucketed encoding pipeline into `out`
+    def encode_texts(self, texts, out):
+        if len(texts) == 0:
+            return
+
+        encoding_pipeline.encode_texts(
+            self.encode_stages, texts, self.encode_batch_size, out,
+            progress=lambda count: print(f"Encoded {count} documents", end="\r"))
+        print()
+
+    # Load the IVF index saved next to the embeddings, building and saving it
+    # if it is missing or doesn't match the loaded embeddings. Later searches
+    # probe `nprobe` lists instead of scanning every embedding.
+    def load_or_create_ann_index(self, nprobe=ivf_index.DEFAULT_NPROBE, list_count=None):
+        if self.embeddings is None or len(self.embeddings) == 0:
             raise ValueError(
                 "No embeddings loaded. Call `load_or_create_embeddings` first.")
 
-        # Embed the query
-        q_embedding = self.generate_embedding(query)
+        self.nprobe = nprobe
+        if os.path.exists(ivf_index.MOVIE_IVF_INDEX_PATH):
+            index = ivf_index.IVFIndex.load(ivf_index.MOVIE_IVF_INDEX_PATH)
+            if (index.vector_count == len(self.embeddings)
+                    and index.centroids.shape[1] == self.embeddings.shape[1]
+                    and (list_count is None or list_count == index.list_count)):
+                self.ann_index = index
+                self.generation += 1
+                return self.ann_index
+
+        self.ann_index = ivf_index.IVFIndex.build(self.embeddings, list_count)
+        self.ann_index.save(ivf_index.MOVIE_IVF_INDEX_PATH)
+        self.generation += 1
+
+        return self.ann_index
+
+    # Load int8 or product-quantized codes saved next to the float32 embeddings,
+    # building them if missing or stale. Searches then score the codes, and the
+    # memory-mapped float32 embeddings are only read to re-rank the best
+    # `rerank` candidates (0 disables re-ranking).
+    def load_or_create_compressed_embeddings(self, documents, kind=quantization.INT8, rerank=quantization.DEFAULT_RERANK):
+        self.load_or_create_embeddings(documents)
+        self.rerank = rerank
+
+        path = quantization.compressed_embeddings_path(kind)
+        self.compressed_embeddings = None
+        if os.path.exists(path):
+            compressed = quantization.CompressedEmbeddings.load(path)
+            if compressed.vector_count == len(self.embeddings):
+                self.compressed_embeddings = compressed
+
+        if self.compressed_embeddings is None:
+            self.compressed_embeddings = quantization.CompressedEmbeddings.build(
+                kind, self.embeddings)
+            self.compressed_embeddings.save(path)
+        self.generation += 1
+
+        return self.compressed_embeddings
+
+    # Indexes and codes built from previous embeddings
+    def __remove_stale_indexes(self):
+        self.ann_index = None
+        self.compressed_embeddings = None
+        stale_paths = [ivf_index.MOVIE_IVF_INDEX_PATH] + [
+            quantization.compressed_embeddings_path(kind) for kind in quantization.COMPRESSION_KINDS]
+        for path in stale_paths:
+            if os.path.exists(path):
+                os.remove(path)
 
-        # Similarity tuples. (similarity_score, document)
-        similarity_tuples = []
-        for index, doc_embedding in enumerate(self.embeddings):
-            similarity_score = cosine_similarity(q_embedding, doc_embedding)
-            document = self.documents[index]
+    # Semantic search
+    def search(self, query, limit):
+        return self.search_many([query], limit)[0]
 
-            similarity_tuples.append((similarity_score, document))
+    # Search a batch of queries. The queries are encoded together and scored
+    # against the corpus with one matrix product per block of queries. Only
+    # queries missing from the result cache are scored.
+    def search_many(self, queries, limit):
+        if self.embeddings is None or len(self.embeddings) == 0:
+            raise ValueError(
+                "No embeddings loaded. Call `load_or_create_embeddings` first.")
 
-        # Sort by similarity score descending.
-        similarity_tuples.sort(key=lambda tuple: tuple[0], reverse=True)
+        for query in queries:
+            if len(query.strip()) == 0:
+                raise ValueError("The text must not be empty.")
+        # Read before the embeddings, a result computed from older ones is
+        # then cached under an older generation
+        generation = self.generation
+
+        # Embed the queries
+        q_embeddings = np.stack(self.query_cache.get_many(queries))
+
+        # Approximate searches are keyed on their settings too
+        if self.compressed_embeddings is not None:
+            settings = (self.compressed_embeddings.kind, self.rerank)
+        elif self.ann_index is not None:
+            settings = ("ivf", self.nprobe)
+        else:
+            settings = None
+        keys = [(result_cache.embedding_key(embedding), limit, settings, generation)
+                for embedding in q_embeddings]
+        top_ks = self.result_cache.get_many(
+            keys, lambda positions: list(zip(*self.__top_k(q_embeddings[positions], limit))))
+
+        # Top results up to limit per query, only their movies are read. The
+        # results are converted to a dictionary.
+        return [[{
+            "score": float(score),
+            "id": doc["id"],
+            "title": doc["title"],
+            "description": doc["description"]
+        } for doc, score in zip(self.documents.get_many(self.store.ids[index] for index in query_indices), query_scores)]
+            for query_indices, query_scores in top_ks]
+
+    # (rows, scores) of the best `limit` embeddings of each query
+    def __top_k(self, q_embeddings, limit):
+        if self.compressed_embeddings is not None:
+            return self.compressed_embeddings.search(
+                q_embeddings, limit, self.embeddings if self.rerank > 0 else None, self.rerank)
+        if self.ann_index is not None:
+            return self.ann_index.search(
+                self.embeddings, q_embeddings, limit, self.nprobe)
+        return vector_engine.search(self.embeddings, q_embeddings, limit)
+
+
+# Semantic search over chunks of the movie descriptions. Each description is
+# split with chunking.semantic_chunk and every chunk embedded together with the
+# movie title, so a long description isn't squashed into one vector. A movie
+# scores the best, or the mean of the top n, of its chunk scores.
+class ChunkedSemanticSearch(SemanticSearch):
+    def __init__(self, model=None) -> None:
+        super().__init__(model)
+        self.store = embedding_store.EmbeddingStore(
+            MODEL_NAME, lambda: self.model.get_sentence_embedding_dimension(),
+            embedding_store.CHUNK_EMBEDDINGS_PATH, embedding_store.CHUNK_EMBEDDINGS_MANIFEST_PATH)
+        # Movie id of each document row, and the document row of each chunk
+        # embedding row. Chunk texts aren't kept, a result's chunk is cut again
+        # from its description with the same chunk size and overlap.
+        self.doc_ids = None
+        self.chunk_doc_rows = None
+        self.chunk_size = chunking.DEFAULT_MAX_CHUNK_SIZE
+        self.overlap = chunking.DEFAULT_OVERLAP
+        # Chunk rows sorted by document row, None if they already are, and
+        # where each document's chunks start and end in that order
+        self.__group_order = None
+        self.__group_starts = None
+        self.__group_ends = None
+
+    # Chunk every document and bring the chunk embedding store up to date.
+    # Chunks are stored as "<movie id>:<chunk number>" rows, so only chunks
+    # whose text changed are encoded again.
+    def load_or_create_chunk_embeddings(self, documents, chunk_size: int = chunking.DEFAULT_MAX_CHUNK_SIZE,
+                                        overlap: int = chunking.DEFAULT_OVERLAP):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.doc_ids = []
+
+        chunk_ids = []
+        string_reps = []
+        doc_rows = []
+        for doc_row, doc in enumerate(self.store_documents(documents)):
+            self.doc_ids.append(doc["id"])
+            # Always at least one chunk, possibly empty
+            for index, (chunk, _, _) in enumerate(chunking.iter_semantic_chunks(doc["description"], chunk_size, overlap)):
+                chunk_ids.append(f"{doc['id']}:{index}")
+                string_reps.append(f"{doc['title']}: {chunk}")
+                doc_rows.append(doc_row)
+
+        added, changed, removed = self.store.sync(
+            [(chunk_id, embedding_store.content_hash(text))
+             for chunk_id, text in zip(chunk_ids, string_reps)],
+            lambda positions, out: self.encode_texts([string_reps[position] for position in positions], out))
+        if added or changed or removed:
+            print(f"Chunk embeddings updated: {added} added, {changed} changed, {removed} removed")
+
+        # Store rows can be in another order than the chunks, e.g. appended
+        positions = {chunk_id: position for position, chunk_id in enumerate(chunk_ids)}
+        row_positions = np.fromiter((positions[chunk_id] for chunk_id in self.store.ids),
+                                    dtype=np.int64, count=len(self.store.ids))
+        self.chunk_doc_rows = np.asarray(doc_rows, dtype=np.int32)[row_positions]
+
+        order = np.argsort(self.chunk_doc_rows, kind="stable")
+        grouped = self.chunk_doc_rows[order]
+        self.__group_starts = np.flatnonzero(
+            np.diff(grouped, prepend=-1) != 0)
+        self.__group_ends = np.append(self.__group_starts[1:], len(grouped))
+        self.__group_order = None if np.array_equal(
+            order, np.arange(len(order))) else order
+
+        self.embeddings = self.store.embeddings
+        self.generation += 1
+        return self.embeddings
 
-        # Return top results up to limit. The results are converted to a dictionary.
-        return [{
-            "score": similarity_tuple[0],
-            "title": similarity_tuple[1]["title"],
-            "description": similarity_tuple[1]["description"]
-        } for similarity_tuple in similarity_tuples[:limit]]
+    def search(self, query, limit, aggregate: str = AGGREGATE_MAX, top_n: int = DEFAULT_TOP_N):
+        return self.search_many([query], limit, aggregate, top_n)[0]
+
+    # Score every chunk, then combine each movie's chunk scores with one
+    # vectorized group-by over the chunk score matrix. Results include the
+    # movie's best matching chunk. Only queries missing from the result cache
+    # are scored.
+    def search_many(self, queries, limit, aggregate: str = AGGREGATE_MAX, top_n: int = DEFAULT_TOP_N):
+        if self.embeddings is None or len(self.embeddings) == 0:
+            raise ValueError(
+                "No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` first.")
+        if aggregate not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregate}")
+
+        for query in queries:
+            if len(query.strip()) == 0:
+                raise ValueError("The text must not be empty.")
+        generation = self.generation
+
+        q_embeddings = vector_engine.normalize_rows(
+            np.stack(self.query_cache.get_many(queries)))
+
+        keys = [(result_cache.embedding_key(embedding), limit, aggregate, top_n, generation)
+                for embedding in q_embeddings]
+        top_ks = self.result_cache.get_many(
+            keys, lambda positions: self.__top_k(q_embeddings[positions], limit, aggregate, top_n))
+
+        return [[self.__result(doc_row, score, chunk_row) for doc_row, score, chunk_row in top_k]
+                for top_k in top_ks]
+
+    # (document row, score, best chunk row) of the best `limit` movies of each query
+    def __top_k(self, q_embeddings, limit, aggregate, top_n):
+        top_ks = []
+        for start in range(0, len(q_embeddings), CHUNK_QUERY_BLOCK_SIZE):
+            chunk_scores = q_embeddings[start:start + CHUNK_QUERY_BLOCK_SIZE] @ self.embeddings.T
+            if self.__group_order is not None:
+                chunk_scores = chunk_scores[:, self.__group_order]
+
+            if aggregate == AGGREGATE_MAX:
+                doc_scores = vector_engine.group_max(
+                    chunk_scores, self.__group_starts)
+            else:
+                doc_scores = vector_engine.group_top_n_mean(
+                    chunk_scores, self.__group_starts, top_n)
+
+            for query_chunk_scores, query_doc_scores in zip(chunk_scores, doc_scores):
+                top_ks.append([(doc_row, float(query_doc_scores[doc_row]), self.__best_chunk(doc_row, query_chunk_scores))
+                               for doc_row in vector_engine.top_k(query_doc_scores, limit)])
+
+        return top_ks
+
+    # Best chunk row of the movie, the chunk scores being in grouped order
+    def __best_chunk(self, doc_row, chunk_scores) -> int:
+        start = self.__group_starts[doc_row]
+        best = start + int(np.argmax(chunk_scores[start:self.__group_ends[doc_row]]))
+        if self.__group_order is not None:
+            best = self.__group_order[best]
+        return int(best)
+
+    def __result(self, doc_row, score, chunk_row):
+        doc = self.documents[self.doc_ids[doc_row]]
+        # Chunk ids are "<movie id>:<chunk number>"
+        number = int(self.store.ids[chunk_row].rpartition(":")[2])
+        chunk, _, _ = next(itertools.islice(chunking.iter_semantic_chunks(
+            doc["description"], self.chunk_size, self.overlap), number, None))
+        return {
+            "score": score,
+            "id": doc["id"],
+            "title": doc["title"],
+            "description": doc["description"],
+            "chunk": chunk,
+        }
 
 
 def verify_embeddings():
     semantic_search = SemanticSearch()
-    with open("data/movies.json", 'r') as f:
-        # Load the movies
-        movies_json = json.load(f)
-        documents = movies_json["movies"]
-
-        # Load or create embeddings
-        embeddings = semantic_search.load_or_create_embeddings(documents)
-
-        # Print the docs and embeddings
-        print(f"Number of docs:   {len(documents)}")
-        print(
-            f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
+
+    # Load or create embeddings from the streamed movies
+    embeddings = semantic_search.load_or_create_embeddings(
+        document_source.iter_movies())
+
+    # Print the docs and embeddings
+    print(f"Number of docs:   {len(semantic_search.documents)}")
+    print(
+        f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions")
 
 
 def cosine_similarity(vec1, vec2):
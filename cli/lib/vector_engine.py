@@ -0,0 +1,127 @@
+import numpy as np
+
+# Query rows scored against the corpus at a time. Bounds the score matrix of a
+# batch search to QUERY_BLOCK_SIZE x corpus size floats.
+QUERY_BLOCK_SIZE = 64
+
+# Rows assigned to their nearest centroid at a time
+ASSIGN_BLOCK_SIZE = 65536
+
+
+# L2-normalize the rows of a matrix so a dot product is the cosine similarity.
+# Zero rows stay zero, scoring 0.0 against every query like cosine_similarity.
+# With copy=False a float32 matrix is normalized in place.
+def normalize_rows(matrix, copy: bool = True):
+    matrix = np.array(matrix, dtype=np.float32,
+                      copy=True if copy else None, ndmin=2)
+
+    # einsum avoids a full size temporary of squared values
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    norms[norms == 0] = 1.0
+    matrix /= norms[:, None]
+    return matrix
+
+
+# Indices of the `limit` highest scores, best first. Ties go to the smaller
+# index, matching a stable descending sort over the whole row.
+def top_k(scores, limit: int):
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if limit < len(scores):
+        # Everything scoring at least the k-th best, so ties at the boundary
+        # are resolved by index rather than by argpartition's order
+        boundary = len(scores) - limit
+        kth = scores[np.argpartition(scores, boundary)[boundary]]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order[:limit]]
+
+
+# Cosine top-k of a batch of query vectors against a row-normalized corpus.
+# Returns (indices, scores), each a list with one array per query.
+def search(normalized_matrix, queries, limit: int):
+    queries = normalize_rows(queries)
+
+    indices = []
+    scores = []
+    for start in range(0, len(queries), QUERY_BLOCK_SIZE):
+        # One matrix-matrix product per block of queries
+        block_scores = queries[start:start + QUERY_BLOCK_SIZE] @ normalized_matrix.T
+        for row in block_scores:
+            best = top_k(row, limit)
+            indices.append(best)
+            scores.append(row[best])
+
+    return indices, scores
+
+
+# Lloyd's k-means over the rows of `sample`, starting from random rows. Empty
+# clusters are reseeded with random rows. With spherical=True the centroids
+# are renormalized each round, clustering unit vectors by cosine similarity.
+def kmeans(sample, cluster_count: int, iterations: int, rng, spherical: bool = False):
+    centroids = sample[rng.choice(
+        len(sample), cluster_count, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = nearest_centroids(sample, centroids)
+
+        # Per column bincounts are much faster than np.add.at
+        sums = np.empty_like(centroids)
+        for column in range(sample.shape[1]):
+            sums[:, column] = np.bincount(
+                assignments, sample[:, column], minlength=cluster_count)
+        sizes = np.bincount(assignments, minlength=cluster_count)
+
+        empty = np.flatnonzero(sizes == 0)
+        sums[empty] = sample[rng.choice(len(sample), len(empty))]
+        sizes[empty] = 1
+
+        if spherical:
+            centroids = normalize_rows(sums, copy=False)
+        else:
+            centroids = sums / sizes[:, None].astype(np.float32)
+
+    return centroids
+
+
+# Index of the closest centroid to each row by Euclidean distance. For unit
+# centroids this is also the most cosine-similar one.
+def nearest_centroids(matrix, centroids):
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 is the same for every c
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), ASSIGN_BLOCK_SIZE):
+        block = matrix[start:start + ASSIGN_BLOCK_SIZE]
+        assignments[start:start + len(block)] = np.argmax(
+            block @ centroids.T - half_norms, axis=1)
+    return assignments
+
+
+# Per group maximum of the columns of a (queries, items) score matrix. Groups
+# are runs of columns starting at the increasing `starts`, none empty.
+def group_max(scores, starts):
+    return np.maximum.reduceat(scores, starts, axis=1)
+
+
+# Per group mean of the `n` highest scores, or of all scores in groups of
+# fewer than `n` columns. Groups are laid out as for group_max.
+def group_top_n_mean(scores, starts, n: int):
+    if n == 1:
+        return group_max(scores, starts)
+
+    sizes = np.diff(starts, append=scores.shape[1])
+    if sizes.max() > n:
+        # Sort every group best first in place, then zero all but its first n
+        groups = np.repeat(np.arange(len(starts)), sizes)
+        order = np.lexsort(
+            (-scores, np.broadcast_to(groups, scores.shape)), axis=-1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        ranks = np.arange(scores.shape[1]) - np.repeat(starts, sizes)
+        scores = np.where(ranks < n, scores, 0)
+
+    return np.add.reduceat(scores, starts, axis=1) / np.minimum(sizes, n).astype(scores.dtype)
@@ -0,0 +1,170 @@
+from array import array
+import bisect
+import itertools
+
+
+# Compact posting list. Doc ids ascending in an array('I') with the term
+# frequency of each doc in a parallel array('I'), ~8 bytes per posting instead of
+# a set entry plus a Counter entry. The positions of the term in each document
+# follow in one flat array('I'), tf of them per posting in doc id order, so
+# they need no offsets of their own. Positions can be given as a callable that
+# produces them, they're then only loaded when a phrase query asks for them.
+class PostingList:
+    __slots__ = ("doc_ids", "tfs", "__positions", "__load_positions", "__position_starts")
+
+    def __init__(self, doc_ids: array | None = None, tfs: array | None = None, positions=None) -> None:
+        self.doc_ids = doc_ids if doc_ids is not None else array('I')
+        self.tfs = tfs if tfs is not None else array('I')
+        if callable(positions):
+            self.__positions = None
+            self.__load_positions = positions
+        else:
+            self.__positions = positions if positions is not None else array('I')
+            self.__load_positions = None
+        self.__position_starts = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def positions(self) -> array:
+        if self.__positions is None:
+            self.__positions = self.__load_positions()
+            self.__load_positions = None
+        return self.__positions
+
+    # Add a posting with the ascending positions of the term in the document.
+    # Doc ids are expected to arrive in ascending order, call sort() once at
+    # the end otherwise.
+    def append(self, doc_id: int, tf: int, positions):
+        self.doc_ids.append(doc_id)
+        self.tfs.append(tf)
+        self.positions.extend(positions)
+        self.__position_starts = None
+
+    # Term frequency of a document, 0 if the document is not in the list
+    def tf(self, doc_id: int) -> int:
+        position = bisect.bisect_left(self.doc_ids, doc_id)
+        if position < len(self.doc_ids) and self.doc_ids[position] == doc_id:
+            return self.tfs[position]
+        return 0
+
+    # Positions of the term in the document of the index-th posting
+    def positions_at(self, index: int) -> array:
+        if self.__position_starts is None:
+            self.__position_starts = array('Q', itertools.accumulate(self.tfs, initial=0))
+        return self.positions[self.__position_starts[index]:self.__position_starts[index + 1]]
+
+    # Restore doc id order if documents were appended out of order
+    def sort(self):
+        doc_ids = self.doc_ids
+        if all(doc_ids[i] < doc_ids[i + 1] for i in range(len(doc_ids) - 1)):
+            return
+
+        order = sorted(range(len(doc_ids)), key=doc_ids.__getitem__)
+        positions = array('I')
+        for i in order:
+            positions.extend(self.positions_at(i))
+        self.doc_ids = array('I', (doc_ids[i] for i in order))
+        self.tfs = array('I', (self.tfs[i] for i in order))
+        self.__positions = positions
+        self.__position_starts = None
+
+    # Delta + varint encoded doc ids and varint encoded term frequencies
+    def encode(self) -> tuple[bytes, bytes]:
+        return encode_varints(delta_encode(self.doc_ids)), encode_varints(self.tfs)
+
+    # Varint encoded positions, delta encoded within each document
+    def encode_positions(self) -> bytes:
+        deltas = array('I')
+        start = 0
+        for tf in self.tfs:
+            previous = 0
+            for position in self.positions[start:start + tf]:
+                deltas.append(position - previous)
+                previous = position
+            start += tf
+        return encode_varints(deltas)
+
+    # Posting list from encode(). `encoded_positions` is a callable returning
+    # the encode_positions() bytes, only called when the positions are first
+    # used.
+    @classmethod
+    def decode(cls, encoded_doc_ids: bytes, encoded_tfs: bytes, encoded_positions=None) -> "PostingList":
+        tfs = decode_varints(encoded_tfs)
+        positions = None
+        if encoded_positions is not None:
+            def positions():
+                return decode_positions(encoded_positions(), tfs)
+        return cls(delta_decode(decode_varints(encoded_doc_ids)), tfs, positions)
+
+
+# Token -> ascending positions of the token in an analyzed document
+def token_positions(tokens) -> dict[str, list[int]]:
+    positions = {}
+    for position, token in enumerate(tokens):
+        positions.setdefault(token, []).append(position)
+    return positions
+
+
+# Positions from PostingList.encode_positions() of a list with these tfs
+def decode_positions(data, tfs) -> array:
+    deltas = decode_varints(data)
+    positions = array('I')
+    start = 0
+    for tf in tfs:
+        current = 0
+        for delta in deltas[start:start + tf]:
+            current += delta
+            positions.append(current)
+        start += tf
+    return positions
+
+
+# Gaps between consecutive sorted doc ids. Small gaps encode to one varint byte.
+def delta_encode(values) -> array:
+    deltas = array('I')
+    previous = 0
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas
+
+
+def delta_decode(deltas) -> array:
+    values = array('I')
+    current = 0
+    for delta in deltas:
+        current += delta
+        values.append(current)
+    return values
+
+
+# LEB128 style varints. 7 bits per byte, high bit set on every byte but the last.
+def encode_varints(values) -> bytes:
+    encoded = bytearray()
+    for value in values:
+        while value >= 0x80:
+            encoded.append((value & 0x7F) | 0x80)
+            value >>= 7
+        encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_varints(data) -> array:
+    # No continuation bits, every byte is a value
+    if max(data, default=0) < 0x80:
+        return array('I', iter(data))
+
+    values = array('I')
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
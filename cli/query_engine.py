@@ -0,0 +1,283 @@
+from array import array
+import bisect
+import heapq
+import itertools
+import re
+
+import bm25_engine
+
+# Operators of a boolean query. Only upper case words are operators, "and"
+# is a term like any other.
+AND = "AND"
+OR = "OR"
+NOT = "NOT"
+DEFAULT_OPERATORS = (OR, AND)
+
+# Length ratio from which a sorted list is galloped through rather than
+# intersected or subtracted as a set
+GALLOP_RATIO = 32
+
+# Quoted phrases, parentheses and everything else up to whitespace
+_QUERY_TOKEN = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+
+
+# Parse a boolean query into a tree of tuples:
+#
+#   ("term", text)  ("phrase", text)  ("not", node)
+#   ("and", [nodes])  ("or", [nodes])
+#
+# NOT binds tighter than AND, AND tighter than OR, parentheses group. Operands
+# written next to each other are joined with `default_operator`. Raises
+# ValueError for unbalanced quotes or parentheses and misplaced operators.
+def parse_query(query: str, default_operator: str = OR):
+    if default_operator not in DEFAULT_OPERATORS:
+        raise ValueError(f"Unknown default operator: {default_operator}")
+
+    tokens = _QUERY_TOKEN.findall(query)
+    for token in tokens:
+        if token.startswith('"') and (len(token) == 1 or not token.endswith('"')):
+            raise ValueError("Unbalanced quotes in the query.")
+
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def starts_operand(token):
+        return token is not None and token not in (AND, OR, ")")
+
+    def parse_or():
+        nonlocal position
+        children = [parse_and()]
+        while True:
+            if peek() == OR:
+                position += 1
+            elif not (default_operator == OR and starts_operand(peek())):
+                break
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and():
+        nonlocal position
+        children = [parse_not()]
+        while True:
+            if peek() == AND:
+                position += 1
+            elif not (default_operator == AND and starts_operand(peek())):
+                break
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not():
+        nonlocal position
+        token = peek()
+        if token is None or token in (AND, OR, ")"):
+            raise ValueError(f"Expected a term, found {token or 'the end of the query'}.")
+
+        position += 1
+        if token == NOT:
+            return ("not", parse_not())
+        if token == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Unbalanced parentheses in the query.")
+            position += 1
+            return node
+        if token.startswith('"'):
+            return ("phrase", token[1:-1])
+        return ("term", token)
+
+    node = parse_or()
+    if position < len(tokens):
+        raise ValueError("Unbalanced parentheses in the query.")
+    return node
+
+
+# First index at or after `low` whose value is >= target. Gallops ahead in
+# doubling steps, then binary searches the last step, so a run of close
+# targets costs O(log gap) each rather than O(log n).
+def gallop(values, target: int, low: int = 0) -> int:
+    size = len(values)
+    step = 1
+    high = low
+    while high < size and values[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+    return bisect.bisect_left(values, target, low, min(high, size))
+
+
+# Whether to gallop through `longer` for each value of `shorter`. Galloping
+# compares in Python, so it only beats a set operation run in C when it gets
+# to skip most of the longer list.
+def _should_gallop(shorter, longer) -> bool:
+    return len(longer) >= GALLOP_RATIO * len(shorter)
+
+
+# Indexes (i, j) of the doc ids found in both sorted lists, by walking the
+# shorter list and galloping through the longer one
+def intersect_indexes(first, second):
+    swapped = len(first) > len(second)
+    if swapped:
+        first, second = second, first
+
+    pairs = []
+    position = 0
+    size = len(second)
+    for index, doc_id in enumerate(first):
+        position = gallop(second, doc_id, position)
+        if position == size:
+            break
+        if second[position] == doc_id:
+            pairs.append((position, index) if swapped else (index, position))
+    return pairs
+
+
+# Doc ids in every sorted list, intersected smallest list first so the
+# candidates only shrink. A much longer list is galloped through, one of
+# similar length intersected as a set.
+def intersect(doc_id_lists) -> array:
+    doc_id_lists = sorted(doc_id_lists, key=len)
+    result = array('I', doc_id_lists[0])
+    for doc_ids in doc_id_lists[1:]:
+        if len(result) == 0:
+            break
+        if _should_gallop(result, doc_ids):
+            result = array('I', (result[index] for index, _ in intersect_indexes(result, doc_ids)))
+        else:
+            result = array('I', sorted(set(result).intersection(doc_ids)))
+    return result
+
+
+def union(doc_id_lists) -> array:
+    return array('I', sorted(set().union(*doc_id_lists)))
+
+
+# Doc ids of `doc_ids` missing from `excluded`, both sorted
+def difference(doc_ids, excluded) -> array:
+    if not _should_gallop(doc_ids, excluded):
+        return array('I', itertools.filterfalse(set(excluded).__contains__, doc_ids))
+
+    result = array('I')
+    position = 0
+    size = len(excluded)
+    for doc_id in doc_ids:
+        position = gallop(excluded, doc_id, position)
+        if position == size or excluded[position] != doc_id:
+            result.append(doc_id)
+    return result
+
+
+# Doc ids whose positions hold the terms of `posting_lists` one after another.
+# Positions are only read for the documents holding every term.
+def phrase_matches(posting_lists) -> array:
+    indexes = [0] * len(posting_lists)
+    result = array('I')
+    for doc_id in intersect([posting_list.doc_ids for posting_list in posting_lists]):
+        for offset, posting_list in enumerate(posting_lists):
+            indexes[offset] = gallop(posting_list.doc_ids, doc_id, indexes[offset])
+
+        # Start positions consistent with every term of the phrase
+        starts = set(posting_lists[0].positions_at(indexes[0]))
+        for offset in range(1, len(posting_lists)):
+            starts.intersection_update(
+                start - offset for start in posting_lists[offset].positions_at(indexes[offset]))
+            if not starts:
+                break
+        if starts:
+            result.append(doc_id)
+    return result
+
+
+# Evaluates parsed queries against an index's term -> PostingList mapping.
+# `all_doc_ids` returns every live doc id, ascending, and is only called when
+# a NOT can't be evaluated as a difference.
+class QueryEvaluator:
+    def __init__(self, analyze, posting_lists, all_doc_ids) -> None:
+        self.analyze = analyze
+        self.posting_lists = posting_lists
+        self.all_doc_ids = all_doc_ids
+        self.__universe = None
+
+    # Sorted doc ids matching `node`. None for a query with nothing to match,
+    # e.g. only stop words, which is left out of the query around it.
+    def evaluate(self, node):
+        kind, value = node
+        match kind:
+            case "term" | "phrase":
+                return self.__phrase(self.analyze(value))
+            case "not":
+                excluded = self.evaluate(value)
+                if excluded is None:
+                    return None
+                return difference(self.__all_doc_ids(), excluded)
+            case "and":
+                included = []
+                excluded = []
+                for child in value:
+                    if child[0] == "not":
+                        doc_ids = self.evaluate(child[1])
+                        if doc_ids is not None:
+                            excluded.append(doc_ids)
+                    else:
+                        doc_ids = self.evaluate(child)
+                        if doc_ids is not None:
+                            included.append(doc_ids)
+
+                if not included and not excluded:
+                    return None
+                doc_ids = intersect(included) if included else self.__all_doc_ids()
+                for excluded_doc_ids in excluded:
+                    doc_ids = difference(doc_ids, excluded_doc_ids)
+                return doc_ids
+            case "or":
+                doc_id_lists = [doc_ids for doc_ids in map(self.evaluate, value)
+                                if doc_ids is not None]
+                return union(doc_id_lists) if doc_id_lists else None
+            case _:
+                raise ValueError(f"Unknown query node: {kind}")
+
+    # Analyzed tokens of the terms and phrases that aren't negated, the ones a
+    # match is scored on
+    def scored_tokens(self, node, negated: bool = False) -> list[str]:
+        kind, value = node
+        match kind:
+            case "term" | "phrase":
+                return [] if negated else self.analyze(value)
+            case "not":
+                return self.scored_tokens(value, not negated)
+            case _:
+                return [token for child in value for token in self.scored_tokens(child, negated)]
+
+    def __phrase(self, tokens):
+        if not tokens:
+            return None
+        posting_lists = [self.posting_lists.get(token) for token in tokens]
+        if any(posting_list is None for posting_list in posting_lists):
+            return array('I')
+        if len(posting_lists) == 1:
+            return posting_lists[0].doc_ids
+        return phrase_matches(posting_lists)
+
+    def __all_doc_ids(self):
+        if self.__universe is None:
+            self.__universe = array('I', self.all_doc_ids())
+        return self.__universe
+
+
+# Top `limit` (doc id, score) of the matches, scored by summing the impacts of
+# `impact_postings` for each doc and ranked like bm25_engine. Impacts of a
+# posting list much longer than the matches are looked up by galloping, so a
+# selective query never walks the whole of it.
+def top_k(matches, impact_postings, limit: int) -> list[tuple[int, float]]:
+    scores = dict.fromkeys(matches, 0.0)
+    for doc_ids, weights in impact_postings:
+        if _should_gallop(matches, doc_ids):
+            for match_index, posting_index in intersect_indexes(matches, doc_ids):
+                scores[matches[match_index]] += weights[posting_index]
+        else:
+            for doc_id, weight in zip(doc_ids, weights):
+                if doc_id in scores:
+                    scores[doc_id] += weight
+
+    return heapq.nlargest(limit, scores.items(), key=bm25_engine.rank_key)
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import bm25_engine
+import hybrid_search
+import inverted_index
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 100
+
+# Largest request body read
+MAX_BODY_SIZE = 1 << 20
+
+# Index of a BM25 worker process
+_worker_index = None
+
+
+def _init_bm25_worker():
+    global _worker_index
+    _worker_index = inverted_index.InvertedIndex()
+    _worker_index.load()
+
+
+def _worker_document_count() -> int:
+    return _worker_index.doc_count
+
+
+# BM25 search in a worker process. Only the fields a response shows are sent
+# back to the server process.
+def _bm25_search(query: str, limit: int, mode: str) -> list[dict]:
+    return [{
+        "id": movie["id"],
+        "title": movie["title"],
+        "description": movie["description"],
+        "score": movie["score"],
+    } for movie in _worker_index.bm25_search(query, limit, mode)]
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str | None = None) -> None:
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+# Search server answering BM25, semantic and hybrid queries over HTTP/JSON, on
+# TCP or a Unix socket. One asyncio loop reads requests and writes responses.
+# Scoring runs elsewhere: BM25 in a pool of processes that each load the
+# memory-mapped index once, semantic search on threads sharing one loaded
+# SemanticSearch, whose numpy and torch calls release the GIL.
+#
+#   GET  /health
+#   GET  /search/{bm25,semantic,hybrid}?q=...&limit=5&mode=exhaustive
+#   POST /search/{bm25,semantic,hybrid}  {"query": ..., "limit": 5, "mode": ...}
+#
+# Hybrid searches also take fusion=rrf|weighted and alpha, the BM25 weight.
+class SearchServer:
+    def __init__(self, doc_count: int, semantic_search=None, workers: int | None = None) -> None:
+        self.doc_count = doc_count
+        self.semantic_search = semantic_search
+        self.workers = workers or os.cpu_count() or 1
+        self.requests = 0
+
+        self.__processes = None
+        self.__threads = None
+
+    # Start the worker pools, every BM25 worker loading its index up front so
+    # the first queries don't pay for it
+    def start(self):
+        # Workers are spawned rather than forked from a process that may hold
+        # torch's threads
+        self.__processes = ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_bm25_worker)
+        warm_up = [self.__processes.submit(_worker_document_count)
+                   for _ in range(self.workers)]
+        for future in warm_up:
+            future.result()
+
+        if self.semantic_search is not None:
+            self.__threads = ThreadPoolExecutor(self.workers)
+
+    def close(self):
+        if self.__processes is not None:
+            self.__processes.shutdown(cancel_futures=True)
+            self.__processes = None
+        if self.__threads is not None:
+            self.__threads.shutdown(cancel_futures=True)
+            self.__threads = None
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: str | None = None):
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.__handle_connection, socket_path)
+            print(f"Serving on unix:{socket_path}")
+        else:
+            server = await asyncio.start_server(self.__handle_connection, host, port)
+            print(f"Serving on http://{host}:{port}")
+
+        async with server:
+            await server.serve_forever()
+
+    async def bm25_search(self, query: str, limit: int, mode: str = bm25_engine.EXHAUSTIVE) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__processes, _bm25_search, query, limit, mode)
+
+    async def semantic_search_results(self, query: str, limit: int) -> list[dict]:
+        if self.semantic_search is None:
+            raise _HTTPError(HTTPStatus.SERVICE_UNAVAILABLE,
+                             "Semantic search is disabled.")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__threads, self.semantic_search.search, query, limit)
+
+    # Both branches run concurrently on their own pools, then are fused
+    async def hybrid_search(self, query: str, limit: int, mode: str = bm25_engine.EXHAUSTIVE,
+                            method: str = hybrid_search.RRF, alpha: float = hybrid_search.DEFAULT_ALPHA) -> list[dict]:
+        candidates = max(limit, hybrid_search.DEFAULT_CANDIDATES)
+        result_lists = await asyncio.gather(
+            self.bm25_search(query, candidates, mode),
+            self.semantic_search_results(query, candidates))
+        return hybrid_search.fuse(result_lists, limit, method, alpha)
+
+    # Requests on one connection, kept alive until the client closes it or
+    # sends a request that can't be read
+    async def __handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except _HTTPError as error:
+                    _write_response(writer, error.status, {"error": str(error)}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, target, body, keep_alive = request
+                status, payload = await self.__respond(method, target, body)
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def __respond(self, method: str, target: str, body: bytes):
+        self.requests += 1
+        try:
+            return await self.__dispatch(method, target, body)
+        except _HTTPError as error:
+            return error.status, {"error": str(error)}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)}
+
+    async def __dispatch(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        if url.path == "/health":
+            health = {
+                "status": "ok",
+                "documents": self.doc_count,
+                "semantic": self.semantic_search is not None,
+                "workers": self.workers,
+                "requests": self.requests,
+            }
+            # BM25 workers each keep their own result cache in their process
+            if self.semantic_search is not None:
+                health["semantic_result_cache"] = self.semantic_search.result_cache.stats
+            return HTTPStatus.OK, health
+
+        searches = {
+            "/search/bm25": lambda query, limit, mode, fusion: self.bm25_search(query, limit, mode),
+            "/search/semantic": lambda query, limit, mode, fusion: self.semantic_search_results(query, limit),
+            "/search/hybrid": lambda query, limit, mode, fusion: self.hybrid_search(query, limit, mode, *fusion),
+        }
+        search = searches.get(url.path)
+        if search is None:
+            raise _HTTPError(HTTPStatus.NOT_FOUND)
+
+        if method == "GET":
+            params = {name: values[-1]
+                      for name, values in parse_qs(url.query).items()}
+            params.setdefault("query", params.get("q", ""))
+        elif method == "POST":
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                raise _HTTPError(HTTPStatus.BAD_REQUEST, "Invalid JSON body.")
+            if not isinstance(params, dict):
+                raise _HTTPError(HTTPStatus.BAD_REQUEST,
+                                 "The body must be a JSON object.")
+        else:
+            raise _HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        query, limit, mode, fusion = _search_params(params)
+        start = time.perf_counter()
+        results = await search(query, limit, mode, fusion)
+        return HTTPStatus.OK, {
+            "query": query,
+            "results": results,
+            "took_ms": (time.perf_counter() - start) * 1000,
+        }
+
+
+# Validated (query, limit, mode, (fusion method, alpha)) of a search request
+def _search_params(params: dict):
+    query = params.get("query")
+    if not isinstance(query, str) or len(query.strip()) == 0:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "The query must not be empty.")
+
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "The limit must be an integer.")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST,
+                         f"The limit must be between 1 and {MAX_LIMIT}.")
+
+    mode = params.get("mode", bm25_engine.EXHAUSTIVE)
+    if mode not in bm25_engine.SEARCH_MODES:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown search mode: {mode}")
+
+    method = params.get("fusion", hybrid_search.RRF)
+    if method not in hybrid_search.FUSION_METHODS:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown fusion method: {method}")
+    try:
+        alpha = float(params.get("alpha", hybrid_search.DEFAULT_ALPHA))
+    except (TypeError, ValueError):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "The alpha must be a number.")
+    if not 0 <= alpha <= 1:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "The alpha must be between 0 and 1.")
+
+    return query, limit, mode, (method, alpha)
+
+
+# The next HTTP/1.x request on a connection as (method, target, body, keep
+# alive), None once the client has closed it
+async def _read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+    method, target, version = parts
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise _HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+    if length > MAX_BODY_SIZE:
+        raise _HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length > 0 else b""
+
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        keep_alive = connection == "keep-alive"
+    else:
+        keep_alive = connection != "close"
+    return method, target, body, keep_alive
+
+
+def _write_response(writer, status: HTTPStatus, payload: dict, keep_alive: bool):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+
+
+# Serve until interrupted. Loads the index in this process to fail fast when
+# it's missing, `semantic_search` should already have its embeddings loaded.
+def run(semantic_search=None, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+        socket_path: str | None = None, workers: int | None = None):
+    inv_index = inverted_index.InvertedIndex()
+    inv_index.load()
+
+    server = SearchServer(inv_index.doc_count, semantic_search, workers)
+    print(f"Starting {server.workers} workers")
+    server.start()
+    try:
+        asyncio.run(server.serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,345 @@
+from array import array
+from collections.abc import Mapping
+import bisect
+import functools
+import mmap
+import os
+import struct
+
+from lib import document_store
+import postings
+
+# On-disk index segment. Everything is little endian and every region starts on
+# an 8 byte boundary.
+#
+#   header          magic, version, counts, avgdl, region offsets
+#   postings        per term: varint delta doc ids, varint tfs, float64 impacts,
+#                   varint positions delta encoded within each document
+#   term table      one fixed-size entry per term, sorted by term bytes
+#   term blob       utf-8 term strings the term table points into
+#   doc ids         uint32 per document, ascending
+#   doc lengths     uint32 per document, parallel to doc ids
+#   documents       document_store block of the movie dicts
+#
+# The file is opened with mmap, so opening only parses the header. Term lookups
+# binary search the term table and decode a single posting list, its positions
+# only when a phrase query needs them; documents are decoded one at a time when
+# a result needs them. The segment is the only copy of its documents, read
+# through the same DocumentStore class as the semantic engine's document file.
+#
+# Delta segments written by incremental updates have no meaningful BM25
+# statistics, their idf, max impact and impact values are all zero.
+
+MAGIC = b"HSEG"
+VERSION = 3
+
+# magic, version, term count, doc count, avgdl, 6 region offsets
+HEADER = struct.Struct("<4sIIId6Q")
+# term offset, term length, postings offset, doc ids bytes, tfs bytes, positions
+# bytes, df, idf, max impact
+TERM_ENTRY = struct.Struct("<IIQIIIIdd")
+
+# Decoded posting lists kept per open segment
+POSTINGS_CACHE_SIZE = 1024
+
+
+def _align(f):
+    padding = -f.tell() % 8
+    f.write(b"\0" * padding)
+    return f.tell()
+
+
+# Write a segment file. Written to a temp file first so readers never see a
+# partially written segment. Pass None for the BM25 statistics of a delta segment.
+def write_segment(path: str, posting_lists: dict, impact_postings: dict | None, idf: dict | None, max_impacts: dict | None, doc_lengths: dict, docmap: dict, avg_doc_length: float):
+    terms = sorted(posting_lists, key=lambda term: term.encode())
+    doc_ids = sorted(docmap)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(b"\0" * HEADER.size)
+
+        # Term blob first so term table entries can point into it
+        term_blob = bytearray()
+        term_positions = []
+        for term in terms:
+            encoded_term = term.encode()
+            term_positions.append((len(term_blob), len(encoded_term)))
+            term_blob += encoded_term
+
+        # Postings
+        postings_offset = _align(f)
+        entries = []
+        for term, (term_offset, term_length) in zip(terms, term_positions):
+            encoded_doc_ids, encoded_tfs = posting_lists[term].encode()
+            encoded_positions = posting_lists[term].encode_positions()
+            if impact_postings is not None:
+                weights = impact_postings[term][1]
+                term_idf, max_impact = idf[term], max_impacts[term]
+            else:
+                weights = array('d', bytes(8 * len(posting_lists[term])))
+                term_idf, max_impact = 0.0, 0.0
+
+            entries.append(TERM_ENTRY.pack(
+                term_offset, term_length, f.tell() - postings_offset, len(encoded_doc_ids), len(encoded_tfs),
+                len(encoded_positions), len(posting_lists[term]), term_idf, max_impact))
+
+            f.write(encoded_doc_ids)
+            f.write(encoded_tfs)
+            f.write(array('d', weights).tobytes())
+            f.write(encoded_positions)
+
+        term_table_offset = _align(f)
+        f.write(b"".join(entries))
+
+        term_blob_offset = _align(f)
+        f.write(term_blob)
+
+        # Documents and their lengths
+        doc_ids_offset = _align(f)
+        f.write(array('I', doc_ids).tobytes())
+
+        doc_lengths_offset = _align(f)
+        f.write(array('I', (doc_lengths[doc_id] for doc_id in doc_ids)).tobytes())
+
+        # Documents are read one at a time, e.g. from a DocumentStore
+        documents_offset = _align(f)
+        document_writer = document_store.DocumentWriter(f)
+        for doc_id in doc_ids:
+            document_writer.add(docmap[doc_id])
+        document_writer.finish()
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(terms), len(doc_ids), avg_doc_length,
+                            term_table_offset, term_blob_offset, postings_offset, doc_ids_offset,
+                            doc_lengths_offset, documents_offset))
+
+    os.replace(temp_path, path)
+
+
+# Read-only view over a segment file. `deleted` holds the tombstoned doc ids of
+# this segment, `has_impacts` is False for delta segments.
+class Segment:
+    def __init__(self, path: str, deleted: set | None = None, has_impacts: bool = True) -> None:
+        self.path = path
+        self.deleted = deleted if deleted is not None else set()
+        self.has_impacts = has_impacts
+        self.writable = False
+
+        with open(path, 'rb') as f:
+            self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.term_count, self.doc_count, self.avg_doc_length,
+         self.__term_table_offset, self.__term_blob_offset, self.__postings_offset,
+         doc_ids_offset, doc_lengths_offset, documents_offset) = HEADER.unpack_from(self.__mmap, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} index segment")
+
+        self.__view = view = memoryview(self.__mmap)
+        self.__doc_ids = view[doc_ids_offset:doc_ids_offset +
+                              4 * self.doc_count].cast('I')
+        self.__doc_lengths = view[doc_lengths_offset:doc_lengths_offset +
+                                  4 * self.doc_count].cast('I')
+        self.__documents = document_store.DocumentStore(
+            path, self.__mmap, documents_offset)
+
+        # Mapping views with the same shape as the in-memory InvertedIndex attributes
+        def term_view(getter):
+            return MappingView(getter, lambda term: self.find_term(term) >= 0, self.terms, lambda: self.term_count)
+
+        def doc_view(getter):
+            return MappingView(getter, self.has_document, self.doc_ids, lambda: self.doc_count)
+
+        self.postings = term_view(self.posting_list)
+        self.impact_postings = term_view(self.impacts)
+        self.idf = term_view(lambda term: self.term_entry(term)[7])
+        self.max_impacts = term_view(lambda term: self.term_entry(term)[8])
+        self.doc_lengths = doc_view(self.doc_length)
+        self.documents = self.__documents
+
+        self.__decode_postings = functools.lru_cache(
+            maxsize=POSTINGS_CACHE_SIZE)(self.__decode_postings)
+
+    def close(self):
+        # Views into the mmap have to be released before it can be closed
+        self.__documents.close()
+        for view in (self.__doc_ids, self.__doc_lengths, self.__view):
+            view.release()
+        self.__mmap.close()
+
+    def __term_at(self, index: int) -> bytes:
+        term_offset, term_length = struct.unpack_from(
+            "<II", self.__mmap, self.__term_table_offset + index * TERM_ENTRY.size)
+        start = self.__term_blob_offset + term_offset
+        return self.__mmap[start:start + term_length]
+
+    # Position of a term in the term table, -1 if missing
+    def find_term(self, term: str) -> int:
+        encoded_term = term.encode()
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.__term_at(middle) < encoded_term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self.__term_at(low) == encoded_term:
+            return low
+        return -1
+
+    def terms(self):
+        for index in range(self.term_count):
+            yield self.__term_at(index).decode()
+
+    # Raw term table entry for a term, raises KeyError if missing
+    def term_entry(self, term: str) -> tuple:
+        index = self.find_term(term)
+        if index < 0:
+            raise KeyError(term)
+        return TERM_ENTRY.unpack_from(self.__mmap, self.__term_table_offset + index * TERM_ENTRY.size)
+
+    def __decode_postings(self, index: int):
+        _, _, offset, doc_ids_size, tfs_size, positions_size, df, _, _ = TERM_ENTRY.unpack_from(
+            self.__mmap, self.__term_table_offset + index * TERM_ENTRY.size)
+
+        start = self.__postings_offset + offset
+        tfs_start = start + doc_ids_size
+        weights_start = tfs_start + tfs_size
+        positions_start = weights_start + 8 * df
+        posting_list = postings.PostingList.decode(
+            self.__mmap[start:tfs_start], self.__mmap[tfs_start:weights_start],
+            lambda: self.__mmap[positions_start:positions_start + positions_size])
+
+        weights = array('d')
+        weights.frombytes(self.__mmap[weights_start:weights_start + 8 * df])
+
+        return posting_list, weights
+
+    def posting_list(self, term: str) -> postings.PostingList:
+        index = self.find_term(term)
+        if index < 0:
+            raise KeyError(term)
+        return self.__decode_postings(index)[0]
+
+    # (doc_ids, weights) in the same shape as InvertedIndex.impact_postings
+    def impacts(self, term: str) -> tuple:
+        index = self.find_term(term)
+        if index < 0:
+            raise KeyError(term)
+        posting_list, weights = self.__decode_postings(index)
+        return posting_list.doc_ids, weights
+
+    # Position of a document in the doc arrays, raises KeyError if missing
+    def __doc_position(self, doc_id: int) -> int:
+        position = bisect.bisect_left(self.__doc_ids, doc_id)
+        if position < self.doc_count and self.__doc_ids[position] == doc_id:
+            return position
+        raise KeyError(doc_id)
+
+    def has_document(self, doc_id: int) -> bool:
+        try:
+            self.__doc_position(doc_id)
+            return True
+        except KeyError:
+            return False
+
+    def doc_ids(self):
+        return iter(self.__doc_ids)
+
+    def doc_length(self, doc_id: int) -> int:
+        return self.__doc_lengths[self.__doc_position(doc_id)]
+
+    def document(self, doc_id: int) -> dict:
+        return self.__documents[doc_id]
+
+
+# In-memory segment with the same attributes as Segment. Holds a freshly built
+# index, or buffers documents added by incremental updates until they are
+# written as a delta segment.
+class MemorySegment:
+    def __init__(self, posting_lists: dict | None = None, doc_lengths: dict | None = None, documents: dict | None = None,
+                 impact_postings: dict | None = None, idf: dict | None = None, max_impacts: dict | None = None, avg_doc_length: float = 0.0) -> None:
+        self.path = None
+        self.deleted = set()
+        self.has_impacts = impact_postings is not None
+        # Only an update buffer accepts documents, and only until it is written or merged
+        self.writable = not self.has_impacts
+
+        self.postings = posting_lists if posting_lists is not None else {}
+        self.doc_lengths = doc_lengths if doc_lengths is not None else {}
+        self.documents = documents if documents is not None else {}
+        self.impact_postings = impact_postings
+        self.idf = idf
+        self.max_impacts = max_impacts
+        self.avg_doc_length = avg_doc_length
+
+    # Buffer a document. Only valid for writable update buffers, a built
+    # segment's precomputed impacts would go stale.
+    def add(self, doc_id: int, tokens: list[str], document: dict):
+        if not self.writable:
+            raise ValueError("Segment is read-only")
+
+        self.doc_lengths[doc_id] = len(tokens)
+        self.documents[doc_id] = document
+
+        for token, positions in postings.token_positions(tokens).items():
+            posting_list = self.postings.get(token)
+            if posting_list is None:
+                posting_list = self.postings[token] = postings.PostingList()
+            posting_list.append(doc_id, len(positions), positions)
+            # Updates can arrive in any id order
+            if len(posting_list) > 1 and posting_list.doc_ids[-2] > doc_id:
+                posting_list.sort()
+
+    # Drop a buffered document outright. Cheaper than a tombstone while the
+    # buffer is small and still in memory.
+    def remove(self, doc_id: int):
+        if not self.writable:
+            raise ValueError("Segment is read-only")
+
+        del self.doc_lengths[doc_id]
+        del self.documents[doc_id]
+
+        for token in list(self.postings):
+            posting_list = self.postings[token]
+            if posting_list.tf(doc_id) == 0:
+                continue
+
+            kept = postings.PostingList()
+            for index, (kept_id, tf) in enumerate(zip(posting_list.doc_ids, posting_list.tfs)):
+                if kept_id != doc_id:
+                    kept.append(kept_id, tf, posting_list.positions_at(index))
+            if kept:
+                self.postings[token] = kept
+            else:
+                del self.postings[token]
+
+    def write(self, path: str):
+        segment_impacts = self.impact_postings if self.has_impacts else None
+        write_segment(path, self.postings, segment_impacts, self.idf, self.max_impacts,
+                      self.doc_lengths, self.documents, self.avg_doc_length)
+        self.path = path
+        self.writable = False
+
+
+# Read-only mapping whose items are computed by callbacks. `keys` and `length`
+# are callables so the views stay lazy.
+class MappingView(Mapping):
+    def __init__(self, getter, contains, keys, length) -> None:
+        self.__getter = getter
+        self.__contains = contains
+        self.__keys = keys
+        self.__length = length
+
+    def __getitem__(self, key):
+        return self.__getter(key)
+
+    def __contains__(self, key):
+        return self.__contains(key)
+
+    def __iter__(self):
+        return iter(self.__keys())
+
+    def __len__(self):
+        return self.__length()
@@ -1,117 +1,164 @@
 import argparse
-import json
-import re
 
-from lib import semantic_search
+from lib import chunking
 
 
-def handle_semantic_search(query, limit):
+# The search modules import numpy, and loading the model imports
+# sentence_transformers and torch, so they're only imported by the commands
+# that use them. The chunk commands start without any of it.
+def _semantic_search():
+    from lib import semantic_search
+    return semantic_search
+
+
+# A SemanticSearch with its embeddings, and optionally the IVF index or
+# quantized codes searched instead of the float32 embeddings, loaded
+def _load_semantic_search(ann=False, nprobe=None, compression=None, rerank=None):
+    from lib import document_source
+    from lib import ivf_index
+    from lib import quantization
+
+    if nprobe is None:
+        nprobe = ivf_index.DEFAULT_NPROBE
+    if rerank is None:
+        rerank = quantization.DEFAULT_RERANK
+
     # Semantic search object
-    search_obj = semantic_search.SemanticSearch()
-    with open("data/movies.json", 'r') as f:
-        # Load the movies
-        movies_json = json.load(f)
-        documents = movies_json["movies"]
-
-        # Load or create embeddings
-        search_obj.load_or_create_embeddings(documents)
-
-        # Run search
-        query = query
-        limit = limit
-
-        # Run the search and print out the results
-        results = search_obj.search(query, limit)
-        for index, result in enumerate(results):
-            print(
-                f"{index+1}. {result["title"]} (score: {result["score"]:.4f})\n{result["description"]}")
-            print()
-
-
-def handle_chunk(text: str, chunk_size: int, overlap: int):
-    words = text.split()
-
-    resulting_list = []
-    temp_list = []
-    for word in words:
-        if len(temp_list) < chunk_size:
-            # If still less than chunk size, append the word
-            temp_list.append(word)
-        else:
-            # If not append the temp_list
-            previous_list = temp_list.copy()
-            resulting_list.append(previous_list)
-
-            # Clear the temp list
-            temp_list.clear()
-
-            # Add overlapping words. From the previous list
-            if overlap > 0:
-                temp_list.extend(previous_list[-overlap:])
-
-            # Add the current word.
-            temp_list.append(word)
-
-    # Add the leftover words
-    if len(temp_list) > 0:
-        resulting_list.append(temp_list)
-
-    # Join the inner lists to string
-    result = [
-        ' '.join(string_list) for string_list in resulting_list
-    ]
-
-    char_count = len(text)
-
-    # Print out the result
-    print(f"Chunking {char_count} characters")
-    for index, chunk in enumerate(result):
-        print(f"{index + 1}. {chunk}")
+    search_obj = _semantic_search().SemanticSearch()
 
+    # Load or create embeddings from the streamed movies, optionally only
+    # holding their quantized codes in memory
+    if compression is not None:
+        search_obj.load_or_create_compressed_embeddings(
+            document_source.iter_movies(), compression, rerank)
+    else:
+        search_obj.load_or_create_embeddings(document_source.iter_movies())
 
-def handle_semantic_chunk(text: str, chunk_size: int, overlap: int):
-    result = semantic_chunk(text, chunk_size, overlap)
+    # Probe an approximate index instead of scanning every embedding
+    if ann:
+        search_obj.load_or_create_ann_index(nprobe)
 
-    # Print out the result
-    print(f"Semantically chunking {len(text)} characters")
-    for index, chunk in enumerate(result):
-        print(f"{index + 1}. {chunk}")
+    return search_obj
+
+
+def handle_semantic_search(query, limit, ann=False, nprobe=None, compression=None, rerank=None):
+    search_obj = _load_semantic_search(ann, nprobe, compression, rerank)
+
+    # Run the search and print out the results
+    results = search_obj.search(query, limit)
+    for index, result in enumerate(results):
+        print(
+            f"{index+1}. {result["title"]} (score: {result["score"]:.4f})\n{result["description"]}")
+        print()
+
+
+# Chunk every description and embed the chunks
+def handle_embed_chunks(chunk_size, overlap):
+    from lib import document_source
+
+    search_obj = _semantic_search().ChunkedSemanticSearch()
+    embeddings = search_obj.load_or_create_chunk_embeddings(
+        document_source.iter_movies(), chunk_size, overlap)
+    print(f"Generated {len(embeddings)} chunk embeddings for {len(search_obj.documents)} documents")
+
+
+def handle_search_chunked(query, limit, chunk_size, overlap, aggregate, top_n):
+    from lib import document_source
+
+    search_obj = _semantic_search().ChunkedSemanticSearch()
+    search_obj.load_or_create_chunk_embeddings(
+        document_source.iter_movies(), chunk_size, overlap)
+
+    results = search_obj.search(query, limit, aggregate, top_n)
+    for index, result in enumerate(results):
+        print(
+            f"{index+1}. {result["title"]} (score: {result["score"]:.4f})\n   Best chunk: {result["chunk"]}")
+        print()
+
+
+# BM25 and semantic search fused into one ranking, with the time spent in
+# each branch
+def handle_hybrid_search(query, limit, method, alpha, candidates, mode):
+    import hybrid_search
+    import inverted_index
+
+    # Load the inverted index from disk. If there are any errors, just exit
+    inv_index = inverted_index.InvertedIndex()
+    try:
+        inv_index.load()
+    except Exception as error:
+        print(error)
+        return
+
+    hybrid = hybrid_search.HybridSearch(
+        inv_index, _load_semantic_search(), candidates)
+    timings = {}
+    results = hybrid.search(query, limit, method, alpha, mode, timings)
+    hybrid.close()
 
+    for index, result in enumerate(results):
+        print(
+            f"{index+1}. ({result["id"]}) {result["title"]} (score: {result["score"]:.4f})\n{result["description"]}")
+        print()
 
-def semantic_chunk(text: str, chunk_size: int, overlap: int):
-    sentences = re.split(r"(?<=[.!?])\s+", text)
+    print(f"BM25:     {timings["bm25_ms"]:.2f} ms, {timings["bm25_candidates"]} candidates")
+    print(f"Semantic: {timings["semantic_ms"]:.2f} ms, {timings["semantic_candidates"]} candidates")
+    print(f"Fusion:   {timings["fusion_ms"]:.2f} ms")
+    print(f"Total:    {timings["total_ms"]:.2f} ms")
 
-    resulting_list = []
-    temp_list = []
-    for sentence in sentences:
-        if len(temp_list) < chunk_size:
-            # If still less than chunk size, append the sentence
-            temp_list.append(sentence)
-        else:
-            # If not append the temp_list
-            previous_list = temp_list.copy()
-            resulting_list.append(previous_list)
 
-            # Clear the temp list
-            temp_list.clear()
+# Keep the index, embeddings and model loaded and answer queries over HTTP
+def handle_serve(host, port, socket_path, workers, semantic=True, ann=False, nprobe=None, compression=None, rerank=None):
+    import search_server
 
-            # Add overlapping sentences. From the previous list
-            if overlap > 0:
-                temp_list.extend(previous_list[-overlap:])
+    search_obj = None
+    if semantic:
+        search_obj = _load_semantic_search(ann, nprobe, compression, rerank)
+        # Load the model now rather than on the first uncached query
+        search_obj.model
 
-            # Add the current sentence.
-            temp_list.append(sentence)
+    try:
+        search_server.run(search_obj, host, port, socket_path, workers)
+    except Exception as error:
+        print(error)
 
-    # Add the leftover sentences
-    if len(temp_list) > 0:
-        resulting_list.append(temp_list)
 
-    # Join the inner lists to string
-    result = [
-        ' '.join(string_list) for string_list in resulting_list
-    ]
+# Evaluate JSONL queries against the embeddings loaded once and write JSONL
+# results
+def handle_batch(queries, output, limit, workers, ann=False, nprobe=None, compression=None, rerank=None):
+    import batch_search
 
-    return result
+    search_obj = _load_semantic_search(ann, nprobe, compression, rerank)
+    summary = batch_search.run_semantic_batch(search_obj, queries, output, limit, workers)
+    batch_search.print_summary(summary, workers)
+
+
+def handle_chunk(text: str | None, chunk_size: int, overlap: int, path: str | None = None):
+    if path is not None:
+        # Stream the file, chunks are printed as they're found
+        print(f"Chunking {path}")
+        with open(path, 'r') as f:
+            _print_chunks(chunking.iter_word_chunks(f, chunk_size, overlap))
+        return
+
+    print(f"Chunking {len(text)} characters")
+    _print_chunks(chunking.iter_word_chunks(text, chunk_size, overlap))
+
+
+def handle_semantic_chunk(text: str | None, chunk_size: int, overlap: int, path: str | None = None):
+    if path is not None:
+        print(f"Semantically chunking {path}")
+        with open(path, 'r') as f:
+            _print_chunks(chunking.iter_semantic_chunks(f, chunk_size, overlap))
+        return
+
+    print(f"Semantically chunking {len(text)} characters")
+    _print_chunks(chunking.iter_semantic_chunks(text, chunk_size, overlap))
+
+
+def _print_chunks(chunks):
+    for index, (chunk, _, _) in enumerate(chunks):
+        print(f"{index + 1}. {chunk}")
 
 
 def main() -> None:
@@ -146,15 +193,111 @@ def main() -> None:
         "query", type=str, help="Query to search.")
     search_parser.add_argument(
         "--limit", type=int, default=5, help="Limits number of elements returned.")
+    search_parser.add_argument(
+        "--ann", action="store_true", help="Search the IVF index instead of every embedding.")
+    search_parser.add_argument(
+        "--nprobe", type=int, help="IVF lists probed per query.")
+    search_parser.add_argument(
+        "--compression", choices=("int8", "pq"), help="Search quantized embeddings.")
+    search_parser.add_argument(
+        "--rerank", type=int,
+        help="Compressed search candidates rescored with the float32 embeddings, 0 to disable.")
+
+    # Chunked embeddings
+    embed_chunks_parser = subparsers.add_parser(
+        "embed_chunks", help="Embed the movie descriptions chunk by chunk.")
+    embed_chunks_parser.add_argument(
+        "--max-chunk-size", type=int, default=chunking.DEFAULT_MAX_CHUNK_SIZE, help="Sentences per chunk.")
+    embed_chunks_parser.add_argument(
+        "--overlap", type=int, default=chunking.DEFAULT_OVERLAP, help="Sentences shared by consecutive chunks.")
+
+    search_chunked_parser = subparsers.add_parser(
+        "search_chunked", help="Semantic search scoring movies by their chunks.")
+    search_chunked_parser.add_argument(
+        "query", type=str, help="Query to search.")
+    search_chunked_parser.add_argument(
+        "--limit", type=int, default=5, help="Limits number of elements returned.")
+    search_chunked_parser.add_argument(
+        "--max-chunk-size", type=int, default=chunking.DEFAULT_MAX_CHUNK_SIZE, help="Sentences per chunk.")
+    search_chunked_parser.add_argument(
+        "--overlap", type=int, default=chunking.DEFAULT_OVERLAP, help="Sentences shared by consecutive chunks.")
+    search_chunked_parser.add_argument(
+        "--aggregate", choices=("max", "mean"), default="max",
+        help="Score a movie by its best chunk or by the mean of its top n chunks.")
+    search_chunked_parser.add_argument(
+        "--top-n", type=int, default=3, help="Chunks averaged by --aggregate mean.")
+
+    # Hybrid search
+    hybrid_parser = subparsers.add_parser(
+        "hybrid", help="Search with BM25 and semantic search together and fuse the rankings.")
+    hybrid_parser.add_argument(
+        "query", type=str, help="Query to search.")
+    hybrid_parser.add_argument(
+        "--limit", type=int, default=5, help="Limits number of elements returned.")
+    hybrid_parser.add_argument(
+        "--fusion", choices=("rrf", "weighted"), default="rrf",
+        help="Reciprocal rank fusion or a weighted sum of min-max normalized scores.")
+    hybrid_parser.add_argument(
+        "--alpha", type=float, default=0.5, help="Weight of the BM25 scores in weighted fusion.")
+    hybrid_parser.add_argument(
+        "--candidates", type=int, default=50, help="Results fetched from each branch before fusing.")
+    hybrid_parser.add_argument(
+        "--mode", choices=("exhaustive", "wand"), default="exhaustive", help="BM25 top-k strategy.")
+
+    # Serve
+    serve_parser = subparsers.add_parser(
+        "serve", help="Keep the indexes and model loaded and answer BM25, semantic and hybrid queries over HTTP.")
+    serve_parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address to listen on.")
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on.")
+    serve_parser.add_argument(
+        "--socket", type=str, help="Listen on this Unix socket instead of TCP.")
+    serve_parser.add_argument(
+        "--workers", type=int, help="BM25 worker processes and semantic search threads. Defaults to the CPU count.")
+    serve_parser.add_argument(
+        "--no-semantic", action="store_true", help="Only serve BM25 search, without loading the model.")
+    serve_parser.add_argument(
+        "--ann", action="store_true", help="Search the IVF index instead of every embedding.")
+    serve_parser.add_argument(
+        "--nprobe", type=int, help="IVF lists probed per query.")
+    serve_parser.add_argument(
+        "--compression", choices=("int8", "pq"), help="Search quantized embeddings.")
+    serve_parser.add_argument(
+        "--rerank", type=int,
+        help="Compressed search candidates rescored with the float32 embeddings, 0 to disable.")
+
+    # Batch
+    batch_parser = subparsers.add_parser(
+        "batch", help="Evaluate a JSONL file of queries against the embeddings loaded once, writing JSONL results.")
+    batch_parser.add_argument(
+        "queries", type=argparse.FileType('r'), nargs="?", default="-",
+        help="JSONL queries, strings or {\"id\", \"query\", \"limit\"} objects. Defaults to stdin.")
+    batch_parser.add_argument(
+        "--output", type=argparse.FileType('w'), default="-", help="Write the results here instead of stdout.")
+    batch_parser.add_argument(
+        "--limit", type=int, default=10, help="Results per query without its own limit.")
+    batch_parser.add_argument(
+        "--workers", type=int, default=1, help="Threads searching blocks of queries.")
+    batch_parser.add_argument(
+        "--ann", action="store_true", help="Search the IVF index instead of every embedding.")
+    batch_parser.add_argument(
+        "--nprobe", type=int, help="IVF lists probed per query.")
+    batch_parser.add_argument(
+        "--compression", choices=("int8", "pq"), help="Search quantized embeddings.")
+    batch_parser.add_argument(
+        "--rerank", type=int,
+        help="Compressed search candidates rescored with the float32 embeddings, 0 to disable.")
 
     # chunk
     chunk_parser = subparsers.add_parser(
         "chunk", help="Chunk the given text")
-    chunk_parser.add_argument("text", type=str, help="Text to chunk")
+    chunk_parser.add_argument("text", type=str, nargs="?", help="Text to chunk")
+    chunk_parser.add_argument("--file", type=str, help="Chunk this file instead, streamed")
     chunk_parser.add_argument("--chunk-size", type=int,
-                              default=200, help="Chunk size")
+                              default=chunking.DEFAULT_CHUNK_SIZE, help="Chunk size")
     chunk_parser.add_argument("--overlap", type=int,
-                              default=0, help="Overlap size")
+                              default=chunking.DEFAULT_OVERLAP, help="Overlap size")
 
     # semantic_chunk
     semantic_chunk_parser = subparsers.add_parser(
@@ -162,31 +305,68 @@ def main() -> None:
     # semantic_chunk_parser.add_argument(
     #     "--text", required=True, type=str, help="Text to chunk")
     semantic_chunk_parser.add_argument(
-        "text", type=str, help="Text to chunk")
+        "text", type=str, nargs="?", help="Text to chunk")
+    semantic_chunk_parser.add_argument(
+        "--file", type=str, help="Chunk this file instead, streamed")
     semantic_chunk_parser.add_argument("--max-chunk-size", type=int,
-                                       default=4, help="Chunk size")
+                                       default=chunking.DEFAULT_MAX_CHUNK_SIZE, help="Chunk size")
     # semantic_chunk_parser.add_argument("--overlap", type=int,
     #                                    default=1, help="Overlap size")
     semantic_chunk_parser.add_argument("--overlap", type=int,
-                                       default=0, help="Overlap size")
+                                       default=chunking.DEFAULT_OVERLAP, help="Overlap size")
 
     args = parser.parse_args()
 
+    # The chunkers need each chunk to move past the overlap
+    if args.command in ("chunk", "semantic_chunk", "embed_chunks", "search_chunked"):
+        chunk_size = args.chunk_size if args.command == "chunk" else args.max_chunk_size
+        if chunk_size < 1 or not 0 <= args.overlap < chunk_size:
+            parser.error("the chunk size must be at least 1 and the overlap less than it")
+    if args.command in ("chunk", "semantic_chunk") and (args.text is None) == (args.file is None):
+        parser.error("give either a text or --file")
+
     match args.command:
         case "verify":
-            semantic_search.verify_model()
+            _semantic_search().verify_model()
         case "embed_text":
-            semantic_search.embed_text(args.text)
+            _semantic_search().embed_text(args.text)
         case "verify_embeddings":
-            semantic_search.verify_embeddings()
+            _semantic_search().verify_embeddings()
         case "embedquery":
-            semantic_search.embed_query_text(args.query)
+            _semantic_search().embed_query_text(args.query)
         case "search":
-            handle_semantic_search(args.query, args.limit)
+            if args.ann and args.compression is not None:
+                parser.error("--ann and --compression can't be combined")
+            handle_semantic_search(args.query, args.limit, args.ann, args.nprobe,
+                                   args.compression, args.rerank)
+        case "embed_chunks":
+            handle_embed_chunks(args.max_chunk_size, args.overlap)
+        case "search_chunked":
+            if args.top_n < 1:
+                parser.error("--top-n must be at least 1")
+            handle_search_chunked(args.query, args.limit, args.max_chunk_size, args.overlap,
+                                  args.aggregate, args.top_n)
+        case "hybrid":
+            if not 0 <= args.alpha <= 1:
+                parser.error("--alpha must be between 0 and 1")
+            handle_hybrid_search(args.query, args.limit, args.fusion, args.alpha,
+                                 args.candidates, args.mode)
+        case "serve":
+            if args.ann and args.compression is not None:
+                parser.error("--ann and --compression can't be combined")
+            handle_serve(args.host, args.port, args.socket, args.workers, not args.no_semantic,
+                         args.ann, args.nprobe, args.compression, args.rerank)
+        case "batch":
+            if args.ann and args.compression is not None:
+                parser.error("--ann and --compression can't be combined")
+            if args.limit < 1:
+                parser.error("--limit must be at least 1")
+            handle_batch(args.queries, args.output, args.limit, args.workers,
+                         args.ann, args.nprobe, args.compression, args.rerank)
         case "chunk":
-            handle_chunk(args.text, args.chunk_size, args.overlap)
+            handle_chunk(args.text, args.chunk_size, args.overlap, args.file)
         case "semantic_chunk":
-            handle_semantic_chunk(args.text, args.max_chunk_size, args.overlap)
+            handle_semantic_chunk(args.text, args.max_chunk_size, args.overlap, args.file)
         case _:
             parser.print_help()
 